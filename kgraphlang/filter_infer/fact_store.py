@@ -0,0 +1,282 @@
+import csv
+import json
+import mmap
+import struct
+import numbers
+import numpy as np
+
+# Binary fact files: the rows of a predicate stored column by column, so
+# they can be opened with mmap and used in place, without parsing or
+# copying. Processes that open the same file share its pages through the
+# page cache.
+#
+# Layout, little-endian:
+#   prelude: magic, format version, offset and length of the JSON header
+#   sections: arrays, each aligned to 8 bytes
+#     - the string dictionary: the distinct strings of every string column,
+#       sorted, as UTF-8 bytes and the offset of each one
+#     - one array per column: int64, float64, or uint32 string codes
+#     - for each string column, an index: its row numbers sorted by code,
+#       and the offset in those of the rows of each code
+#   header: JSON describing the columns and where their sections are
+
+FACT_FILE_MAGIC = b"KGFACTS\x00"
+FACT_FILE_VERSION = 1
+
+_PRELUDE = struct.Struct("<8sIIQQ")
+
+STRING_COLUMN = "string"
+INT_COLUMN = "int"
+FLOAT_COLUMN = "float"
+
+_COLUMN_DTYPES = {STRING_COLUMN: "<u4", INT_COLUMN: "<i8", FLOAT_COLUMN: "<f8"}
+
+
+def _column_encoding(values: list) -> str:
+    if all(type(v) is str for v in values):
+        return STRING_COLUMN
+    if all(type(v) is int for v in values):
+        return INT_COLUMN
+    if all(type(v) in (int, float) for v in values):
+        return FLOAT_COLUMN
+    raise ValueError("Fact file columns must hold only strings, only ints or only numbers")
+
+
+class _SectionWriter:
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, array: np.ndarray, dtype: str) -> dict:
+        position = self.f.tell()
+        padding = -position % 8
+        self.f.write(b"\x00" * padding)
+        array = np.ascontiguousarray(array, dtype=dtype)
+        self.f.write(array.tobytes())
+        return {"offset": position + padding, "dtype": dtype, "count": len(array)}
+
+
+def write_fact_file(path: str, rows, names: list = None):
+    """
+    Write the rows (tuples of strings, ints or floats, one per fact) to a
+    fact file. names are the names of the columns, if given.
+    """
+    rows = list(rows)
+    arity = len(names) if names is not None else (len(rows[0]) if rows else 0)
+    columns = [[row[i] for row in rows] for i in range(arity)]
+    encodings = [_column_encoding(values) for values in columns]
+
+    strings = sorted({v for values, encoding in zip(columns, encodings) if encoding == STRING_COLUMN
+                      for v in values}, key=lambda s: s.encode("utf-8"))
+    encoded = [s.encode("utf-8") for s in strings]
+    code_of = {s: code for code, s in enumerate(strings)}
+    string_offsets = np.zeros(len(encoded) + 1, dtype=np.uint64)
+    np.cumsum([len(b) for b in encoded], out=string_offsets[1:])
+
+    with open(path, "wb") as f:
+        f.write(b"\x00" * _PRELUDE.size)
+        sections = _SectionWriter(f)
+        header = {
+            "num_rows": len(rows),
+            "strings": {
+                "offsets": sections.write(string_offsets, "<u8"),
+                "blob": sections.write(np.frombuffer(b"".join(encoded), dtype=np.uint8), "<u1"),
+            },
+            "columns": [],
+        }
+        for i, (values, encoding) in enumerate(zip(columns, encodings)):
+            column = {"name": names[i] if names is not None else str(i), "encoding": encoding}
+            if encoding == STRING_COLUMN:
+                codes = np.array([code_of[v] for v in values], dtype=np.uint32)
+                column["data"] = sections.write(codes, _COLUMN_DTYPES[encoding])
+                order = np.argsort(codes, kind="stable")
+                counts = np.bincount(codes, minlength=len(strings))
+                offsets = np.zeros(len(strings) + 1, dtype=np.uint64)
+                np.cumsum(counts, out=offsets[1:])
+                column["index"] = {"rows": sections.write(order, "<u4"),
+                                   "offsets": sections.write(offsets, "<u8")}
+            else:
+                column["data"] = sections.write(np.array(values), _COLUMN_DTYPES[encoding])
+            header["columns"].append(column)
+
+        header_bytes = json.dumps(header).encode("utf-8")
+        header_offset = f.tell()
+        f.write(header_bytes)
+        f.seek(0)
+        f.write(_PRELUDE.pack(FACT_FILE_MAGIC, FACT_FILE_VERSION, 0, header_offset, len(header_bytes)))
+
+
+class FactStore:
+    """
+    A fact file opened with mmap. Opening it only reads the header: the
+    columns, string dictionary and indexes are NumPy arrays over the mapped
+    file, read from the page cache as they are used.
+
+    A FactStore can be pickled, e.g. to pass it to worker processes, which
+    then map the same file.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "rb")
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+
+        magic, version, _, header_offset, header_length = _PRELUDE.unpack_from(self._mmap, 0)
+        if magic != FACT_FILE_MAGIC:
+            raise ValueError(f"Not a fact file: {path}")
+        if version != FACT_FILE_VERSION:
+            raise ValueError(f"Unsupported fact file version {version}: {path}")
+        header = json.loads(self._mmap[header_offset:header_offset + header_length])
+
+        self.num_rows = header["num_rows"]
+        self._string_offsets = self._array(header["strings"]["offsets"])
+        self._string_blob = header["strings"]["blob"]["offset"]
+        self.names = [column["name"] for column in header["columns"]]
+        self.encodings = [column["encoding"] for column in header["columns"]]
+        self.columns = [self._array(column["data"]) for column in header["columns"]]
+        self._indexes = [(self._array(column["index"]["rows"]), self._array(column["index"]["offsets"]))
+                         if "index" in column else None for column in header["columns"]]
+
+    def _array(self, section: dict) -> np.ndarray:
+        return np.frombuffer(self._mmap, dtype=section["dtype"], count=section["count"], offset=section["offset"])
+
+    def get_arity(self) -> int:
+        return len(self.columns)
+
+    def num_strings(self) -> int:
+        return len(self._string_offsets) - 1
+
+    def string_value(self, code: int) -> str:
+        start = self._string_blob + int(self._string_offsets[code])
+        end = self._string_blob + int(self._string_offsets[code + 1])
+        return self._mmap[start:end].decode("utf-8")
+
+    def string_code(self, value: str):
+        """
+        Return the code of a string, found by binary search over the sorted
+        dictionary, or None if no column holds it.
+        """
+        key = value.encode("utf-8")
+        low, high = 0, self.num_strings()
+        while low < high:
+            mid = (low + high) // 2
+            start = self._string_blob + int(self._string_offsets[mid])
+            end = self._string_blob + int(self._string_offsets[mid + 1])
+            if self._mmap[start:end] < key:
+                low = mid + 1
+            else:
+                high = mid
+        if low < self.num_strings() and self.string_value(low) == value:
+            return low
+        return None
+
+    def select(self, input_dict: dict, unbound) -> np.ndarray:
+        """
+        Return the numbers of the rows matching the bound inputs (those that
+        are not the unbound marker), in order.
+        """
+        candidates = None
+        # (column, code or number) of each bound column, checked on the candidates
+        checks = []
+        for i, encoding in enumerate(self.encodings):
+            value = input_dict.get(i, unbound)
+            if value is unbound:
+                continue
+            if encoding != STRING_COLUMN:
+                if not isinstance(value, numbers.Real):
+                    return np.empty(0, dtype=np.intp)
+                checks.append((i, value))
+                continue
+            code = self.string_code(value) if type(value) is str else None
+            if code is None:
+                return np.empty(0, dtype=np.intp)
+            index_rows, offsets = self._indexes[i]
+            rows = index_rows[int(offsets[code]):int(offsets[code + 1])]
+            # the rows of the most selective string index are the candidates
+            if candidates is None or len(rows) < len(candidates):
+                candidates = rows
+            checks.append((i, code))
+
+        if candidates is None:
+            selected = np.arange(self.num_rows)
+        else:
+            # the index holds the rows of each code in order
+            selected = candidates.astype(np.intp)
+        for i, value in checks:
+            if len(selected) == 0:
+                break
+            selected = selected[self.columns[i][selected] == value]
+        return selected
+
+    def column_values(self, i: int, rows: np.ndarray) -> list:
+        """
+        Return the values of column i in the given rows, as Python values.
+        """
+        values = self.columns[i][rows]
+        if self.encodings[i] != STRING_COLUMN:
+            return values.tolist()
+        decoded = {}
+        result = []
+        for code in values.tolist():
+            value = decoded.get(code)
+            if value is None:
+                value = decoded[code] = self.string_value(code)
+            result.append(value)
+        return result
+
+    def close(self):
+        self.columns = []
+        self._indexes = []
+        self._string_offsets = None
+        self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def __getstate__(self):
+        return {"path": self.path}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"])
+
+
+def convert_csv(csv_path: str, fact_path: str, columns: list, types: dict = None):
+    """
+    Convert the given columns of a CSV file with a header row to a fact
+    file. types maps column names to int or float, other columns are
+    strings.
+    """
+    types = types or {}
+    rows = []
+    with open(csv_path, "r", encoding="utf-8", newline="") as f:
+        for record in csv.DictReader(f):
+            rows.append(tuple(types.get(name, str)(record[name].strip()) for name in columns))
+    write_fact_file(fact_path, rows, names=columns)
+
+
+def convert_extract_jsonl(jsonl_path: str, relation_path: str, property_path: str):
+    """
+    Convert the JSONL written by test/extract_data.py to two fact files:
+    relations (source, type, destination) from the relationship records,
+    and entity properties (id, property, value) from the entity records,
+    with one row per item of a list valued property.
+    """
+    relations = []
+    properties = []
+    with open(jsonl_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            if record.get("kind") == "relationship":
+                relations.append((record["source"], record["type"], record["destination"]))
+            elif record.get("kind") == "entity":
+                for name, value in record.get("properties", {}).items():
+                    for item in (value if isinstance(value, list) else [value]):
+                        if item is not None:
+                            properties.append((record["id"], name, str(item)))
+    write_fact_file(relation_path, relations, names=["source", "type", "destination"])
+    write_fact_file(property_path, properties, names=["id", "property", "value"])
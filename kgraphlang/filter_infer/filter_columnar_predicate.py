@@ -0,0 +1,181 @@
+import numbers
+import logging
+from abc import ABC
+import numpy as np
+from kgraphlang.kgraph_infer import UNBOUND
+from kgraphlang.predicate.kgraph_predicate import KGraphPredicate
+
+# column encodings
+INT_COLUMN = "int"
+FLOAT_COLUMN = "float"
+DICTIONARY_COLUMN = "dictionary"
+OBJECT_COLUMN = "object"
+
+
+def _object_array(values: list) -> np.ndarray:
+    # np.array() would turn a list of tuples into a 2d array
+    array = np.empty(len(values), dtype=object)
+    for i, value in enumerate(values):
+        array[i] = value
+    return array
+
+
+def _code_dtype(size: int):
+    if size <= np.iinfo(np.uint8).max:
+        return np.uint8
+    if size <= np.iinfo(np.uint16).max:
+        return np.uint16
+    return np.uint32
+
+
+class Column:
+    """
+    One argument position of a FilterColumnarPredicate.
+
+    Columns of ints (or of floats) are stored as int64 (or float64) arrays.
+    Other hashable values, such as strings and typed literals, are
+    dictionary encoded: each distinct value is stored once and the column
+    holds the code of the value of each row. Unhashable values, such as
+    maps, are kept in an object array.
+    """
+    def __init__(self, values: list):
+        self.values = None
+        self.codes_of = None
+        self.encoding = OBJECT_COLUMN
+        if values and all(type(v) is int for v in values):
+            try:
+                self.array = np.array(values, dtype=np.int64)
+                self.encoding = INT_COLUMN
+                return
+            except OverflowError:
+                pass
+        elif values and all(type(v) is float for v in values):
+            self.array = np.array(values, dtype=np.float64)
+            self.encoding = FLOAT_COLUMN
+            return
+        try:
+            self._encode(values)
+            self.encoding = DICTIONARY_COLUMN
+        except TypeError:
+            self.array = _object_array(values)
+
+    def _encode(self, values: list):
+        # distinct values are told apart by type, so 1 and True are both kept,
+        # but a bound value matches every code of a value equal to it, as in a scan
+        code_of = {}
+        codes = []
+        for value in values:
+            key = (type(value), value)
+            code = code_of.get(key)
+            if code is None:
+                code = code_of[key] = len(code_of)
+            codes.append(code)
+        distinct = [value for _, value in code_of]
+        codes_of = {}
+        for code, value in enumerate(distinct):
+            codes_of.setdefault(value, []).append(code)
+        self.values = _object_array(distinct)
+        self.codes_of = codes_of
+        self.array = np.array(codes, dtype=_code_dtype(len(distinct)))
+
+    def match(self, value) -> np.ndarray:
+        """
+        Return the boolean mask of the rows equal to the value, or None when
+        no row can be.
+        """
+        if self.encoding == DICTIONARY_COLUMN:
+            try:
+                codes = self.codes_of.get(value)
+            except TypeError:
+                return None
+            if codes is None:
+                return None
+            if len(codes) == 1:
+                return self.array == codes[0]
+            return np.isin(self.array, codes)
+        if self.encoding in (INT_COLUMN, FLOAT_COLUMN):
+            if not isinstance(value, numbers.Real):
+                return None
+            return self.array == value
+        return np.fromiter((v == value for v in self.array), dtype=bool, count=len(self.array))
+
+    def take(self, rows) -> np.ndarray:
+        """
+        Return the values of the rows, as an int64 or float64 array, or an
+        object array of the decoded values.
+        """
+        if self.encoding == DICTIONARY_COLUMN:
+            return self.values[self.array[rows]]
+        return self.array[rows]
+
+    def nbytes(self) -> int:
+        size = self.array.nbytes
+        if self.values is not None:
+            size += self.values.nbytes
+        return size
+
+
+class FilterColumnarPredicate(KGraphPredicate, ABC):
+    """
+    A FilterPredicate over a fixed candidate set stored column by column in
+    NumPy arrays, see Column, rather than as a list of tuples.
+
+    Bound arguments become vectorized equality masks over their columns,
+    and the matching rows are taken from each column as array slices.
+    Answers are the same, in the same order, as those of FilterPredicate
+    over the same data.
+    """
+
+    def __init__(self, *, data: list[tuple]):
+        super().__init__()
+        self.num_rows = len(data)
+        arity = len(data[0]) if data else 0
+        self.columns = [Column([row[i] for row in data]) for i in range(arity)]
+
+    def get_arity(self) -> int:
+        return len(self.columns)
+
+    def get_annotation_ids(self) -> list:
+        return []
+
+    def select(self, input_dict: dict) -> np.ndarray:
+        """
+        Return the numbers of the rows matching the bound inputs, in order.
+        """
+        mask = None
+        for i, column in enumerate(self.columns):
+            value = input_dict.get(i, UNBOUND)
+            if value is UNBOUND:
+                continue
+            column_mask = column.match(value)
+            if column_mask is None:
+                return np.empty(0, dtype=np.intp)
+            mask = column_mask if mask is None else mask & column_mask
+        if mask is None:
+            return np.arange(self.num_rows)
+        return np.flatnonzero(mask)
+
+    def eval_columns(self, input_dict: dict) -> dict:
+        """
+        Return the matching rows as a dictionary of argument position to
+        the array of their values.
+        """
+        rows = self.select(input_dict)
+        return {i: column.take(rows) for i, column in enumerate(self.columns)}
+
+    def eval_impl(self, *, input_dict: dict, annotations: list = None) -> list:
+
+        if annotations is not None and len(annotations) > 0:
+            logging.debug(f"Annotations: {annotations}")
+
+        columns = self.eval_columns(input_dict)
+        # tolist() converts the numpy scalars back to Python values
+        values = [columns[i].tolist() for i in range(len(self.columns))]
+        return [dict(enumerate(row)) for row in zip(*values)]
+
+    def memory_bytes(self) -> int:
+        """
+        Return the memory held by the column arrays and dictionaries, not
+        counting the distinct values themselves.
+        """
+        return sum(column.nbytes() for column in self.columns)
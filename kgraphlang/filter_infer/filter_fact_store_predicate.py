@@ -0,0 +1,40 @@
+import logging
+from abc import ABC
+from kgraphlang.kgraph_infer import UNBOUND
+from kgraphlang.predicate.kgraph_predicate import KGraphPredicate
+from kgraphlang.filter_infer.fact_store import FactStore
+
+
+class FilterFactStorePredicate(KGraphPredicate, ABC):
+    """
+    A FilterPredicate over the facts of a fact file (see fact_store), which
+    is memory-mapped rather than loaded: startup does not depend on the
+    number of facts, and processes using the same file share its memory.
+
+    Bound string arguments are looked up in the prebuilt index of their
+    column, the rows of the most selective one are then checked against the
+    other bound arguments.
+    """
+
+    def __init__(self, *, path: str = None, store: FactStore = None):
+        super().__init__()
+        if store is None:
+            if path is None:
+                raise ValueError("A fact file path or store is required")
+            store = FactStore(path)
+        self.store = store
+
+    def get_arity(self) -> int:
+        return self.store.get_arity()
+
+    def get_annotation_ids(self) -> list:
+        return []
+
+    def eval_impl(self, *, input_dict: dict, annotations: list = None) -> list:
+
+        if annotations is not None and len(annotations) > 0:
+            logging.debug(f"Annotations: {annotations}")
+
+        rows = self.store.select(input_dict, UNBOUND)
+        values = [self.store.column_values(i, rows) for i in range(self.store.get_arity())]
+        return [dict(enumerate(row)) for row in zip(*values)]
@@ -0,0 +1,175 @@
+import math
+import logging
+from abc import ABC
+import numpy as np
+from kgraphlang.kgraph_infer import UNBOUND
+from kgraphlang.predicate.kgraph_predicate import KGraphPredicate
+from kgraphlang.planner.query_analysis import DEFAULT_MODE_COST
+from kgraphlang.filter_infer.filter_string_hash_predicate import rescore_candidates
+
+NGRAM_SIZE = 3
+
+# fraction of the n-grams of the query a candidate must share
+DEFAULT_MIN_OVERLAP = 0.5
+
+
+def get_ngrams(name: str, n: int = NGRAM_SIZE) -> set:
+    """
+    Return the character n-grams of a name, lower cased, with each word
+    padded so that short words and word boundaries have n-grams too:
+    'Fred' has '  f', ' fr', 'fre', 'red' and 'ed '.
+    """
+    grams = set()
+    for word in name.lower().split():
+        padded = " " * (n - 1) + word + " "
+        for i in range(len(padded) - n + 1):
+            grams.add(padded[i:i + n])
+    return grams
+
+
+class NGramIndex:
+    """
+    An inverted index from the character n-grams of names to the sorted
+    array of the numbers of the names that contain them.
+    """
+    def __init__(self, names: list, n: int = NGRAM_SIZE):
+        self.n = n
+        postings = {}
+        for number, name in enumerate(names):
+            for gram in get_ngrams(name, n):
+                postings.setdefault(gram, []).append(number)
+        self.postings = {gram: np.array(numbers, dtype=np.int32) for gram, numbers in postings.items()}
+        self.size = len(names)
+
+    def candidates(self, query: str, min_overlap: float = DEFAULT_MIN_OVERLAP, min_results: int = 0,
+                   max_candidates: int = None):
+        """
+        Return the numbers of the names sharing at least min_overlap of the
+        n-grams of the query (all of them, with 1.0, is the intersection of
+        their posting lists), most shared n-grams first, then by number.
+
+        When fewer than min_results names share that many, the required
+        overlap is lowered until min_results names, or all the names
+        sharing any n-gram, are returned.
+        """
+        grams = get_ngrams(query, self.n)
+        lists = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not lists:
+            return np.empty(0, dtype=np.int32)
+        counts = np.bincount(np.concatenate(lists), minlength=self.size)
+        required = max(1, math.ceil(len(grams) * min_overlap))
+        numbers = np.flatnonzero(counts >= required)
+        if len(numbers) < min_results:
+            # the count of the min_results-th best name, or 1
+            shared = np.flatnonzero(counts)
+            if len(shared) > min_results:
+                required = max(1, np.partition(counts[shared], -min_results)[-min_results])
+            else:
+                required = 1
+            numbers = np.flatnonzero(counts >= required)
+        # stable, so names with the same count stay in order
+        numbers = numbers[np.argsort(-counts[numbers], kind="stable")]
+        if max_candidates is not None:
+            numbers = numbers[:max_candidates]
+        return numbers
+
+
+class FilterNGramPredicate(KGraphPredicate, ABC):
+
+    # the same interface as FilterStringHashPredicate, with candidates
+    # found in a character n-gram inverted index instead of an LSH index
+
+    # the input data is arity 2:
+    # id, string value to index
+
+    # the predicate is arity 3:
+    # query string
+    # matching id
+    # matching score
+
+    # optional annotations:
+    # top_k
+    # min_score
+
+    def __init__(self, *, data: list[tuple], n: int = NGRAM_SIZE,
+                 min_overlap: float = DEFAULT_MIN_OVERLAP, max_candidates: int = None):
+        super().__init__()
+        self.data = data
+
+        ids_to_names = {}
+        for id, name in data:
+            ids_to_names[str(id)] = name
+
+        self.ids_to_names = ids_to_names
+        self.ids = list(ids_to_names)
+        self.min_overlap = min_overlap
+        self.max_candidates = max_candidates
+        self.index = NGramIndex(list(ids_to_names.values()), n)
+        logging.info(f"Indexed {len(ids_to_names)} strings, {len(self.index.postings)} {n}-grams")
+
+        # the query string must be bound, the engine orders the conjuncts so it is,
+        # and a bound match id is cheaper, it is scored without the index
+        self.register_mode("bff")
+        self.register_mode("bbf", cost=DEFAULT_MODE_COST / 10)
+
+    def get_arity(self) -> int:
+        return 3
+
+    # highest score is best
+    def get_annotation_ids(self) -> list:
+        return ["top_k", "min_score"]
+
+    # a bound match id is scored, not searched for, so filtering the
+    # results of a search is not the same as binding it
+    def supports_group_by(self) -> bool:
+        return False
+
+    def find_closest_strings(self, query_string, top_k=10, min_score=0):
+        """
+        Return the top_k (id, name, score) matches of the query string
+        with a score of at least min_score, scored as by the LSH backend.
+        """
+        numbers = self.index.candidates(query_string, self.min_overlap, top_k, self.max_candidates)
+        candidate_ids = [self.ids[number] for number in numbers.tolist()]
+        return rescore_candidates(query_string, candidate_ids, self.ids_to_names, top_k=top_k, min_score=min_score)
+
+    def eval_impl(self, *, input_dict: dict, annotations: list = None) -> list:
+
+        results = []
+
+        logging.debug(f"N-gram call: {input_dict}")
+
+        query = input_dict.get(0)
+        match_id = input_dict.get(1, UNBOUND)
+
+        top_k = 10
+        min_score = 0
+
+        # Extract annotation values if provided
+        if annotations:
+            for ann in annotations:
+                # Each annotation is expected to be in the form: (name, [arg1, ...])
+                if ann[0] == "top_k" and ann[1]:
+                    try:
+                        top_k = int(ann[1][0])
+                    except Exception as e:
+                        logging.warning(f"Invalid top_k annotation: {ann[1]}")
+                elif ann[0] == "min_score" and ann[1]:
+                    try:
+                        min_score = float(ann[1][0])
+                    except Exception as e:
+                        logging.warning(f"Invalid min_score annotation: {ann[1]}")
+
+        if match_id is not UNBOUND:
+            # score the name of the bound id, the engine checks a bound score
+            if str(match_id) not in self.ids_to_names:
+                return results
+            matches = rescore_candidates(query, [str(match_id)], self.ids_to_names, top_k=top_k, min_score=min_score)
+        else:
+            matches = self.find_closest_strings(query, top_k=top_k, min_score=min_score)
+
+        for rid, match, score in matches:
+            logging.debug(f"Match: {match} (id={rid}) Score: {score:.4f}")
+            results.append({0: query, 1: rid if match_id is UNBOUND else match_id, 2: round(float(score), 4)})
+
+        return results
@@ -1,3 +1,6 @@
+import sys
+import time
+import bisect
 from abc import ABC, abstractmethod
 from kgraphlang.kgraph_infer import UNBOUND
 from kgraphlang.predicate.kgraph_predicate import KGraphPredicate
@@ -9,11 +12,40 @@ class FilterPredicate(KGraphPredicate, ABC):
     defined when the predicate is constructed.
     The eval_impl() method provided here filters the candidate tuples based on the
     provided input dictionary.
+
+    Calls with bound arguments are answered from hash indexes, built lazily
+    the first time an argument position (or a combination of positions, once
+    it has been used composite_index_after times) is bound in a call. Each
+    call looks up the most selective of the available indexes and only checks
+    the rows it returns. Data with fewer than index_min_rows rows is scanned.
+
+    Range constraints on free arguments (see KGraphPredicate.accepts_constraints)
+    are answered from a sorted index of the numbers of the column, built
+    lazily as well, when the range holds fewer rows than the hash indexes
+    return. Values that are not numbers are not constrained, the engine's
+    comparison decides about them.
+
+    The indexes assume the data does not change, call clear_indexes() after
+    changing it.
     """
 
+    # smaller data is scanned
+    index_min_rows = 32
+
+    # calls with the same combination of bound positions before it gets a composite index
+    composite_index_after = 2
+
     def __init__(self, *, data: list[tuple]):
         super().__init__()
         self.data = data
+        # positions tuple -> {key tuple: [row numbers]}
+        self._indexes = {}
+        # positions tuple -> {"build_ms", "keys", "bytes", "lookups"}
+        self._index_stats = {}
+        # positions tuple -> number of calls with those positions bound
+        self._bound_position_counts = {}
+        # position -> (sorted numbers, their row numbers, rows of other values)
+        self._sorted_indexes = {}
 
     def get_arity(self) -> int:
         return len(self.data[0])
@@ -21,22 +53,181 @@ class FilterPredicate(KGraphPredicate, ABC):
     def get_annotation_ids(self) -> list:
         return []
 
-    def eval_impl(self, *, input_dict: dict, annotations: list = None) -> list:
+    def accepts_constraints(self) -> bool:
+        return True
+
+    def eval_impl(self, *, input_dict: dict, annotations: list = None, constraints: list = None) -> list:
 
         if annotations is not None and len(annotations) > 0:
             print(f"Annotations: {annotations}")
 
         results = []
 
-        for candidate in self.data:
+        rows = self.candidate_rows(input_dict)
+        if constraints:
+            rows = self._constrained_rows(rows, constraints)
+
+        for row in rows:
+            candidate = self.data[row]
             consistent = True
             for i, val in enumerate(candidate):
                 # If the input value is bound, candidate value must match.
                 if input_dict.get(i) is not UNBOUND and input_dict.get(i) != val:
                     consistent = False
                     break
+            if consistent and constraints:
+                consistent = all(_satisfies(candidate[i], op, value) for i, op, value in constraints)
             if consistent:
                 # Return a dictionary mapping each parameter index to its candidate value.
                 results.append({i: candidate[i] for i in range(len(candidate))})
         return results
 
+    def candidate_rows(self, input_dict: dict):
+        """
+        Return the numbers of the rows that may match the bound inputs, in
+        data order: every row that matches is included, the rows must still
+        be checked against every bound input.
+        """
+        bound = tuple(i for i in sorted(input_dict) if input_dict[i] is not UNBOUND)
+        if not bound or len(self.data) < self.index_min_rows:
+            return range(len(self.data))
+        try:
+            for i in bound:
+                hash(input_dict[i])
+        except TypeError:
+            # e.g. a list value, which no index can hold
+            return range(len(self.data))
+
+        choices = [(i,) for i in bound]
+        if len(bound) > 1:
+            count = self._bound_position_counts.get(bound, 0) + 1
+            self._bound_position_counts[bound] = count
+            if count >= self.composite_index_after:
+                choices.append(bound)
+
+        # the most selective index is the one with the fewest rows for the inputs
+        best = None
+        for positions in choices:
+            index = self._get_index(positions)
+            if index is None:
+                continue
+            rows = index.get(tuple(input_dict[i] for i in positions), ())
+            if best is None or len(rows) < len(best[1]):
+                best = (positions, rows)
+        if best is None:
+            return range(len(self.data))
+        self._index_stats[best[0]]["lookups"] += 1
+        return best[1]
+
+    def _constrained_rows(self, rows, constraints: list):
+        # the rows in the range of the most selective constrained column, if fewer than the rows given
+        if len(self.data) < self.index_min_rows:
+            return rows
+        by_position = {}
+        for i, op, value in constraints:
+            by_position.setdefault(i, []).append((op, value))
+        best = None
+        for i, column_constraints in by_position.items():
+            keys, key_rows, other_rows = self._get_sorted_index(i)
+            low, high = 0, len(keys)
+            for op, value in column_constraints:
+                if op == ">":
+                    low = max(low, bisect.bisect_right(keys, value))
+                elif op == ">=":
+                    low = max(low, bisect.bisect_left(keys, value))
+                elif op == "<":
+                    high = min(high, bisect.bisect_left(keys, value))
+                elif op == "<=":
+                    high = min(high, bisect.bisect_right(keys, value))
+            size = max(high - low, 0) + len(other_rows)
+            if best is None or size < best[0]:
+                best = (size, i, low, high)
+        if best[0] >= len(rows):
+            return rows
+        size, i, low, high = best
+        keys, key_rows, other_rows = self._get_sorted_index(i)
+        self._index_stats[("sorted", i)]["lookups"] += 1
+        # back to data order
+        return sorted(key_rows[low:high] + other_rows)
+
+    def _get_sorted_index(self, position: int):
+        index = self._sorted_indexes.get(position)
+        if index is None:
+            start = time.perf_counter()
+            numbers = []
+            other_rows = []
+            for row, candidate in enumerate(self.data):
+                value = candidate[position]
+                # NaN is not ordered, and bools are not constrained
+                if type(value) in (int, float) and value == value:
+                    numbers.append((value, row))
+                else:
+                    other_rows.append(row)
+            numbers.sort()
+            index = ([value for value, _ in numbers], [row for _, row in numbers], other_rows)
+            self._sorted_indexes[position] = index
+            self._index_stats[("sorted", position)] = {
+                "build_ms": (time.perf_counter() - start) * 1000.0,
+                "keys": len(numbers),
+                "bytes": sum(sys.getsizeof(part) for part in index),
+                "lookups": 0,
+            }
+        return index
+
+    def _get_index(self, positions: tuple):
+        # the index of the positions, or None if their values can not be indexed
+        if positions in self._indexes:
+            return self._indexes[positions]
+        start = time.perf_counter()
+        index = {}
+        try:
+            for row, candidate in enumerate(self.data):
+                key = tuple(candidate[i] for i in positions)
+                rows = index.get(key)
+                if rows is None:
+                    index[key] = [row]
+                else:
+                    rows.append(row)
+        except TypeError:
+            # e.g. a map value
+            self._indexes[positions] = None
+            return None
+        build_ms = (time.perf_counter() - start) * 1000.0
+        self._indexes[positions] = index
+        self._index_stats[positions] = {
+            "build_ms": build_ms,
+            "keys": len(index),
+            # the dictionary, its keys and the row lists, not the values shared with the data
+            "bytes": sys.getsizeof(index) + sum(sys.getsizeof(key) + sys.getsizeof(rows)
+                                                for key, rows in index.items()),
+            "lookups": 0,
+        }
+        return index
+
+    def get_index_stats(self) -> dict:
+        """
+        Return the stats of the indexes built so far, by the tuple of the
+        argument positions they index, or ("sorted", position) for sorted
+        indexes: build time in milliseconds, number of distinct keys (or
+        numbers), approximate memory in bytes and number of lookups.
+        """
+        return {positions: dict(stats) for positions, stats in self._index_stats.items()}
+
+    def clear_indexes(self):
+        self._sorted_indexes = {}
+        self._indexes = {}
+        self._index_stats = {}
+        self._bound_position_counts = {}
+
+
+def _satisfies(value, op: str, bound) -> bool:
+    # values that are not numbers are left to the engine's comparison
+    if type(value) not in (int, float):
+        return True
+    if op == ">":
+        return value > bound
+    if op == ">=":
+        return value >= bound
+    if op == "<":
+        return value < bound
+    return value <= bound
@@ -1,45 +1,87 @@
+import pickle
+import logging
 from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 from kgraphlang.kgraph_infer import UNBOUND
 from kgraphlang.predicate.kgraph_predicate import KGraphPredicate
-from datasketch import MinHash, MinHashLSH
+from kgraphlang.filter_infer.read_write_lock import ReadWriteLock
+from kgraphlang.filter_infer.vector_index import replace_file
+from datasketch import MinHash, MinHashLSH, LeanMinHash
 from datasketch import MinHashLSHForest
-from rapidfuzz import fuzz
+from rapidfuzz import fuzz, process
 
-def get_minhash(name):
-    m = MinHash(num_perm=128)
+MINHASH_NUM_PERM = 128
+LSH_THRESHOLD = 0.1
+
+# version of the files written by FilterStringHashPredicate.save()
+STRING_HASH_INDEX_VERSION = 1
+
+def get_minhash(name, num_perm=MINHASH_NUM_PERM):
+    m = MinHash(num_perm=num_perm)
     for token in name:
         m.update(token.encode('utf8'))
     return m
 
-def find_closest_strings(query_string, index, ids_to_names, top_k=10, min_score=0):
+def get_minhashes(names: list, num_perm=MINHASH_NUM_PERM) -> list:
     """
-    Given a query string, return the top_k closest matches whose fuzzy similarity
-    is at least min_score.
+    Return the MinHash of each name, the same as get_minhash() but
+    computed a batch at a time, as compact LeanMinHash objects.
     """
-    query_hash = get_minhash(query_string)
-    result_ids = index.query(query_hash)
-    scored_results = []
-
-    for rid in result_ids:
-        name = ids_to_names[str(rid)]
-
-        # different scoring options
-        # this one should be good for personal name partial matches
-        # similarity_score = fuzz.WRatio(name, query_string)
-
-        # this is more for partial substring matches
-        similarity_score = fuzz.partial_ratio(name, query_string)
+    minhashes = MinHash.bulk([[token.encode('utf8') for token in name] for name in names], num_perm=num_perm)
+    return [LeanMinHash(m) for m in minhashes]
 
+def build_lsh_index(names: list, keys: list, *, workers: int = 1, batch_size: int = 10000,
+                    num_perm=MINHASH_NUM_PERM, threshold=LSH_THRESHOLD) -> MinHashLSH:
+    """
+    Build a MinHashLSH index of the names under the given keys. The MinHashes
+    are computed in batches, in a pool of worker processes if workers > 1,
+    and inserted with an insertion session.
+    """
+    lsh_index = MinHashLSH(threshold=threshold, num_perm=num_perm)
+    batches = [names[i:i + batch_size] for i in range(0, len(names), batch_size)]
+
+    if workers > 1 and len(batches) > 1:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            minhash_batches = list(pool.map(get_minhashes, batches, [num_perm] * len(batches)))
+    else:
+        minhash_batches = [get_minhashes(batch, num_perm) for batch in batches]
+
+    with lsh_index.insertion_session() as session:
+        minhashes = (minhash for batch in minhash_batches for minhash in batch)
+        for key, minhash in zip(keys, minhashes):
+            session.insert(key, minhash)
+    return lsh_index
+
+def rescore_candidates(query_string, candidate_ids, ids_to_names, top_k=10, min_score=0):
+    """
+    Score the names of the candidate ids against the query string and
+    return the top_k (id, name, score) with a score of at least min_score,
+    best first, candidates with equal scores in the order given.
 
-        scored_results.append((rid, name, similarity_score))
+    The scores are computed by rapidfuzz in one batch, skipping the
+    candidates below min_score, and only the top_k are kept.
+    """
+    if top_k <= 0:
+        return []
+    candidate_ids = list(candidate_ids)
+    choices = [ids_to_names[str(rid)] for rid in candidate_ids]
 
-    scored_results.sort(key=lambda x: x[2], reverse=True)
+    # different scoring options
+    # fuzz.WRatio should be good for personal name partial matches
+    # fuzz.partial_ratio is more for partial substring matches
+    matches = process.extract(query_string, choices, scorer=fuzz.partial_ratio,
+                              limit=top_k, score_cutoff=min_score or None)
 
-    # Optionally filter results below min_score
-    if min_score:
-        scored_results = [r for r in scored_results if r[2] >= min_score]
+    return [(candidate_ids[i], name, score) for name, score, i in matches]
 
-    return scored_results[:top_k]
+def find_closest_strings(query_string, index, ids_to_names, top_k=10, min_score=0):
+    """
+    Given a query string, return the top_k closest matches whose fuzzy similarity
+    is at least min_score.
+    """
+    query_hash = get_minhash(query_string)
+    result_ids = index.query(query_hash)
+    return rescore_candidates(query_string, result_ids, ids_to_names, top_k=top_k, min_score=min_score)
 
 class FilterStringHashPredicate(KGraphPredicate, ABC):
 
@@ -55,20 +97,106 @@ class FilterStringHashPredicate(KGraphPredicate, ABC):
     # top_k
     # min_score
 
-    def __init__(self, *, data: list[tuple]):
+    # Strings are added, replaced and deleted in place with upsert() and
+    # delete(), the LSH index removes them exactly so it needs no
+    # compaction. Each query sees the index as it is between two updates.
+
+    def __init__(self, *, data: list[tuple], workers: int = 1):
         super().__init__()
-        self.data = data
-        self.lsh_index = MinHashLSH(threshold=0.1, num_perm=128)
 
         ids_to_names = {}
-
         for id, name in data:
-            minhash = get_minhash(name)
-            print(f"Adding {id}: '{name}' : '{minhash}'")
             ids_to_names[str(id)] = name
-            self.lsh_index.insert(str(id), minhash)
+
+        self.lsh_index = build_lsh_index(list(ids_to_names.values()), list(ids_to_names), workers=workers)
+        logging.info(f"Indexed {len(ids_to_names)} strings")
 
         self.ids_to_names = ids_to_names
+        self._lock = ReadWriteLock()
+
+        # the query string must be bound, the engine orders the conjuncts so it is
+        self.register_mode("bff")
+
+    @property
+    def data(self) -> list:
+        """
+        The (id, string) of each indexed string.
+        """
+        with self._lock.read():
+            return list(self.ids_to_names.items())
+
+    def upsert(self, items: list[tuple]):
+        """
+        Add the (id, string) items, replacing the strings of the ids already
+        present. Queries are only held up while the index is changed, the
+        MinHashes are computed before.
+        """
+        latest = {str(id): name for id, name in items}
+        minhashes = get_minhashes(list(latest.values()))
+        with self._lock.write():
+            for key, name, minhash in zip(latest, latest.values(), minhashes):
+                if key in self.ids_to_names:
+                    self.lsh_index.remove(key)
+                self.lsh_index.insert(key, minhash)
+                self.ids_to_names[key] = name
+
+    def delete(self, ids: list) -> int:
+        """
+        Delete the strings of the ids, returning the number deleted.
+        """
+        deleted = 0
+        with self._lock.write():
+            for id in ids:
+                key = str(id)
+                if key in self.ids_to_names:
+                    self.lsh_index.remove(key)
+                    del self.ids_to_names[key]
+                    deleted += 1
+        return deleted
+
+    def save(self, path: str):
+        """
+        Save the LSH index and id to name mapping, so that load() can
+        restore the predicate without computing the MinHashes again.
+        """
+        state = {
+            "version": STRING_HASH_INDEX_VERSION,
+            "num_perm": MINHASH_NUM_PERM,
+            "lsh_index": self.lsh_index,
+            "ids_to_names": self.ids_to_names,
+        }
+
+        def write(temp_path):
+            with open(temp_path, "wb") as f:
+                pickle.dump(state, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+        # an interrupted save leaves the previous file
+        with self._lock.read():
+            replace_file(path, write)
+
+    @classmethod
+    def load(cls, path: str):
+        """
+        Return a predicate with the index saved by save(). The file is a
+        pickle, so only files from a trusted source should be loaded.
+        """
+        with open(path, "rb") as f:
+            try:
+                state = pickle.load(f)
+            except (EOFError, pickle.UnpicklingError) as e:
+                raise ValueError(f"Not a string hash index file: {path}: {e}")
+        if not isinstance(state, dict) or state.get("version") != STRING_HASH_INDEX_VERSION:
+            raise ValueError(f"Unsupported string hash index file: {path}")
+        if state["num_perm"] != MINHASH_NUM_PERM:
+            raise ValueError(f"String hash index {path} uses {state['num_perm']} permutations, "
+                             f"expected {MINHASH_NUM_PERM}")
+        predicate = cls.__new__(cls)
+        KGraphPredicate.__init__(predicate)
+        predicate.lsh_index = state["lsh_index"]
+        predicate.ids_to_names = state["ids_to_names"]
+        predicate._lock = ReadWriteLock()
+        predicate.register_mode("bff")
+        return predicate
 
     def get_arity(self) -> int:
         return 3
@@ -81,10 +209,9 @@ class FilterStringHashPredicate(KGraphPredicate, ABC):
 
         results = []
 
-        print(input_dict)
+        logging.debug(f"String hash call: {input_dict}")
 
         # TODO
-        # enforce query must be bound
         # handle case when match id and score are bound
         query = input_dict.get(0)
         match_id = input_dict.get(1)
@@ -101,18 +228,20 @@ class FilterStringHashPredicate(KGraphPredicate, ABC):
                     try:
                         top_k = int(ann[1][0])
                     except Exception as e:
-                        print(f"Invalid top_k annotation: {ann[1]}")
+                        logging.warning(f"Invalid top_k annotation: {ann[1]}")
                 elif ann[0] == "min_score" and ann[1]:
                     try:
                         min_score = float(ann[1][0])
                     except Exception as e:
-                        print(f"Invalid min_score annotation: {ann[1]}")
+                        logging.warning(f"Invalid min_score annotation: {ann[1]}")
 
-        scored_results = find_closest_strings(query, self.lsh_index, self.ids_to_names, top_k=top_k, min_score=min_score)
+        with self._lock.read():
+            scored_results = find_closest_strings(query, self.lsh_index, self.ids_to_names,
+                                                  top_k=top_k, min_score=min_score)
 
-        print(f"Top matches for '{query}':")
+        logging.debug(f"Top matches for '{query}':")
         for rid, match, score in scored_results:
-            print(f"Match: {match} (id={rid}) Score: {score:.4f}")
+            logging.debug(f"Match: {match} (id={rid}) Score: {score:.4f}")
             results.append({0: query, 1: rid, 2: round(float(score), 4)})
 
         return results
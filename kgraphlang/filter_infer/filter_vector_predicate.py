@@ -1,10 +1,66 @@
-from abc import ABC, abstractmethod
+import os
+import json
+import hashlib
 import logging
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
 import numpy as np
 from vital_ai_vitalsigns.embedding.embedding_model import EmbeddingModel
 from kgraphlang.kgraph_infer import UNBOUND
+from kgraphlang.parser.kgraph_ast import KGraphNode
 from kgraphlang.predicate.kgraph_predicate import KGraphPredicate
-import hnswlib
+from kgraphlang.planner.query_analysis import DEFAULT_MODE_COST
+from kgraphlang.filter_infer.read_write_lock import ReadWriteLock
+from kgraphlang.filter_infer.vector_index import (
+    AUTO_BACKEND, INT8_BACKEND, VectorIndex, AppendedVectors, cosine_distances, select_backend,
+    build_vector_index, load_vector_index, replace_file, save_array)
+
+# query embeddings kept by FilterVectorPredicate, the least recently used are dropped
+DEFAULT_EMBEDDING_CACHE_SIZE = 1024
+
+# results per query
+DEFAULT_TOP_K = 10
+
+# version of the index directories written by FilterVectorPredicate.save()
+VECTOR_INDEX_VERSION = 1
+
+# the files of an index directory
+_META_FILE = "meta.json"
+_EMBEDDINGS_FILE = "embeddings.npy"
+
+
+def normalize_query(query) -> str:
+    """
+    Return the text a query string is embedded as, and its embedding
+    cached by: stripped, with each run of whitespace made a single space.
+    """
+    return " ".join(str(query).split())
+
+
+def corpus_hash(data: list) -> str:
+    """
+    Return a hash of the content of the (id, description) pairs of a
+    vector predicate, which changes when any id or description, or their
+    order, does.
+    """
+    digest = hashlib.sha256()
+    for vector_id, vector_description in data:
+        digest.update(json.dumps([vector_id, vector_description], default=str).encode("utf-8"))
+        digest.update(b"\n")
+    return digest.hexdigest()
+
+
+def _candidate_list(value):
+    # the items of a list, or None; a list literal is passed (and an
+    # annotation argument given) in its tuple form, ("list", [items])
+    if isinstance(value, tuple) and len(value) == 2 and value[0] == "list" and isinstance(value[1], list):
+        return value[1]
+    if isinstance(value, list):
+        return value
+    return None
+
 
 class FilterVectorPredicate(KGraphPredicate, ABC):
 
@@ -19,10 +75,50 @@ class FilterVectorPredicate(KGraphPredicate, ABC):
     # optional annotations:
     # top_k
     # max_score
+    # candidates, a list of match ids the search is restricted to, e.g.
+    # @top_k('1') @candidates(['urn:film', 'urn:city']) vector_search(?Q, ?Id, ?Score)
+    # binds ?Id to the nearest of the two
+
+    # A bound match id is scored directly against the query, with no search.
+    # A match id bound to a list is an error, as the answers could not tell
+    # which of its ids matched: use the candidates annotation, or
+    # ?Id in ?Ids, vector_search(?Q, ?Id, ?Score) to score each of them.
+
+    # Query embeddings are cached, and the calls of a join are answered in
+    # batches (see KGraphPredicate.accepts_batches): the distinct query
+    # strings not in the cache are embedded with one call to the model, and
+    # all the queries are searched at once, on num_threads threads (-1 for
+    # all the cores).
 
-    def __init__(self, *, data: list[tuple]):
+    # The vectors are searched by the index of the given backend, see
+    # vector_index: "hnsw", "exact", "int8", or by default "auto", exact
+    # search for small corpora and HNSW for large ones.
+
+    # The embeddings and index can be saved to a directory and loaded from
+    # it, the embeddings memory-mapped, see save() and load_or_build().
+
+    # Vectors are added, replaced and deleted in place with upsert() and
+    # delete(). Each query sees the index as it is between two updates.
+    # Deleted vectors are only marked as deleted in the index, which is
+    # rebuilt without them in a background thread once they are more than
+    # compact_deleted_fraction of it.
+
+    # candidate lists up to this size are scanned, larger ones are searched in the index
+    exact_candidates_max = 4096
+
+    compact_deleted_fraction = 0.25
+
+    def __init__(self, *, data: list[tuple], vectors=None, backend: str = AUTO_BACKEND,
+                 embedding_cache_size: int = DEFAULT_EMBEDDING_CACHE_SIZE, num_threads: int = -1):
+        """
+        Embed the descriptions of the data and index them, or index the
+        given vectors, one row per item of data, computed earlier with the
+        same model.
+        """
         super().__init__()
-        self.data = data
+
+        # checked before embedding
+        select_backend(backend, len(data))
 
         descriptions = []
         ids = []
@@ -31,55 +127,480 @@ class FilterVectorPredicate(KGraphPredicate, ABC):
             ids.append(vector_id)
             descriptions.append(vector_description)
 
-        self.embedder = EmbeddingModel()
-        vectors_list = self.embedder.vectorize(descriptions)
-        vectors = np.array(vectors_list)
-        dimension = vectors.shape[1]
-        logging.info(f"Created embeddings with dimension: {dimension}")
+        self._embedder = None
+        if vectors is None:
+            vectors = self.embedder.vectorize(descriptions)
+            logging.info(f"Created {len(descriptions)} embeddings")
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError(f"Expected one vector per item of data, {len(ids)}, got an array of shape {vectors.shape}")
+        logging.info(f"Indexing embeddings with dimension: {vectors.shape[1]}")
+
+        self.num_threads = num_threads
+        self.backend = backend
+        self._init_index(ids, descriptions, vectors, build_vector_index(backend, vectors, num_threads=num_threads),
+                         corpus_hash(data), embedding_cache_size)
 
-        index = hnswlib.Index(space='cosine', dim=dimension)
-        index.init_index(max_elements=len(vectors), ef_construction=200, M=16)
-        index.add_items(vectors)
-        index.set_ef(50)  # ef should be > k for query performance
+    def _init_index(self, ids: list, descriptions: list, vectors: np.ndarray, index: VectorIndex,
+                    content_hash: str, embedding_cache_size: int, deleted: set = frozenset()):
+        # queries read the index, upsert(), delete() and compaction change it
+        self._lock = ReadWriteLock()
+        # one update (or compaction) at a time
+        self._update_lock = threading.Lock()
+        self._compaction = None
+        self._set_index(ids, descriptions, vectors, index, deleted)
+        self.corpus_hash = content_hash
+
+        # normalized query string -> embedding
+        self.embedding_cache_size = embedding_cache_size
+        self._embedding_cache = OrderedDict()
+        self._embedding_cache_stats = {"hits": 0, "misses": 0, "model_calls": 0}
+        # queries may run concurrently, the model is called without it
+        self._embedding_cache_lock = threading.Lock()
+
+        # the query string must be bound, the engine orders the conjuncts so it is,
+        # and a bound match id is cheaper, it is scored without a search
+        self.register_mode("bff")
+        self.register_mode("bbf", cost=DEFAULT_MODE_COST / 10)
+
+    def _set_index(self, ids: list, descriptions: list, vectors: np.ndarray, index: VectorIndex, deleted):
+        # the ids, descriptions and vectors of the rows (the labels in the
+        # index), including the deleted rows until the index is compacted
         self.index = index
         self.ids = ids
         self.descriptions = descriptions
+        # upserted vectors are appended in memory, the others may stay memory-mapped
+        self.vectors = AppendedVectors(vectors)
+        self._deleted = set(deleted)
+        # id -> row numbers of its vectors, more than one for an id repeated in the data
+        self._rows_of_ids = {}
+        for row, vector_id in enumerate(ids):
+            if row not in self._deleted:
+                self._rows_of_ids.setdefault(vector_id, []).append(row)
+
+    @property
+    def data(self) -> list:
+        """
+        The (id, description) of each vector, not counting deleted ones.
+        """
+        with self._lock.read():
+            return [(self.ids[row], self.descriptions[row]) for row in range(len(self.ids))
+                    if row not in self._deleted]
+
+    @property
+    def embedder(self):
+        # created when first used, a loaded predicate only needs it for queries
+        if self._embedder is None:
+            self._embedder = EmbeddingModel()
+        return self._embedder
+
+    def save(self, path: str):
+        """
+        Save the index, the embeddings (as embeddings.npy) and the ids and
+        descriptions to the directory path, so that load() can restore the
+        predicate without embedding the descriptions again.
+        """
+        if self.corpus_hash is None:
+            # changed by updates
+            self.corpus_hash = corpus_hash(self.data)
+        os.makedirs(path, exist_ok=True)
+        with self._lock.read():
+            # each file is replaced whole, the vectors may be memory-mapped from it
+            save_array(os.path.join(path, _EMBEDDINGS_FILE), self.vectors)
+            self.index.save(path)
+            meta = {
+                "version": VECTOR_INDEX_VERSION,
+                "backend": self.index.name,
+                # the backend asked for, compaction builds the index with it again
+                "requested_backend": self.backend,
+                "corpus_hash": self.corpus_hash,
+                "count": len(self.ids),
+                "dimension": int(self.vectors.shape[1]),
+                "ids": self.ids,
+                "descriptions": self.descriptions,
+                # the rows marked as deleted in the index
+                "deleted": sorted(self._deleted),
+            }
+        # written last, an interrupted first save leaves no loadable directory
+
+        def write_meta(temp_path):
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
 
+        replace_file(os.path.join(path, _META_FILE), write_meta)
+
+    @classmethod
+    def load(cls, path: str, *, data: list[tuple] = None, mmap: bool = True, backend: str = AUTO_BACKEND,
+             embedding_cache_size: int = DEFAULT_EMBEDDING_CACHE_SIZE, num_threads: int = -1):
+        """
+        Return a predicate with the index saved by save() to the directory
+        path. The embeddings are memory-mapped unless mmap is False. If data
+        is given, the saved index must have been built from it, checked by
+        its corpus hash, and if backend is not "auto", with that backend.
+        With backend "auto", the predicate keeps the backend the saved one
+        was built with, also when the index is compacted.
+        """
+        meta_path = os.path.join(path, _META_FILE)
+        try:
+            with open(meta_path, "r", encoding="utf-8") as f:
+                meta = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            raise ValueError(f"Not a vector index directory: {path}")
+        if not isinstance(meta, dict) or meta.get("version") != VECTOR_INDEX_VERSION:
+            raise ValueError(f"Unsupported vector index directory: {path}")
+        if data is not None and corpus_hash(data) != meta["corpus_hash"]:
+            raise ValueError(f"Vector index {path} was built from different data")
+
+        vectors = np.load(os.path.join(path, _EMBEDDINGS_FILE), mmap_mode="r" if mmap else None)
+        if vectors.shape != (meta["count"], meta["dimension"]):
+            raise ValueError(f"Vector index {path} embeddings have shape {vectors.shape}, "
+                             f"expected {(meta['count'], meta['dimension'])}")
+        # directories saved before there were backends hold an HNSW index
+        saved_backend = meta.get("backend", "hnsw")
+        if backend != AUTO_BACKEND and select_backend(backend, meta["count"]) != saved_backend:
+            raise ValueError(f"Vector index {path} was saved with backend '{saved_backend}'")
+        deleted = meta.get("deleted", ())
+        index = load_vector_index(saved_backend, path, vectors, deleted)
+
+        predicate = cls.__new__(cls)
+        KGraphPredicate.__init__(predicate)
+        predicate._embedder = None
+        predicate.num_threads = num_threads
+        if backend == AUTO_BACKEND:
+            # directories saved before it was recorded: "auto" never picks int8
+            backend = meta.get("requested_backend",
+                               INT8_BACKEND if saved_backend == INT8_BACKEND else AUTO_BACKEND)
+        predicate.backend = backend
+        predicate._init_index(meta["ids"], meta["descriptions"], vectors, index, meta["corpus_hash"],
+                              embedding_cache_size, deleted)
+        return predicate
+
+    @classmethod
+    def load_or_build(cls, path: str, *, data: list[tuple], **kwargs):
+        """
+        Load the index saved in the directory path if it was built from the
+        same data, otherwise build it, embedding the descriptions, and save
+        it there. kwargs, backend, embedding_cache_size and num_threads, are
+        passed to load() or the constructor.
+        """
+        try:
+            return cls.load(path, data=data, **kwargs)
+        except (ValueError, OSError, RuntimeError) as e:
+            logging.info(f"Building vector index {path}: {e}")
+        predicate = cls(data=data, **kwargs)
+        predicate.save(path)
+        return predicate
+
+    def upsert(self, items: list[tuple], vectors=None):
+        """
+        Add the (id, description) items, replacing the vectors of the ids
+        already present. The descriptions are embedded, unless vectors, one
+        row per item, are given. Queries are only held up while the new
+        vectors are inserted in the index.
+        """
+        # the last item of an id wins
+        latest = {}
+        for n, (vector_id, _) in enumerate(items):
+            latest[vector_id] = n
+        numbers = sorted(latest.values())
+        items = [items[n] for n in numbers]
+        if vectors is None:
+            vectors = self.embedder.vectorize([description for _, description in items]) if items else []
+        else:
+            vectors = np.asarray(vectors, dtype=np.float32)[numbers]
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(items), -1)
+        if len(items) and vectors.shape[1] != self.vectors.shape[1]:
+            raise ValueError(f"Expected vectors of dimension {self.vectors.shape[1]}, got {vectors.shape[1]}")
+        if not items:
+            return
+
+        with self._update_lock, self._lock.write():
+            first = len(self.ids)
+            rows = np.arange(first, first + len(items))
+            self.index.add(vectors, rows, num_threads=self.num_threads)
+            for vector_id, _ in items:
+                self._delete_rows(vector_id)
+            self.vectors.append(vectors)
+            for row, (vector_id, description) in zip(rows.tolist(), items):
+                self.ids.append(vector_id)
+                self.descriptions.append(description)
+                self._rows_of_ids[vector_id] = [row]
+            self.corpus_hash = None
+        self._maybe_compact()
+
+    def delete(self, ids: list) -> int:
+        """
+        Delete the vectors of the ids, returning the number deleted.
+        """
+        with self._update_lock, self._lock.write():
+            deleted = sum(self._delete_rows(vector_id) for vector_id in ids)
+            if deleted:
+                self.corpus_hash = None
+        self._maybe_compact()
+        return deleted
+
+    def _delete_rows(self, vector_id) -> int:
+        rows = self._rows_of_id(vector_id)
+        for row in rows:
+            self.index.mark_deleted(row)
+            self._deleted.add(row)
+        if rows:
+            del self._rows_of_ids[vector_id]
+        return len(rows)
+
+    def _maybe_compact(self):
+        if len(self._deleted) > self.compact_deleted_fraction * max(len(self.ids), 1):
+            self.compact()
+
+    def compact(self, wait: bool = False):
+        """
+        Rebuild the index without the deleted vectors, in a background
+        thread unless wait is True. Queries use the current index until
+        the new one replaces it, updates wait for the rebuild.
+        """
+        if wait:
+            self._compact()
+            return
+        with self._update_lock:
+            if self._compaction is not None and self._compaction.is_alive():
+                return
+            self._compaction = threading.Thread(target=self._compact, name="vector-index-compaction", daemon=True)
+            self._compaction.start()
+
+    def wait_for_compaction(self):
+        compaction = self._compaction
+        if compaction is not None:
+            compaction.join()
+
+    def _compact(self):
+        with self._update_lock:
+            if not self._deleted:
+                return
+            # nothing else changes the rows while the update lock is held
+            rows = [row for row in range(len(self.ids)) if row not in self._deleted]
+            ids = [self.ids[row] for row in rows]
+            descriptions = [self.descriptions[row] for row in rows]
+            vectors = self._compacted_vectors(np.array(rows, dtype=np.int64))
+            index = build_vector_index(self.backend, vectors, num_threads=self.num_threads)
+            with self._lock.write():
+                self._set_index(ids, descriptions, vectors, index, ())
+            logging.info(f"Compacted vector index to {len(rows)} vectors")
+
+    def _compacted_vectors(self, rows: np.ndarray) -> np.ndarray:
+        # the given rows of the vectors, in a new array, memory-mapped from a
+        # temporary file if the vectors were, so they are not read into memory
+        if not isinstance(self.vectors.base, np.memmap):
+            return self.vectors[rows].reshape(len(rows), self.vectors.shape[1])
+        fd, path = tempfile.mkstemp(prefix="vectors.", suffix=".npy")
+        os.close(fd)
+        try:
+            save_array(path, self.vectors, rows)
+            return np.load(path, mmap_mode="r")
+        finally:
+            try:
+                # the mapping outlives the file, where it can be removed while mapped
+                os.remove(path)
+            except OSError:
+                logging.warning(f"Could not remove the compacted vectors file {path}")
 
     def get_arity(self) -> int:
         return 3
 
     # lowest score is best
     def get_annotation_ids(self) -> list:
-        return ["top_k", "max_score"]
+        return ["top_k", "max_score", "candidates"]
+
+    # a bound match id is scored, not searched for, so filtering the
+    # results of a search is not the same as binding it
+    def supports_group_by(self) -> bool:
+        return False
+
+    def accepts_batches(self) -> bool:
+        return True
+
+    def embed_queries(self, queries: list) -> np.ndarray:
+        """
+        Return the embeddings of the query strings, one row per query. The
+        distinct normalized queries not in the cache are embedded with one
+        call to the model.
+        """
+        keys = [normalize_query(query) for query in queries]
+        stats = self._embedding_cache_stats
+        found = {}
+        with self._embedding_cache_lock:
+            cache = self._embedding_cache
+            for key in keys:
+                if key in found:
+                    continue
+                vector = cache.get(key)
+                if vector is not None:
+                    cache.move_to_end(key)
+                    found[key] = vector
+                    stats["hits"] += 1
+        missing = [key for key in dict.fromkeys(keys) if key not in found]
+        if missing:
+            vectors = np.asarray(self.embedder.vectorize(missing), dtype=np.float32)
+            with self._embedding_cache_lock:
+                cache = self._embedding_cache
+                stats["misses"] += len(missing)
+                stats["model_calls"] += 1
+                for key, vector in zip(missing, vectors):
+                    found[key] = vector
+                    if self.embedding_cache_size > 0:
+                        cache[key] = vector
+                while len(cache) > self.embedding_cache_size:
+                    cache.popitem(last=False)
+        return np.stack([found[key] for key in keys])
+
+    def get_embedding_cache_stats(self) -> dict:
+        """
+        Return the number of cached query embeddings, the number of queries
+        found in the cache (hits) and embedded (misses), and the number of
+        calls to the model.
+        """
+        with self._embedding_cache_lock:
+            return {"size": len(self._embedding_cache), **self._embedding_cache_stats}
+
+    def clear_embedding_cache(self):
+        with self._embedding_cache_lock:
+            self._embedding_cache = OrderedDict()
+
+    def _get_search_options(self, annotations: list):
+        top_k = DEFAULT_TOP_K
+        max_score = None
+        candidate_ids = None
+
+        # Extract annotation values if provided
+        if annotations:
+            for ann in annotations:
+                # Each annotation is expected to be in the form: (name, [arg1, ...])
+                if ann[0] == "top_k" and ann[1]:
+                    try:
+                        top_k = int(ann[1][0])
+                    except Exception as e:
+                        logging.warning(f"Invalid top_k annotation: {ann[1]}")
+                elif ann[0] == "max_score" and ann[1]:
+                    try:
+                        max_score = float(ann[1][0])
+                    except Exception as e:
+                        logging.warning(f"Invalid max_score annotation: {ann[1]}")
+                elif ann[0] == "candidates":
+                    # a list of ids, or the ids themselves
+                    candidate_ids = []
+                    for arg in ann[1]:
+                        if isinstance(arg, KGraphNode):
+                            # a list literal
+                            arg = arg.to_tuple()
+                        items = _candidate_list(arg)
+                        candidate_ids.extend(items if items is not None else [arg])
+        return top_k, max_score, candidate_ids
+
+    def _rows_of_id(self, vector_id) -> list:
+        try:
+            return self._rows_of_ids.get(vector_id, [])
+        except TypeError:
+            # e.g. a map value
+            return []
+
+    def _search_candidates(self, query_vector: np.ndarray, candidate_ids, top_k: int):
+        # (rows, distances) of the top_k candidates, by an exact scan over
+        # them, or by the index restricted to them when there are many
+        rows = []
+        for vector_id in candidate_ids:
+            rows.extend(self._rows_of_id(vector_id))
+        rows = np.unique(np.array(rows, dtype=np.int64))
+        k = min(top_k, len(rows))
+        if k <= 0:
+            return [], []
+        if len(rows) > self.exact_candidates_max:
+            found = self.index.filtered_search(query_vector, k, rows)
+            if found is not None:
+                labels, distances = found
+                return labels[0].tolist(), distances[0].tolist()
+        distances = cosine_distances(self.vectors[rows], query_vector)
+        if k < len(rows):
+            best = np.argpartition(distances, k - 1)[:k]
+        else:
+            best = np.arange(len(rows))
+        best = best[np.argsort(distances[best], kind="stable")]
+        return rows[best].tolist(), distances[best].tolist()
 
     def eval_impl(self, *, input_dict: dict, annotations: list = None) -> list:
+        return self.eval_batch_impl(input_dicts=[input_dict], annotations=annotations)[0]
 
-        results = []
+    def eval_batch_impl(self, *, input_dicts: list, annotations: list = None) -> list:
+
+        logging.debug(f"Vector calls: {input_dicts}")
 
-        print(input_dict)
+        top_k, max_score, candidate_ids = self._get_search_options(annotations)
 
-        # TODO
-        # enforce query must be bound
-        # handle case when match id and score are bound
-        query = input_dict.get(0)
-        match_id = input_dict.get(1)
-        match_score = input_dict.get(2)
+        for input_dict in input_dicts:
+            if _candidate_list(input_dict.get(1)) is not None:
+                raise ValueError(f"{type(self).__name__} match id is bound to a list, {input_dict.get(1)}: "
+                                 f"use the candidates annotation, or ?Id in [...], to search among the ids")
 
-        query_vector = np.array(self.embedder.vectorize([query]))
-        labels, distances = self.index.knn_query(query_vector, num_threads=1, filter=None, k=10)
+        queries = [input_dict.get(0) for input_dict in input_dicts]
+        if top_k <= 0:
+            return [[] for _ in queries]
+        query_vectors = self.embed_queries(queries)
 
-        print(f"\nQuery: '{query}'")
+        # the index as it is between two updates
+        with self._lock.read():
+            return self._answer_calls(input_dicts, queries, query_vectors, top_k, max_score, candidate_ids)
 
-        for rank, (label, distance) in enumerate(zip(labels[0], distances[0])):
-            if label < len(self.ids):
-                print(f"  Rank {rank + 1}:")
-                print(f"    Type: {self.ids[label]}")
-                print(f"    Description: {self.descriptions[label]}")
-                print(f"    Similarity Score: {distance:.4f}")
-                results.append({0: query, 1: self.ids[label], 2: round(float(distance), 4)})
+    def _answer_calls(self, input_dicts: list, queries: list, query_vectors: np.ndarray, top_k: int, max_score,
+                      candidate_ids=None):
+        matches = [[] for _ in queries]
+        if not self._rows_of_ids:
+            return matches
+        allowed_ids = None
+        if candidate_ids is not None:
+            allowed_ids = set()
+            for vector_id in candidate_ids:
+                try:
+                    allowed_ids.add(vector_id)
+                except TypeError:
+                    # e.g. a map value, matches no id
+                    pass
+
+        # the calls searching the index, and those with a bound match id
+        searches = []
+        scored = []
+        for n, input_dict in enumerate(input_dicts):
+            match_id = input_dict.get(1, UNBOUND)
+            if match_id is UNBOUND:
+                if candidate_ids is None:
+                    searches.append(n)
+                else:
+                    rows, distances = self._search_candidates(query_vectors[n], candidate_ids, top_k)
+                    matches[n] = list(zip(rows, distances))
             else:
-                print(f"  Rank {rank + 1}: No valid type found, Score: {distance:.4f}")
+                # an id with no rows may be unhashable, and not in allowed_ids
+                rows = self._rows_of_id(match_id)
+                if rows and (allowed_ids is None or match_id in allowed_ids):
+                    scored.extend((n, row) for row in rows)
 
-        return results
+        if scored:
+            # the distance of each query to its match, in one pass
+            distances = cosine_distances(self.vectors[[row for _, row in scored]],
+                                         query_vectors[[n for n, _ in scored]])
+            for (n, row), distance in zip(scored, distances.tolist()):
+                matches[n].append((row, distance))
 
+        if searches:
+            k = min(top_k, len(self.ids) - len(self._deleted))
+            labels, distances = self.index.search(query_vectors[searches], k, self.vectors,
+                                                  num_threads=self.num_threads)
+            for n, query_labels, query_distances in zip(searches, labels, distances):
+                matches[n] = list(zip(query_labels.tolist(), query_distances.tolist()))
+
+        results = []
+        for query, query_matches in zip(queries, matches):
+            query_results = []
+            for row, distance in query_matches:
+                if max_score is not None and distance > max_score:
+                    continue
+                logging.debug(f"Match: {self.descriptions[row]} (id={self.ids[row]}) Score: {distance:.4f}")
+                query_results.append({0: query, 1: self.ids[row], 2: round(float(distance), 4)})
+            results.append(query_results)
+        return results
@@ -0,0 +1,47 @@
+import threading
+from contextlib import contextmanager
+
+
+class ReadWriteLock:
+    """
+    A lock held by any number of readers or by one writer. Writers wait for
+    the readers holding it to finish, and new readers wait for a waiting
+    writer, so a stream of queries can not keep an update waiting.
+
+    Used by the predicates whose indexes are updated in place, so each
+    query sees the index as it is between two updates.
+    """
+    def __init__(self):
+        self._condition = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._condition:
+            while self._writing or self._writers_waiting:
+                self._condition.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._readers -= 1
+                if self._readers == 0:
+                    self._condition.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._condition:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._condition.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._condition:
+                self._writing = False
+                self._condition.notify_all()
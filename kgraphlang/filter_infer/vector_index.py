@@ -0,0 +1,465 @@
+import os
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+import numpy as np
+import hnswlib
+
+# The nearest neighbour indexes of FilterVectorPredicate. Each holds the
+# vectors of the predicate's rows, labelled by row number, and finds the
+# rows nearest to query vectors by cosine distance:
+#   hnsw:  an approximate HNSW graph (hnswlib), for large corpora
+#   exact: a scan of every vector, a matrix product, for small ones
+#   int8:  a scan of int8 quantized vectors, the best of which are then
+#          re-ranked exactly, for large corpora when memory matters more
+#          than speed, the full vectors can stay memory-mapped
+
+HNSW_BACKEND = "hnsw"
+EXACT_BACKEND = "exact"
+INT8_BACKEND = "int8"
+AUTO_BACKEND = "auto"
+
+# corpora up to this size are searched exactly by the "auto" backend, larger ones with HNSW
+EXACT_SEARCH_MAX_ROWS = 20000
+
+HNSW_M = 16
+HNSW_EF_CONSTRUCTION = 200
+# ef should be > k for query performance, it is the larger of HNSW_EF and HNSW_EF_PER_K * k,
+# for the largest k searched for so far
+HNSW_EF = 50
+HNSW_EF_PER_K = 2
+
+# the int8 scan keeps INT8_RERANK_FACTOR * k candidates for the exact re-ranking
+INT8_RERANK_FACTOR = 4
+
+# largest number of distances computed at once by a scan, as queries times rows
+_SCAN_BLOCK = 1 << 22
+
+_HNSW_FILE = "index.hnsw"
+_INT8_CODES_FILE = "int8_codes.npy"
+_INT8_SCALES_FILE = "int8_scales.npy"
+
+
+def replace_file(path: str, write):
+    """
+    Write the file path by calling write(temp_path) for a temporary file
+    in the same directory, then renaming it to path. A file replaced this
+    way is never partly written, and the index (or predicate) memory-mapping
+    it keeps reading the old file.
+    """
+    directory, name = os.path.split(path)
+    fd, temp_path = tempfile.mkstemp(dir=directory or ".", prefix=f".{name}.", suffix=".tmp")
+    os.close(fd)
+    try:
+        write(temp_path)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def save_array(path: str, array: np.ndarray, rows: np.ndarray = None):
+    """
+    Save an array, or the given rows of it, as the .npy file path, replacing
+    it with replace_file. The rows are written a block at a time, so a
+    memory-mapped array, or AppendedVectors, is not read into memory whole.
+    """
+    count = len(array) if rows is None else len(rows)
+    row_size = int(np.prod(array.shape[1:], dtype=np.int64))
+    block = max(1, _SCAN_BLOCK // max(row_size, 1))
+
+    def write(temp_path):
+        with open(temp_path, "wb") as f:
+            np.lib.format.write_array_header_1_0(f, {
+                "descr": np.lib.format.dtype_to_descr(np.dtype(array.dtype)),
+                "fortran_order": False,
+                "shape": (count,) + tuple(array.shape[1:]),
+            })
+            for start in range(0, count, block):
+                chunk = array[start:start + block] if rows is None else array[rows[start:start + block]]
+                f.write(np.ascontiguousarray(chunk).tobytes())
+    replace_file(path, write)
+
+
+class AppendedVectors:
+    """
+    The rows of an array, which may be memory-mapped and read only,
+    followed by rows appended in memory, so that appending does not copy
+    the array. Indexed like an array by a row number, a slice or an array
+    of row numbers, which returns an array.
+    """
+
+    def __init__(self, base: np.ndarray):
+        self.base = base
+        # the appended rows, with room for more
+        self._tail_buffer = np.empty((0, base.shape[1]), dtype=np.float32)
+        self._tail_count = 0
+
+    dtype = np.dtype(np.float32)
+
+    @property
+    def tail(self) -> np.ndarray:
+        return self._tail_buffer[:self._tail_count]
+
+    @property
+    def shape(self) -> tuple:
+        return len(self), self.base.shape[1]
+
+    def __len__(self) -> int:
+        return len(self.base) + self._tail_count
+
+    def __array__(self, dtype=None, copy=None):
+        vectors = np.concatenate([self.base, self.tail]) if self._tail_count else np.asarray(self.base)
+        return vectors if dtype is None else vectors.astype(dtype, copy=False)
+
+    def append(self, vectors: np.ndarray):
+        needed = self._tail_count + len(vectors)
+        if len(self._tail_buffer) < needed:
+            buffer = np.empty((max(needed, 2 * self._tail_count), self.base.shape[1]), dtype=np.float32)
+            buffer[:self._tail_count] = self.tail
+            self._tail_buffer = buffer
+        self._tail_buffer[self._tail_count:needed] = vectors
+        self._tail_count = needed
+
+    def __getitem__(self, rows):
+        count = len(self.base)
+        if isinstance(rows, slice):
+            start, stop, step = rows.indices(len(self))
+            if step == 1:
+                if stop <= count:
+                    return self.base[start:stop]
+                if start >= count:
+                    return self.tail[start - count:stop - count]
+                return np.concatenate([self.base[start:], self.tail[:stop - count]])
+            rows = np.arange(start, stop, step)
+        rows = np.asarray(rows, dtype=np.int64)
+        if rows.ndim == 0:
+            row = int(rows) + len(self) if rows < 0 else int(rows)
+            return self.base[row] if row < count else self.tail[row - count]
+        in_base = rows < count
+        if in_base.all():
+            return self.base[rows]
+        vectors = np.empty(rows.shape + (self.base.shape[1],), dtype=np.float32)
+        vectors[in_base] = self.base[rows[in_base]]
+        vectors[~in_base] = self.tail[rows[~in_base] - count]
+        return vectors
+
+
+def cosine_distances(vectors: np.ndarray, query_vectors: np.ndarray) -> np.ndarray:
+    """
+    Return the cosine distance, as computed by the index, of each row of
+    vectors to the query vector, or to the same row of query_vectors.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1) * np.linalg.norm(query_vectors, axis=-1)
+    similarities = np.sum(vectors * query_vectors, axis=1) / np.maximum(norms, np.finfo(np.float32).tiny)
+    return 1.0 - similarities
+
+
+def _row_norms(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(np.asarray(vectors, dtype=np.float32), axis=1)
+    return np.maximum(norms, np.finfo(np.float32).tiny)
+
+
+def _top_k(distances: np.ndarray, k: int):
+    # (labels, distances) of the k smallest distances of each row, in order
+    if k < distances.shape[1]:
+        labels = np.argpartition(distances, k - 1, axis=1)[:, :k]
+    else:
+        labels = np.broadcast_to(np.arange(distances.shape[1]), distances.shape).copy()
+    best = np.take_along_axis(distances, labels, axis=1)
+    order = np.argsort(best, axis=1, kind="stable")
+    return np.take_along_axis(labels, order, axis=1), np.take_along_axis(best, order, axis=1)
+
+
+def quantize_int8(vectors: np.ndarray):
+    """
+    Return (codes, scales): the vectors, normalized, as int8 codes with one
+    scale per vector, so that codes * scale approximates the normalized
+    vector.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    normalized = vectors / _row_norms(vectors)[:, None]
+    scales = np.maximum(np.abs(normalized).max(axis=1, initial=0.0) / 127.0, np.finfo(np.float32).tiny)
+    codes = np.rint(normalized / scales[:, None]).astype(np.int8)
+    return codes, scales.astype(np.float32)
+
+
+def select_backend(backend: str, count: int) -> str:
+    """
+    Return the backend to index count vectors with: backend itself, or for
+    "auto" exact search up to EXACT_SEARCH_MAX_ROWS vectors and HNSW above.
+    """
+    if backend == AUTO_BACKEND:
+        return EXACT_BACKEND if count <= EXACT_SEARCH_MAX_ROWS else HNSW_BACKEND
+    if backend not in _BACKENDS:
+        raise ValueError(f"Unknown vector index backend '{backend}', expected one of: "
+                         f"{', '.join([AUTO_BACKEND] + list(_BACKENDS))}")
+    return backend
+
+
+def build_vector_index(backend: str, vectors: np.ndarray, *, num_threads: int = -1) -> 'VectorIndex':
+    """
+    Return an index of the given backend (not "auto") of the rows of vectors.
+    """
+    return _BACKENDS[select_backend(backend, len(vectors))].build(vectors, num_threads=num_threads)
+
+
+def load_vector_index(backend: str, path: str, vectors: np.ndarray, deleted) -> 'VectorIndex':
+    """
+    Return the index of the given backend saved in the directory path, for
+    the rows of vectors, with the deleted rows marked as deleted.
+    """
+    return _BACKENDS[select_backend(backend, len(vectors))].load(path, vectors, deleted)
+
+
+def build_hnsw_index(vectors: np.ndarray, *, num_threads: int = -1) -> hnswlib.Index:
+    """
+    Return a cosine HNSW index of the rows of vectors, labelled by row number.
+    """
+    index = hnswlib.Index(space='cosine', dim=vectors.shape[1])
+    index.init_index(max_elements=max(len(vectors), 1), ef_construction=HNSW_EF_CONSTRUCTION, M=HNSW_M)
+    if len(vectors):
+        index.add_items(vectors, np.arange(len(vectors)), num_threads=num_threads)
+    index.set_ef(HNSW_EF)
+    return index
+
+
+class VectorIndex(ABC):
+    """
+    A nearest neighbour index of the rows of a vector predicate. The
+    vectors themselves are kept by the predicate, as AppendedVectors, and
+    passed to the methods that need them.
+    """
+
+    name = None
+
+    @abstractmethod
+    def add(self, vectors: np.ndarray, rows: np.ndarray, *, num_threads: int = -1):
+        """
+        Add the vectors, as the given rows, which follow the existing ones.
+        """
+        pass
+
+    @abstractmethod
+    def mark_deleted(self, row: int):
+        pass
+
+    @abstractmethod
+    def search(self, query_vectors: np.ndarray, k: int, vectors: np.ndarray, *, num_threads: int = -1):
+        """
+        Return (labels, distances), arrays with a row for each query of the
+        k nearest rows that are not deleted, nearest first, and their
+        cosine distances. k must not be more than the rows not deleted.
+        """
+        pass
+
+    def filtered_search(self, query_vector: np.ndarray, k: int, rows: np.ndarray):
+        """
+        Return (labels, distances) of the k nearest of the given rows, or
+        None if the index can not search a subset of its rows, in which case
+        they are scanned.
+        """
+        return None
+
+    def save(self, path: str):
+        """
+        Save what can not be computed quickly from the vectors to the
+        directory path.
+        """
+        pass
+
+
+class HNSWVectorIndex(VectorIndex):
+
+    name = HNSW_BACKEND
+
+    def __init__(self, index: hnswlib.Index):
+        self.index = index
+        self._ef = HNSW_EF
+        self._ef_lock = threading.Lock()
+        index.set_ef(HNSW_EF)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, *, num_threads: int = -1):
+        return cls(build_hnsw_index(vectors, num_threads=num_threads))
+
+    @classmethod
+    def load(cls, path: str, vectors: np.ndarray, deleted):
+        # the index file records the deleted rows
+        index = hnswlib.Index(space='cosine', dim=vectors.shape[1])
+        index.load_index(os.path.join(path, _HNSW_FILE), max_elements=max(len(vectors), 1))
+        return cls(index)
+
+    def save(self, path: str):
+        replace_file(os.path.join(path, _HNSW_FILE), self.index.save_index)
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray, *, num_threads: int = -1):
+        needed = int(rows[-1]) + 1
+        if self.index.get_max_elements() < needed:
+            self.index.resize_index(max(needed, 2 * self.index.get_max_elements()))
+        self.index.add_items(vectors, rows, num_threads=num_threads)
+
+    def mark_deleted(self, row: int):
+        self.index.mark_deleted(row)
+
+    def _set_ef(self, k: int):
+        # set_ef changes the index for every query, which may run concurrently,
+        # so ef is only ever raised, to that of the largest k searched for:
+        # a query never runs with a lower ef than its own
+        ef = max(HNSW_EF, HNSW_EF_PER_K * k)
+        if ef > self._ef:
+            with self._ef_lock:
+                if ef > self._ef:
+                    self.index.set_ef(ef)
+                    self._ef = ef
+
+    def search(self, query_vectors: np.ndarray, k: int, vectors: np.ndarray, *, num_threads: int = -1):
+        self._set_ef(k)
+        return self.index.knn_query(query_vectors, k=k, num_threads=num_threads)
+
+    def filtered_search(self, query_vector: np.ndarray, k: int, rows: np.ndarray):
+        self._set_ef(k)
+        allowed = set(rows.tolist())
+        try:
+            labels, distances = self.index.knn_query(query_vector, k=k, num_threads=1,
+                                                     filter=lambda label: label in allowed)
+        except RuntimeError:
+            # fewer than k found, the scan finds them all
+            return None
+        return labels, distances
+
+
+class _ScanVectorIndex(VectorIndex):
+    # the rows not deleted are all compared to the queries, a block of
+    # queries at a time
+
+    def __init__(self, count: int, deleted):
+        self.deleted = np.zeros(count, dtype=bool)
+        self.deleted[list(deleted)] = True
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray, *, num_threads: int = -1):
+        self.deleted = np.concatenate([self.deleted, np.zeros(len(rows), dtype=bool)])
+
+    def mark_deleted(self, row: int):
+        self.deleted[row] = True
+
+    @abstractmethod
+    def _distances(self, queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        # the distances of the normalized queries to every row, one row per query
+        pass
+
+    def _scan(self, query_vectors: np.ndarray, k: int, vectors: np.ndarray):
+        queries = np.asarray(query_vectors, dtype=np.float32).reshape(-1, vectors.shape[1])
+        queries = queries / _row_norms(queries)[:, None]
+        block = max(1, _SCAN_BLOCK // max(len(self.deleted), 1))
+        labels = []
+        distances = []
+        for start in range(0, len(queries), block):
+            block_distances = self._distances(queries[start:start + block], vectors)
+            if self.deleted.any():
+                block_distances[:, self.deleted] = np.inf
+            block_labels, block_distances = _top_k(block_distances, k)
+            labels.append(block_labels)
+            distances.append(block_distances)
+        return np.concatenate(labels), np.concatenate(distances)
+
+
+class ExactVectorIndex(_ScanVectorIndex):
+
+    name = EXACT_BACKEND
+
+    def __init__(self, vectors: np.ndarray, deleted=()):
+        super().__init__(len(vectors), deleted)
+        self.norms = _row_norms(vectors)
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, *, num_threads: int = -1):
+        return cls(vectors)
+
+    @classmethod
+    def load(cls, path: str, vectors: np.ndarray, deleted):
+        return cls(vectors, deleted)
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray, *, num_threads: int = -1):
+        super().add(vectors, rows)
+        self.norms = np.concatenate([self.norms, _row_norms(vectors)])
+
+    def _distances(self, queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        # a block of rows at a time, vectors may be AppendedVectors
+        distances = np.empty((len(queries), len(vectors)), dtype=np.float32)
+        rows = max(1, _SCAN_BLOCK // max(queries.shape[1], 1))
+        for start in range(0, len(vectors), rows):
+            block = np.asarray(vectors[start:start + rows], dtype=np.float32)
+            similarities = (block @ queries.T).T / self.norms[start:start + rows]
+            distances[:, start:start + rows] = 1.0 - similarities
+        return distances
+
+    def search(self, query_vectors: np.ndarray, k: int, vectors: np.ndarray, *, num_threads: int = -1):
+        return self._scan(query_vectors, k, vectors)
+
+
+class Int8VectorIndex(_ScanVectorIndex):
+
+    name = INT8_BACKEND
+
+    def __init__(self, codes: np.ndarray, scales: np.ndarray, deleted=()):
+        super().__init__(len(codes), deleted)
+        self.codes = codes
+        self.scales = scales
+
+    @classmethod
+    def build(cls, vectors: np.ndarray, *, num_threads: int = -1):
+        return cls(*quantize_int8(vectors))
+
+    @classmethod
+    def load(cls, path: str, vectors: np.ndarray, deleted):
+        codes = np.load(os.path.join(path, _INT8_CODES_FILE), mmap_mode="r")
+        scales = np.load(os.path.join(path, _INT8_SCALES_FILE), mmap_mode="r")
+        if codes.shape != vectors.shape or scales.shape != (len(vectors),):
+            raise ValueError(f"Int8 codes in {path} do not match the embeddings")
+        return cls(codes, scales, deleted)
+
+    def save(self, path: str):
+        # the codes and scales may be memory-mapped from the files replaced
+        save_array(os.path.join(path, _INT8_CODES_FILE), self.codes)
+        save_array(os.path.join(path, _INT8_SCALES_FILE), self.scales)
+
+    def add(self, vectors: np.ndarray, rows: np.ndarray, *, num_threads: int = -1):
+        super().add(vectors, rows)
+        codes, scales = quantize_int8(vectors)
+        self.codes = np.concatenate([self.codes, codes])
+        self.scales = np.concatenate([self.scales, scales])
+
+    def _distances(self, queries: np.ndarray, vectors: np.ndarray) -> np.ndarray:
+        # the codes are converted to float32 a block of rows at a time
+        distances = np.empty((len(queries), len(self.codes)), dtype=np.float32)
+        rows = max(1, _SCAN_BLOCK // max(queries.shape[1], 1))
+        for start in range(0, len(self.codes), rows):
+            codes = np.asarray(self.codes[start:start + rows], dtype=np.float32)
+            similarities = (codes @ queries.T).T * self.scales[start:start + rows]
+            distances[:, start:start + rows] = 1.0 - similarities
+        return distances
+
+    def search(self, query_vectors: np.ndarray, k: int, vectors: np.ndarray, *, num_threads: int = -1):
+        live = len(self.deleted) - int(self.deleted.sum())
+        candidates, _ = self._scan(query_vectors, min(k * INT8_RERANK_FACTOR, live), vectors)
+        query_vectors = np.asarray(query_vectors, dtype=np.float32).reshape(len(candidates), -1)
+        labels = []
+        distances = []
+        for query_vector, rows in zip(query_vectors, candidates):
+            # in row order, so memory-mapped vectors are read in order
+            rows = np.sort(rows)
+            exact = cosine_distances(vectors[rows], query_vector)
+            best = np.argsort(exact, kind="stable")[:k]
+            labels.append(rows[best])
+            distances.append(exact[best])
+        return np.array(labels), np.array(distances)
+
+
+_BACKENDS = {
+    HNSW_BACKEND: HNSWVectorIndex,
+    EXACT_BACKEND: ExactVectorIndex,
+    INT8_BACKEND: Int8VectorIndex,
+}
@@ -1,8 +1,17 @@
+from collections.abc import Mapping, Sequence
 from itertools import combinations, permutations
 from enum import Enum
+import json
 import isodate
 import datetime
 from kgraphlang.parser.kgraph_infer_parser import KGraphInferParser
+from kgraphlang.parser.kgraph_ast import (
+    KGraphNode, AndNode, OrNode, GroupNode, NotNode, PredicateNode, AnnotatedPredicateNode,
+    CompareNode, UnifyNode, MathAssignNode, ArithNode, DivNode, InNode, SubsetNode, AggregateNode,
+    ListNode, MapNode)
+from kgraphlang.planner.query_analysis import (
+    freeze_value, iter_subnodes, aggregate_body, declares_modes, order_conjuncts, range_constraints)
+from kgraphlang.planner.query_context import QueryContext, QueryPlan, QueryCancelledError
 
 class _UnboundType:
     def __repr__(self):
@@ -23,13 +32,16 @@ class EvalResult(Enum):
 class BindingStack:
     """
     Represents the current set of variable bindings.
+    The optional context is the QueryContext of the query being evaluated,
+    it is shared (not copied) between all bindings of that query.
     """
-    def __init__(self, bindings=None, annotations=None):
+    def __init__(self, bindings=None, annotations=None, context=None):
         self.bindings = bindings.copy() if bindings else {}
         self.annotations = annotations.copy() if annotations else []
+        self.context = context
 
     def copy(self):
-        return BindingStack(self.bindings, self.annotations)
+        return BindingStack(self.bindings, self.annotations, self.context)
 
     def bind(self, var, value):
         """
@@ -79,20 +91,108 @@ class BindingStack:
         return self.__str__()
 
 
+# marks a variable of the schema that an answer does not bind
+_MISSING = object()
+
+
+class AnswerView(Mapping):
+    """
+    A read-only, dict-like view of one answer of an AnswerSet.
+    The view refers to the shared variable schema and the row tuple of the
+    answer, the dictionary is only built if asked for with copy().
+    """
+    __slots__ = ("_index", "_variables", "_row")
+
+    def __init__(self, index: dict, variables: list, row: tuple):
+        self._index = index
+        self._variables = variables
+        self._row = row
+
+    def __getitem__(self, var):
+        i = self._index.get(var)
+        if i is None or i >= len(self._row) or self._row[i] is _MISSING:
+            raise KeyError(var)
+        return self._row[i]
+
+    def __iter__(self):
+        for var, value in zip(self._variables, self._row):
+            if value is not _MISSING:
+                yield var
+
+    def __len__(self):
+        return sum(1 for value in self._row if value is not _MISSING)
+
+    def copy(self):
+        return dict(self.items())
+
+    def __str__(self):
+        return str(self.copy())
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class AnswerResults(Sequence):
+    """
+    The answers of an AnswerSet as a sequence of AnswerView objects,
+    created on access.
+    """
+    def __init__(self, answer_set: 'AnswerSet'):
+        self._answer_set = answer_set
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        answer_set = self._answer_set
+        return AnswerView(answer_set._index, answer_set.variables, answer_set.rows[i])
+
+    def __len__(self):
+        return len(self._answer_set.rows)
+
+    def __str__(self):
+        return str(list(self))
+
+    def __repr__(self):
+        return self.__str__()
+
+
 class AnswerSet:
     """
-    Accumulates the final set of answers (each as a dictionary of bindings)
-    and stores the overall evaluation result as a structured type.
+    Accumulates the final set of answers and stores the overall evaluation
+    result as a structured type.
+    Answers are stored compactly as one row tuple per answer over a shared
+    list of variables (the schema), in the order the variables were first
+    bound. get_results() returns dict-like views of the rows.
     """
     def __init__(self):
-        self.answers = []
+        self.variables = []
+        self._index = {}
+        self.rows = []
         self.eval_result = EvalResult.UNKNOWN  # Initially unknown
+        self.stats = None
 
     def add(self, binding: 'BindingStack'):
-        self.answers.append(binding.as_dict())
+        index = self._index
+        row = [_MISSING] * len(self.variables)
+        for var, value in binding.bindings.items():
+            i = index.get(var)
+            if i is None:
+                i = len(self.variables)
+                self.variables.append(var)
+                index[var] = i
+                row.append(_MISSING)
+            row[i] = value
+        self.rows.append(tuple(row))
 
     def get_results(self):
-        return self.answers
+        return AnswerResults(self)
+
+    @property
+    def answers(self):
+        return self.get_results()
+
+    def get_variables(self) -> list:
+        return list(self.variables)
 
     def set_eval_result(self, result: EvalResult):
         self.eval_result = result
@@ -100,12 +200,124 @@ class AnswerSet:
     def get_eval_result(self):
         return self.eval_result
 
+    def set_stats(self, stats):
+        self.stats = stats
+
+    def get_stats(self):
+        """
+        Get the QueryStats of the evaluation that produced this answer set.
+        """
+        return self.stats
+
+    def _padded_rows(self):
+        width = len(self.variables)
+        for row in self.rows:
+            if len(row) < width:
+                row = row + (_MISSING,) * (width - len(row))
+            yield row
+
+    def get_columns(self) -> dict:
+        """
+        Return the answers as a dictionary of variable -> list of values,
+        with None where an answer does not bind the variable.
+        """
+        columns = {var: [] for var in self.variables}
+        appends = [columns[var].append for var in self.variables]
+        for row in self._padded_rows():
+            for append, value in zip(appends, row):
+                append(None if value is _MISSING else value)
+        return columns
+
+    def to_columnar_json(self) -> str:
+        """
+        Export the answers as compact columnar JSON:
+            {"result": "Yes", "variables": [...], "columns": [[...], ...]}
+        with one column of values per variable and null for missing values.
+        """
+        columns = self.get_columns()
+        return json.dumps({
+            "result": self.eval_result.value,
+            "variables": self.variables,
+            "columns": [columns[var] for var in self.variables]
+        }, default=str)
+
+    def to_ndjson(self) -> str:
+        """
+        Export the answers as newline-delimited JSON, one object per answer.
+        """
+        encoder = json.JSONEncoder(default=str)
+        lines = []
+        for row in self.rows:
+            lines.append(encoder.encode(
+                {var: value for var, value in zip(self.variables, row) if value is not _MISSING}))
+        return "\n".join(lines) + "\n" if lines else ""
+
+    def to_kgraph_literal(self, parser: KGraphInferParser = None) -> str:
+        """
+        Render the answers as a KGraphLang expression, an OR of answers each
+        unifying its variables with their values, e.g.:
+            ?X = 'Alice', ?M = 'alice@example.com'; ?X = 'Bob', ?M = 'bob@example.com'.
+        This can be passed back to the LLM or parsed again with infer_parse.
+        Returns an empty string if there are no answers.
+        """
+        if not self.rows:
+            return ""
+        parser = parser or KGraphInferParser()
+        branches = []
+        for row in self.rows:
+            unifications = [UnifyNode(var, "=", parser.value_to_ast(value))
+                            for var, value in zip(self.variables, row) if value is not _MISSING]
+            branches.append(AndNode(unifications))
+        node = branches[0] if len(branches) == 1 else OrNode(branches)
+        return parser.infer_unparse(node)
+
+    def __len__(self):
+        return len(self.rows)
+
     def __str__(self):
         return f"Evaluation: {self.eval_result.value}, Answers: {self.answers}"
 
     def __repr__(self):
         return self.__str__()
 
+class PreparedQuery:
+    """
+    A query that has been parsed and planned once, to be run many times with
+    different values bound to its $param placeholders.
+    """
+    def __init__(self, infer: 'KGraphInfer', ast):
+        self.infer = infer
+        self.ast = ast
+        self.param_names = infer.parser.find_params(ast)
+        # sub-ASTs without placeholders are shared unchanged by every run,
+        # so their part of the plan is computed here once
+        self.plan = QueryPlan().analyze(ast, skip=lambda node: bool(node.params))
+
+    def get_param_names(self) -> list:
+        return list(self.param_names)
+
+    def run(self, params: dict = None) -> 'AnswerSet':
+        """
+        Bind the placeholders to the given values and evaluate the query.
+        Raises ValueError if a parameter is missing or unknown.
+        """
+        params = params or {}
+        unknown = [name for name in params if name not in self.param_names]
+        if unknown:
+            raise ValueError(f"Unknown query parameters: {', '.join(unknown)}")
+
+        bound_ast = self.infer.parser.bind_params(self.ast, params)
+
+        initial_binding = BindingStack(context=self.infer._new_context(bound_ast, self.plan))
+
+        return self.infer._evaluate(bound_ast, initial_binding)
+
+    def __str__(self):
+        return self.infer.parser.infer_unparse(self.ast)
+
+    def __repr__(self):
+        return self.__str__()
+
 # TODO
 # atoms (a,b,c) eval?  lookup for existence?
 # better exception and error handling
@@ -118,10 +330,43 @@ class KGraphInfer:
     using a BindingStack for the current variable bindings. The final results are accumulated
     in an AnswerSet.
     """
-    def __init__(self, predicate_registry: dict):
+
+    # bindings passed at once to predicates that accept batches, see KGraphPredicate.accepts_batches
+    predicate_batch_size = 64
+
+    # outputs of predicate calls kept per query (or batch) for identical calls, see QueryContext
+    predicate_call_cache_size = 100000
+
+    def __init__(self, predicate_registry: dict, share_subexpressions: bool = True):
 
         self.parser = KGraphInferParser()
         self.predicate_registry = predicate_registry
+        # evaluate repeated sub-ASTs once per distinct set of bound inputs
+        self.share_subexpressions = share_subexpressions
+
+        # node type -> function returning an iterator of the resulting bindings
+        self._node_iterators = {
+            AndNode: self._iter_and,
+            OrNode: lambda node, binding: self._iter_or(node.items, binding),
+            NotNode: lambda node, binding: self._iter_not(node.expr, binding),
+            GroupNode: lambda node, binding: self._iter_inner(node.expr, binding),
+            AnnotatedPredicateNode: self._iter_annotated_predicate,
+        }
+        # node type -> function returning the list of resulting bindings
+        self._node_evaluators = {
+            PredicateNode: self._eval_predicate,
+            UnifyNode: self._eval_unify,
+            MathAssignNode: self._eval_math_assign,
+            CompareNode: self._eval_compare,
+            InNode: self._eval_in,
+            SubsetNode: self._eval_subset,
+        }
+        # node type -> function returning the value of an expression
+        self._expr_evaluators = {
+            ListNode: self._eval_list,
+            MapNode: self._eval_map,
+            AggregateNode: self.evaluate_aggregate,
+        }
 
     def _compare_generic(self, a, b, operator):
 
@@ -260,10 +505,10 @@ class KGraphInfer:
         else:
             return self._compare_generic(left_val[1], right_val[1], operator)
 
-    def _eval_compare(self, node, binding: BindingStack):
-        left = node[1]
-        operator = node[2]
-        right = node[3]
+    def _eval_compare(self, node: CompareNode, binding: BindingStack):
+        left = node.left
+        operator = node.op
+        right = node.right
         left_val = self.eval_expr(left, binding)
         right_val = self.eval_expr(right, binding)
         if left_val is UNBOUND or right_val is UNBOUND:
@@ -279,13 +524,12 @@ class KGraphInfer:
 
     def unify_map_literal(self, binding: BindingStack, pattern_ast, candidate: dict):
         """
-        Attempt to unify a left-hand map literal (pattern_ast of the form:
-            ('map', [ (pattern_key, pattern_value), ... ])
-        ) with a candidate dictionary.
+        Attempt to unify a left-hand map literal (pattern_ast, a MapNode with
+        items [ (pattern_key, pattern_value), ... ]) with a candidate dictionary.
         Tries all permutations of candidate entries.
         Returns a new BindingStack if successful, or None otherwise.
         """
-        patterns = pattern_ast[1]  # list of (pattern_key, pattern_value)
+        patterns = pattern_ast.items  # list of (pattern_key, pattern_value)
         # There must be exactly len(patterns) candidate entries.
         candidate_items = list(candidate.items())
         for perm in permutations(candidate_items):
@@ -320,23 +564,63 @@ class KGraphInfer:
                 return new_binding
         return None
 
-    def evaluate_aggregate(self, agg_node, binding: BindingStack):
+    def evaluate_aggregate(self, agg_node: AggregateNode, binding: BindingStack):
         """
-        Evaluate an aggregate node of the form:
-           ('aggregate', op, agg_var, body)
+        Evaluate an aggregate node, AggregateNode(op, agg_var, body)
         where body is a list of expressions (the aggregate query).
         Returns the aggregated value.
         """
-        op = agg_node[1]
-        agg_var = agg_node[2]
-        body = agg_node[3]  # a list of one or more expressions
-
-        if len(body) == 1:
-            sub_ast = body[0]
+        context = binding.context
+        if context is None:
+            sub_ast = aggregate_body(agg_node)
+            return self._aggregate_values(agg_node, self._evaluate_inner(sub_ast, binding.copy()))
+
+        # Only the body variables that are already bound can change the result.
+        # An aggregate with none is computed once per query, otherwise once per
+        # distinct tuple of values of those (correlated) variables.
+        node_key, variables, sub_ast = context.aggregate_plan(agg_node)
+        correlated = tuple(var for var in variables if var in binding)
+        values = tuple(freeze_value(binding.get(var)) for var in correlated)
+        annotations = freeze_value(binding.get_annotations())
+        key = (node_key, correlated, values, annotations)
+
+        cached = context.get_aggregate(key)
+        if cached is not None:
+            context.stats.aggregate_reuses += 1
+            return cached[0]
+
+        group_key = (node_key, correlated, annotations)
+        groups = context.get_aggregate_groups(group_key)
+        if groups is not None:
+            # already decorrelated, tuples without a group aggregate nothing
+            context.stats.aggregate_reuses += 1
+            value = self._aggregate_values(agg_node, groups.get(values, []))
+        elif correlated and context.count_aggregate_miss(group_key) > 1 and \
+                context.aggregate_group_by(agg_node, correlated, self._group_by_supported):
+            # a second distinct tuple reaches the aggregate: evaluate the body
+            # once with the correlated variables unbound and group the results
+            groups = {}
+            unbound = BindingStack(annotations=binding.get_annotations(), context=context)
+            for b in self._evaluate_inner(sub_ast, unbound):
+                group = tuple(freeze_value(b.get(var)) for var in correlated)
+                groups.setdefault(group, []).append(b)
+            context.put_aggregate_groups(group_key, groups)
+            context.stats.aggregate_group_by_passes += 1
+            value = self._aggregate_values(agg_node, groups.get(values, []))
         else:
-            sub_ast = ("AND", body)
+            context.stats.aggregate_evaluations += 1
+            value = self._aggregate_values(agg_node, self._evaluate_inner(sub_ast, binding.copy()))
+
+        context.put_aggregate(key, (value,))
+        return value
 
-        sub_bindings = self._evaluate_inner(sub_ast, binding.copy())
+    def _aggregate_values(self, agg_node, sub_bindings):
+        """
+        Apply the aggregate operator to the values of the aggregate variable
+        in the bindings produced by the aggregate body.
+        """
+        op = agg_node.op
+        agg_var = agg_node.var
 
         results = []
 
@@ -379,80 +663,61 @@ class KGraphInfer:
     def eval_expr(self, expr, binding: BindingStack):
         """
         Recursively evaluate an expression to a concrete value.
-        If the expression is a tuple and its first element is an arithmetic operator,
-        use eval_arith; otherwise, if we cannot resolve it to a literal value,
-        return UNBOUND.
+        Arithmetic nodes are evaluated with eval_arith, lists, maps and
+        aggregates by the evaluator for their type; if we cannot resolve the
+        expression to a literal value, return UNBOUND.
         """
 
-        if isinstance(expr, tuple):
-            op = expr[0]
-            if op in ("add", "sub", "mul", "div"):
+        if isinstance(expr, KGraphNode):
+            if isinstance(expr, ArithNode):
                 return self.eval_arith(expr, binding)
-            elif op == "list":
-                result = []
-                for item in expr[1]:
-                    v = self.eval_expr(item, binding)
-                    if v is UNBOUND:
-                        return UNBOUND
-                    result.append(v)
-                return result
-            elif op == "map":
-                d = {}
-                for pair in expr[1]:
-                    k = self.eval_expr(pair[0], binding)
-                    v = self.eval_expr(pair[1], binding)
-                    if k is UNBOUND or v is UNBOUND:
-                        return UNBOUND
-                    d[k] = v
-                return d
-            elif op == "aggregate":
-                return self.evaluate_aggregate(expr, binding)
-            else:
-                return UNBOUND
+            evaluator = self._expr_evaluators.get(type(expr))
+            if evaluator is not None:
+                return evaluator(expr, binding)
+            # other nodes, e.g. an atom, have their tuple form as value
+            return expr.to_tuple()
         elif isinstance(expr, str) and expr.startswith("?"):
             return binding.get(expr) if expr in binding else UNBOUND
         else:
-            # Literal value (number, string, etc.)
+            # Literal value (number, string, typed literal such as ("date", "2023-02-18"), etc.)
             return expr
 
+    def _eval_list(self, expr: ListNode, binding: BindingStack):
+        result = []
+        for item in expr.items:
+            v = self.eval_expr(item, binding)
+            if v is UNBOUND:
+                return UNBOUND
+            result.append(v)
+        return result
+
+    def _eval_map(self, expr: MapNode, binding: BindingStack):
+        d = {}
+        for pair in expr.items:
+            k = self.eval_expr(pair[0], binding)
+            v = self.eval_expr(pair[1], binding)
+            if k is UNBOUND or v is UNBOUND:
+                return UNBOUND
+            d[k] = v
+        return d
+
     def eval_arith(self, expr, binding: BindingStack):
         """
-        Recursively evaluates an arithmetic expression represented as a tuple.
+        Recursively evaluates an arithmetic expression.
         The expression can be:
-          - A tuple like ('add', left, right)
+          - An ArithNode, e.g. AddNode(left, right)
           - A number (int/float)
           - A variable (e.g. '?y') that must already be bound.
         Returns the computed value or UNBOUND if a variable is not bound.
         """
-        if isinstance(expr, tuple):
-            op = expr[0]
-            if op == "add":
-                left = self.eval_arith(expr[1], binding)
-                right = self.eval_arith(expr[2], binding)
-                if left is UNBOUND or right is UNBOUND:
-                    return UNBOUND
-                return left + right
-            elif op == "sub":
-                left = self.eval_arith(expr[1], binding)
-                right = self.eval_arith(expr[2], binding)
-                if left is UNBOUND or right is UNBOUND:
-                    return UNBOUND
-                return left - right
-            elif op == "mul":
-                left = self.eval_arith(expr[1], binding)
-                right = self.eval_arith(expr[2], binding)
-                if left is UNBOUND or right is UNBOUND:
-                    return UNBOUND
-                return left * right
-            elif op == "div":
-                left = self.eval_arith(expr[1], binding)
-                right = self.eval_arith(expr[2], binding)
-                if left is UNBOUND or right is UNBOUND or right == 0:
-                    return UNBOUND
-                return left / right
-            else:
-                # Fallback: try evaluating the second element (for grouped expressions)
-                return self.eval_arith(expr[1], binding)
+        if isinstance(expr, ArithNode):
+            left = self.eval_arith(expr.left, binding)
+            right = self.eval_arith(expr.right, binding)
+            if left is UNBOUND or right is UNBOUND:
+                return UNBOUND
+            if isinstance(expr, DivNode) and right == 0:
+                return UNBOUND
+            return expr.apply(left, right)
         else:
             # If it's a variable, return its binding (or UNBOUND if not bound)
             if isinstance(expr, str) and expr.startswith("?"):
@@ -465,12 +730,11 @@ class KGraphInfer:
         def get_val(x):
             if isinstance(x, str) and x.startswith("?"):
                 return binding.get(x) if x in binding else UNBOUND
-            # If x is a tuple tagged as "list", evaluate it to get a concrete list.
-            elif isinstance(x, tuple):
-                if len(x) > 0 and x[0] in ("list", "map", "aggregate"):
-                    return self.eval_expr(x, binding)
-                else:
-                    return x
+            # Lists, maps and aggregates are evaluated to get a concrete value.
+            elif isinstance(x, (ListNode, MapNode, AggregateNode)):
+                return self.eval_expr(x, binding)
+            elif isinstance(x, KGraphNode):
+                return x.to_tuple()
             else:
                 return x
 
@@ -489,25 +753,25 @@ class KGraphInfer:
         else:
             return left_val == right_val
 
-    def _eval_in(self, node, binding: BindingStack):
-        right_val = self.eval_expr(node[2], binding)
+    def _eval_in(self, node: InNode, binding: BindingStack):
+        left = node.left
+        right_val = self.eval_expr(node.right, binding)
         if right_val is UNBOUND:
             return []
         # Case: right is a map.
         if isinstance(right_val, dict):
             # Left operand may be a variable or a map literal.
-            if isinstance(node[1], str) and node[1].startswith("?"):
+            if isinstance(left, str) and left.startswith("?"):
                 result_bindings = []
                 for key, value in right_val.items():
                     new_binding = binding.copy()
-                    new_binding.bind(node[1], {key: value})
+                    new_binding.bind(left, {key: value})
                     result_bindings.append(new_binding)
                 return result_bindings
-            elif isinstance(node[1], tuple) and node[1][0] == "map":
-                pattern = node[1]  # raw AST for the map literal
-                if len(pattern[1]) != 1:
+            elif isinstance(left, MapNode):
+                if len(left.items) != 1:
                     return []
-                (pattern_key, pattern_value) = pattern[1][0]
+                (pattern_key, pattern_value) = left.items[0]
                 result_bindings = []
                 for candidate_key, candidate_value in right_val.items():
                     new_binding = binding.copy()
@@ -532,37 +796,38 @@ class KGraphInfer:
                     result_bindings.append(new_binding)
                 return result_bindings
             else:
-                left_val = self.eval_expr(node[1], binding)
+                left_val = self.eval_expr(left, binding)
                 if left_val is UNBOUND:
                     return []
                 return [binding] if left_val in right_val else []
         # Case: right is a list.
         elif isinstance(right_val, list):
-            if isinstance(node[1], str) and node[1].startswith("?"):
+            if isinstance(left, str) and left.startswith("?"):
                 result_bindings = []
                 for candidate in right_val:
                     new_binding = binding.copy()
-                    new_binding.bind(node[1], candidate)
+                    new_binding.bind(left, candidate)
                     result_bindings.append(new_binding)
                 return result_bindings
             else:
-                left_val = self.eval_expr(node[1], binding)
+                left_val = self.eval_expr(left, binding)
                 if left_val is UNBOUND:
                     return []
                 return [binding] if left_val in right_val else []
         else:
             return []
 
-    def _eval_subset(self, node, binding: BindingStack):
-        left_val = self.eval_expr(node[1], binding)
-        right_val = self.eval_expr(node[2], binding)
+    def _eval_subset(self, node: SubsetNode, binding: BindingStack):
+        left = node.left
+        left_val = self.eval_expr(left, binding)
+        right_val = self.eval_expr(node.right, binding)
         # If both are lists, do a list subset check.
         if isinstance(left_val, list) and isinstance(right_val, list):
             return [binding] if set(left_val).issubset(set(right_val)) else []
         # If right is a map.
         elif isinstance(right_val, dict):
             # Case: left operand is an unbound variable.
-            if isinstance(node[1], str) and node[1].startswith("?") and node[1] not in binding:
+            if isinstance(left, str) and left.startswith("?") and left not in binding:
                 items = list(right_val.items())
                 result_bindings = []
                 n = len(items)
@@ -573,13 +838,13 @@ class KGraphInfer:
                             k, v = items[j]
                             sub[k] = v
                     new_binding = binding.copy()
-                    new_binding.bind(node[1], sub)
+                    new_binding.bind(left, sub)
                     result_bindings.append(new_binding)
                 return result_bindings
             # Case: left operand is a map literal (pattern).
-            elif isinstance(node[1], tuple) and node[1][0] == "map":
-                pattern_ast = node[1]
-                num_entries = len(pattern_ast[1])
+            elif isinstance(left, MapNode):
+                pattern_ast = left
+                num_entries = len(pattern_ast.items)
                 result_bindings = []
                 if len(right_val) < num_entries:
                     return []
@@ -601,77 +866,212 @@ class KGraphInfer:
             return []
 
     def _evaluate_inner(self, node, binding: BindingStack):
-        if not isinstance(node, tuple):
-            return [binding]
-        tag = node[0]
-        if tag == "AND":
-            bindings = [binding]
-            for sub in node[1]:
-                new_bindings = []
-                for b in bindings:
-                    new_bindings.extend(self._evaluate_inner(sub, b))
-                bindings = new_bindings
-            return bindings
-        elif tag == "OR":
-            results = []
-            for sub in node[1]:
-                results.extend(self._evaluate_inner(sub, binding.copy()))
-            return results
-        elif tag == "not":
-            sub_bindings = self._evaluate_inner(node[1], binding.copy())
-            return [] if sub_bindings else [binding]
-        elif tag == "GROUP":
-            return self._evaluate_inner(node[1], binding)
-        elif tag == "annotated_predicate":
-            annotations = node[1]
-            stripped_annotations = [(ann[1], ann[2]) for ann in annotations if
-                                    isinstance(ann, tuple) and ann[0] == "annotation"]
+        return list(self._iter_inner(node, binding))
 
-            new_binding = binding.copy()
-            new_binding.set_annotations(stripped_annotations)
-            return self._evaluate_inner(node[2], new_binding)
-        elif tag == "predicate":
-            pred_name = node[1]
-            args = node[2]
-            if pred_name in self.predicate_registry:
-                return self.predicate_registry[pred_name].evaluate(args, binding)
-            else:
-                raise ValueError(f"Unknown predicate: {pred_name}")
-        elif tag == "unify":
-            new_binding = binding.copy()
-            if self.unify_value(new_binding, node[1], node[3]):
-                return [new_binding]
+    def _iter_inner(self, node, binding: BindingStack):
+        """
+        Lazily evaluate a node, yielding each resulting binding as soon as it
+        is found. AND nodes are evaluated as a pipeline, so the first answer
+        of a join is produced before the later ones are computed.
+        """
+        if not isinstance(node, KGraphNode):
+            return iter((binding,))
+        context = binding.context
+        if context is not None and node.shareable:
+            key = context.shared_key(node, binding)
+            if key is not None:
+                return iter(self._evaluate_shared(key, node, binding))
+        return self._iter_node(node, binding)
+
+    def _evaluate_shared(self, key, node, binding: BindingStack):
+        """
+        Evaluate a node that occurs more than once in the query. The first
+        evaluation records the new bindings each result adds, later ones
+        with the same bound inputs replay them onto the incoming binding.
+        """
+        context = binding.context
+        deltas = context.get_shared(key)
+        if deltas is None:
+            results = list(self._iter_node(node, binding))
+            deltas = []
+            for b in results:
+                added = {var: value for var, value in b.bindings.items() if var not in binding}
+                deltas.append((added, b.get_annotations()))
+            context.put_shared(key, deltas)
+            context.stats.shared_evaluations += 1
+            return results
+        context.stats.shared_reuses += 1
+        context.stats.bindings_reused += len(deltas)
+        results = []
+        for added, annotations in deltas:
+            new_binding = BindingStack(binding.bindings, annotations, context)
+            new_binding.bindings.update(added)
+            results.append(new_binding)
+        return results
+
+    def _iter_and(self, node: AndNode, binding: BindingStack):
+        # chain one generator per conjunct, each consuming the bindings of the previous one
+        items = self._ordered_conjuncts(node, binding)
+        if binding.context is not None:
+            constraints = binding.context.plan.range_constraints(node, items)
+        else:
+            constraints = range_constraints(items)
+        stream = iter((binding,))
+        for i, sub in enumerate(items):
+            if constraints is not None and constraints[i]:
+                stream = self._iter_constrained(sub, stream, constraints[i])
+            elif self._batched_predicate(sub) is not None:
+                stream = self._iter_batched(sub, stream)
             else:
-                return []
-        elif tag == "math_assign":
-            new_binding = binding.copy()
-            result = self.eval_arith(node[2], binding)
-            if result is UNBOUND:
-                return []
-            new_binding.bind(node[1], result)
+                stream = self._iter_conjunct(sub, stream)
+        return stream
+
+    def _ordered_conjuncts(self, node: AndNode, binding: BindingStack):
+        """
+        Return the conjuncts of an AND node in evaluation order. When they
+        call predicates that declare binding modes, the conjuncts are
+        reordered so every call is made in a declared mode, see
+        order_conjuncts. Otherwise they are evaluated as written.
+        """
+        if not declares_modes(node.items, self.predicate_registry):
+            return node.items
+        bound = frozenset(var for var in node.free_vars if var in binding)
+        if binding.context is not None:
+            return binding.context.plan.conjunct_order(node, bound, self.predicate_registry)
+        return order_conjuncts(node.items, bound, self.predicate_registry)
+
+    def _group_by_supported(self, body) -> bool:
+        # the group-by pass evaluates the body with no variables bound,
+        # predicates may not support it, see KGraphPredicate.supports_group_by
+        for node in iter_subnodes(body):
+            if isinstance(node, PredicateNode):
+                predicate = self.predicate_registry.get(node.name)
+                if predicate is not None and not predicate.supports_group_by():
+                    return False
+        items = body.items if isinstance(body, AndNode) else [body]
+        if not declares_modes(items, self.predicate_registry):
+            return True
+        try:
+            order_conjuncts(items, (), self.predicate_registry)
+        except ValueError:
+            return False
+        return True
+
+    def _iter_conjunct(self, node, bindings):
+        for b in bindings:
+            if b.context is not None:
+                b.context.check_cancelled()
+            yield from self._iter_inner(node, b)
+
+    def _iter_constrained(self, node, bindings, constraints):
+        """
+        Evaluate a predicate call with the range constraints of later
+        comparisons pushed down to the predicate, see range_constraints.
+        The call is not shared with other calls, since the constraints
+        change its results.
+        """
+        predicate_node = node.predicate if isinstance(node, AnnotatedPredicateNode) else node
+        predicate = self.predicate_registry.get(predicate_node.name)
+        if predicate is None or not predicate.accepts_constraints():
+            yield from self._iter_conjunct(node, bindings)
+            return
+        for b in bindings:
+            if b.context is not None:
+                b.context.check_cancelled()
+            if isinstance(node, AnnotatedPredicateNode):
+                b = b.copy()
+                b.set_annotations([(ann.name, ann.args) for ann in node.annotations])
+            yield from predicate.evaluate(predicate_node.args, b, constraints)
+
+    def _batched_predicate(self, node):
+        # the predicate called by a conjunct, if it accepts batches
+        predicate_node = node.predicate if isinstance(node, AnnotatedPredicateNode) else node
+        if not isinstance(predicate_node, PredicateNode):
+            return None
+        predicate = self.predicate_registry.get(predicate_node.name)
+        if predicate is None or not predicate.accepts_batches():
+            return None
+        return predicate
+
+    def _iter_batched(self, node, bindings):
+        """
+        Evaluate a predicate call against the incoming bindings in batches
+        of up to predicate_batch_size, see KGraphPredicate.evaluate_batch.
+        Each batch is read before its first result is produced. The call is
+        not shared with other calls, the predicate calls still are.
+        """
+        predicate_node = node.predicate if isinstance(node, AnnotatedPredicateNode) else node
+        predicate = self._batched_predicate(node)
+        if isinstance(node, AnnotatedPredicateNode):
+            annotations = [(ann.name, ann.args) for ann in node.annotations]
+        batch = []
+        for b in bindings:
+            if isinstance(node, AnnotatedPredicateNode):
+                b = b.copy()
+                b.set_annotations(annotations)
+            batch.append(b)
+            if len(batch) < self.predicate_batch_size:
+                continue
+            if b.context is not None:
+                b.context.check_cancelled()
+            for results in predicate.evaluate_batch(predicate_node.args, batch):
+                yield from results
+            batch = []
+        if batch:
+            for results in predicate.evaluate_batch(predicate_node.args, batch):
+                yield from results
+
+    def _iter_or(self, items, binding: BindingStack):
+        for sub in items:
+            if binding.context is not None:
+                binding.context.check_cancelled()
+            yield from self._iter_inner(sub, binding.copy())
+
+    def _iter_not(self, node, binding: BindingStack):
+        # a single solution of the negated expression is enough to fail
+        for _ in self._iter_inner(node, binding.copy()):
+            return
+        yield binding
+
+    def _iter_annotated_predicate(self, node: AnnotatedPredicateNode, binding: BindingStack):
+        stripped_annotations = [(ann.name, ann.args) for ann in node.annotations]
+
+        new_binding = binding.copy()
+        new_binding.set_annotations(stripped_annotations)
+        return self._iter_inner(node.predicate, new_binding)
+
+    def _iter_node(self, node, binding: BindingStack):
+        iterate = self._node_iterators.get(type(node))
+        if iterate is not None:
+            return iterate(node, binding)
+        return iter(self._evaluate_node(node, binding))
+
+    def _evaluate_node(self, node, binding: BindingStack):
+        evaluate = self._node_evaluators.get(type(node))
+        if evaluate is not None:
+            return evaluate(node, binding)
+        return [binding]
+
+    def _eval_predicate(self, node: PredicateNode, binding: BindingStack):
+        if node.name in self.predicate_registry:
+            return self.predicate_registry[node.name].evaluate(node.args, binding)
+        else:
+            raise ValueError(f"Unknown predicate: {node.name}")
+
+    def _eval_unify(self, node: UnifyNode, binding: BindingStack):
+        new_binding = binding.copy()
+        if self.unify_value(new_binding, node.left, node.right):
             return [new_binding]
-        elif tag == "compare":
-            left = node[1]
-            operator = node[2]
-            right = node[3]
-            left_val = self.eval_expr(left, binding)
-            right_val = self.eval_expr(right, binding)
-            if left_val is UNBOUND or right_val is UNBOUND:
-                return []
-            try:
-                if isinstance(left_val, tuple) and isinstance(right_val, tuple):
-                    comp = self._compare_typed(left_val, right_val, operator)
-                else:
-                    comp = self._compare_generic(left_val, right_val, operator)
-            except Exception as e:
-                raise ValueError(f"Error comparing {left_val} and {right_val}: {e}")
-            return [binding] if comp else []
-        elif tag == "in":
-            return self._eval_in(node, binding)
-        elif tag == "subset":
-            return self._eval_subset(node, binding)
         else:
-            return [binding]
+            return []
+
+    def _eval_math_assign(self, node: MathAssignNode, binding: BindingStack):
+        new_binding = binding.copy()
+        result = self.eval_arith(node.expr, binding)
+        if result is UNBOUND:
+            return []
+        new_binding.bind(node.var, result)
+        return [new_binding]
 
     def _evaluate(self, node, binding: BindingStack):
 
@@ -687,20 +1087,82 @@ class KGraphInfer:
         for b in results:
             answer_set.add(b)
 
+        if binding.context is not None:
+            answer_set.set_stats(binding.context.stats)
+
         return answer_set
 
+    def _check_params(self, ast):
+        # placeholders are bound by a PreparedQuery, see prepare()
+        param_names = self.parser.find_params(ast)
+        if param_names:
+            names = ", ".join(f"${name}" for name in param_names)
+            raise ValueError(f"Unbound query parameters: {names}, use prepare() to bind them")
+
+    def _new_context(self, ast, plan: QueryPlan = None):
+        return QueryContext(ast if self.share_subexpressions else None, plan,
+                            predicate_call_cache_size=self.predicate_call_cache_size)
+
     def execute(self, kg_query: str):
 
         kgquery_parsed = self.parser.infer_parse(kg_query)
+        self._check_params(kgquery_parsed)
 
         print(kgquery_parsed)
 
-        initial_binding = BindingStack()
+        initial_binding = BindingStack(context=self._new_context(kgquery_parsed))
 
         answer_set = self._evaluate(kgquery_parsed , initial_binding)
 
         return answer_set
 
+    def execute_many(self, kg_queries: list) -> list:
+        """
+        Execute a batch of related queries, returning one AnswerSet per query.
+        The queries share one QueryContext, so identical predicate calls,
+        shared subexpressions and aggregates are evaluated once for the
+        whole batch. The stats of each AnswerSet are those of the batch.
+        """
+        parsed_queries = [self.parser.infer_parse(kg_query) for kg_query in kg_queries]
+        for parsed in parsed_queries:
+            self._check_params(parsed)
+
+        context = self._new_context(parsed_queries)
+
+        return [self._evaluate(parsed, BindingStack(context=context)) for parsed in parsed_queries]
+
+    def prepare(self, kg_query: str) -> 'PreparedQuery':
+        """
+        Parse and plan a query containing $param placeholders, returning a
+        PreparedQuery that can be run with different parameter values without
+        parsing the query again.
+        """
+        kgquery_parsed = self.parser.infer_parse(kg_query)
+
+        return PreparedQuery(self, kgquery_parsed)
+
+    def iter_answers(self, kg_query: str, cancel_event=None):
+        """
+        Evaluate a query, yielding each answer (as a dictionary of bindings)
+        as soon as it is found instead of after the whole query completes.
+
+        Evaluation stops when the generator is closed, or when cancel_event
+        (e.g. a threading.Event set by another thread) is set, in which case
+        the generator ends without raising.
+        """
+        kgquery_parsed = self.parser.infer_parse(kg_query)
+        self._check_params(kgquery_parsed)
+
+        context = self._new_context(kgquery_parsed)
+        context.cancel_event = cancel_event
+
+        try:
+            for b in self._iter_inner(kgquery_parsed, BindingStack(context=context)):
+                yield b.as_dict()
+                context.check_cancelled()
+        except QueryCancelledError:
+            return
+
     ################################################################
     # previous eval, refactoring
 
@@ -0,0 +1,633 @@
+# Typed AST nodes built by KGraphTransformer.
+#
+# Each node is a small __slots__ object whose fields are those of the tagged
+# tuple it replaces, e.g. PredicateNode(name, args) for
+# ("predicate", name, args). Consumers dispatch on the node type with a
+# table lookup instead of comparing tags.
+#
+# Each node also provides the analysis planners need, computed once on first
+# use and cached on the node:
+#   free_vars   variables that appear anywhere in the node
+#   bound_vars  variables every solution of the node binds
+#   params      names of the $param placeholders in the node
+#   constant    True if the node evaluates to the same value for any binding
+#   hash()      structural hash, equal nodes (==) are structurally identical
+#
+# to_tuple() exports the tagged tuple form, and from_tuple() converts it
+# back, so code written against the tuple AST keeps working. Typed literals
+# such as ("date", "2023-02-18") are values, not nodes, and stay tuples.
+
+# field kinds
+RAW = 0       # a plain string such as a name or an operator
+CHILD = 1     # a sub-AST: a node, a variable, or a literal value
+LIST = 2      # a list of sub-ASTs
+PAIRS = 3     # a list of (key, value) sub-AST pairs
+
+EMPTY = frozenset()
+
+
+def is_variable(value):
+    return isinstance(value, str) and value.startswith("?")
+
+
+def freeze_value(value):
+    """
+    Convert a (possibly nested) value into a hashable form suitable for use
+    in a cache key. Lists and maps are tagged so they never collide with
+    tuples, and booleans are tagged so they never collide with 0 and 1.
+    AST nodes are hashable already and are their own key.
+    """
+    if isinstance(value, KGraphNode):
+        return value
+    if isinstance(value, bool):
+        return ("<bool>", value)
+    if isinstance(value, list):
+        return ("<list>",) + tuple(freeze_value(v) for v in value)
+    if isinstance(value, dict):
+        return ("<map>", frozenset((freeze_value(k), freeze_value(v)) for k, v in value.items()))
+    if isinstance(value, tuple):
+        return tuple(freeze_value(v) for v in value)
+    return value
+
+
+def _union(sets):
+    # reuse a child's set when it is the only non-empty one
+    sets = [s for s in sets if s]
+    if not sets:
+        return EMPTY
+    if len(sets) == 1:
+        return sets[0]
+    return frozenset().union(*sets)
+
+
+def _value_vars(value):
+    if isinstance(value, KGraphNode):
+        return value.free_vars
+    if is_variable(value):
+        return frozenset((value,))
+    if isinstance(value, (list, tuple)):
+        return _union([_value_vars(v) for v in value])
+    return EMPTY
+
+
+def _value_params(value):
+    if isinstance(value, KGraphNode):
+        return value.params
+    if isinstance(value, (list, tuple)):
+        return _union([_value_params(v) for v in value])
+    return EMPTY
+
+
+def _value_constant(value):
+    if isinstance(value, KGraphNode):
+        return value.constant
+    if isinstance(value, (list, tuple)):
+        return all(_value_constant(v) for v in value)
+    return not is_variable(value)
+
+
+def _export(value):
+    # one frame per level of nesting, to_tuple() must handle deep ASTs
+    if isinstance(value, KGraphNode):
+        return value.to_tuple()
+    if isinstance(value, list):
+        exported = []
+        for item in value:
+            exported.append(item.to_tuple() if isinstance(item, KGraphNode) else _export(item))
+        return exported
+    return value
+
+
+def _import(value):
+    if isinstance(value, list):
+        return [from_tuple(v) for v in value]
+    return from_tuple(value)
+
+
+class KGraphNode:
+    """
+    Base class of the AST nodes. Subclasses define the tuple tag, their
+    fields as (name, kind) pairs in tuple order, and whether the evaluator
+    may share their results between occurrences (shareable).
+
+    Nodes are immutable once built; transformations return new nodes that
+    share the unchanged children with the original.
+    """
+    __slots__ = ("_info", "_hash")
+
+    tag = None
+    fields = ()
+    shareable = False
+    # the node has a value of its own (a literal or arithmetic) rather than
+    # producing bindings or depending on a predicate call
+    valued = False
+
+    def _init_meta(self):
+        self._info = None
+        self._hash = None
+
+    # -- children
+
+    def field_values(self) -> tuple:
+        return tuple(getattr(self, name) for name, _ in self.fields)
+
+    def iter_children(self):
+        """
+        Yield the sub-ASTs of the node in order: child nodes, variables and
+        literal values, with the keys and values of map entries in turn.
+        """
+        for name, kind in self.fields:
+            value = getattr(self, name)
+            if kind == CHILD:
+                yield value
+            elif kind == LIST:
+                yield from value
+            elif kind == PAIRS:
+                for key, item in value:
+                    yield key
+                    yield item
+
+    def child_nodes(self):
+        return [child for child in self.iter_children() if isinstance(child, KGraphNode)]
+
+    def map_children(self, func):
+        """
+        Return a node with func applied to every sub-AST, or this node if
+        func returned every sub-AST unchanged.
+        """
+        changed = False
+        values = []
+        for name, kind in self.fields:
+            value = getattr(self, name)
+            if kind == CHILD:
+                new_value = func(value)
+                changed = changed or new_value is not value
+            elif kind == LIST:
+                new_value = [func(item) for item in value]
+                changed = changed or any(n is not o for n, o in zip(new_value, value))
+            elif kind == PAIRS:
+                new_value = [(func(key), func(item)) for key, item in value]
+                changed = changed or any(n[0] is not o[0] or n[1] is not o[1] for n, o in zip(new_value, value))
+            else:
+                new_value = value
+            values.append(new_value)
+        if not changed:
+            return self
+        return type(self)(*values)
+
+    # -- analysis
+
+    def _ensure(self, slot, compute):
+        # computed bottom-up without recursion, so deeply nested ASTs are fine
+        pending = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if getattr(node, slot) is None:
+                pending.append(node)
+                stack.extend(node.child_nodes())
+        for node in reversed(pending):
+            if getattr(node, slot) is None:
+                setattr(node, slot, getattr(node, compute)())
+
+    def _compute_info(self):
+        children = list(self.iter_children())
+        free_vars = _union([_value_vars(child) for child in children])
+        params = _union([_value_params(child) for child in children])
+        constant = self.valued and all(_value_constant(child) for child in children)
+        return free_vars, self._bound_vars(), params, constant
+
+    def _bound_vars(self):
+        return EMPTY
+
+    def _analysis(self):
+        if self._info is None:
+            self._ensure("_info", "_compute_info")
+        return self._info
+
+    @property
+    def free_vars(self) -> frozenset:
+        return self._analysis()[0]
+
+    @property
+    def bound_vars(self) -> frozenset:
+        return self._analysis()[1]
+
+    @property
+    def params(self) -> frozenset:
+        return self._analysis()[2]
+
+    @property
+    def constant(self) -> bool:
+        return self._analysis()[3]
+
+    # -- structural identity
+
+    def _key_parts(self):
+        parts = [self.tag]
+        for name, kind in self.fields:
+            value = getattr(self, name)
+            if kind == LIST:
+                parts.append(tuple(freeze_value(item) for item in value))
+            elif kind == PAIRS:
+                parts.append(tuple((freeze_value(key), freeze_value(item)) for key, item in value))
+            else:
+                parts.append(freeze_value(value))
+        return tuple(parts)
+
+    def _compute_hash(self):
+        return hash(self._key_parts())
+
+    def __hash__(self):
+        if self._hash is None:
+            self._ensure("_hash", "_compute_hash")
+        return self._hash
+
+    def __eq__(self, other):
+        # compared without recursion, so deeply nested ASTs are fine
+        pending = [(self, other)]
+        while pending:
+            a, b = pending.pop()
+            if a is b:
+                continue
+            if type(a) is not type(b) or hash(a) != hash(b):
+                return False
+            for name, kind in a.fields:
+                value_a = getattr(a, name)
+                value_b = getattr(b, name)
+                if kind == CHILD:
+                    pairs = [(value_a, value_b)]
+                elif kind == LIST:
+                    if len(value_a) != len(value_b):
+                        return False
+                    pairs = zip(value_a, value_b)
+                elif kind == PAIRS:
+                    if len(value_a) != len(value_b):
+                        return False
+                    pairs = [pair for entries in zip(value_a, value_b) for pair in zip(*entries)]
+                else:
+                    pairs = [(value_a, value_b)]
+                for item_a, item_b in pairs:
+                    if isinstance(item_a, KGraphNode) and isinstance(item_b, KGraphNode):
+                        pending.append((item_a, item_b))
+                    elif freeze_value(item_a) != freeze_value(item_b):
+                        return False
+        return True
+
+    def __ne__(self, other):
+        return not self.__eq__(other)
+
+    # -- tuple compatibility
+
+    def to_tuple(self) -> tuple:
+        """
+        Export the node and its children as the tagged tuple AST.
+        """
+        parts = [self.tag]
+        for name, kind in self.fields:
+            value = getattr(self, name)
+            if kind == PAIRS:
+                value = [(_export(key), _export(item)) for key, item in value]
+            else:
+                value = _export(value)
+            parts.append(value)
+        return tuple(parts)
+
+    def __iter__(self):
+        # allows unpacking, e.g. tag, name, args = predicate_node
+        yield self.tag
+        yield from self.field_values()
+
+    def __getitem__(self, index):
+        return ((self.tag,) + self.field_values())[index]
+
+    def __len__(self):
+        return len(self.fields) + 1
+
+    def __repr__(self):
+        return repr(self.to_tuple())
+
+
+class AndNode(KGraphNode):
+    __slots__ = ("items",)
+    tag = "AND"
+    fields = (("items", LIST),)
+    shareable = True
+
+    def __init__(self, items: list):
+        self.items = items
+        self._init_meta()
+
+    def _bound_vars(self):
+        return _union([item.bound_vars for item in self.items if isinstance(item, KGraphNode)])
+
+
+class OrNode(KGraphNode):
+    __slots__ = ("items",)
+    tag = "OR"
+    fields = (("items", LIST),)
+    shareable = True
+
+    def __init__(self, items: list):
+        self.items = items
+        self._init_meta()
+
+    def _bound_vars(self):
+        # only the variables bound by every branch
+        sets = [item.bound_vars if isinstance(item, KGraphNode) else EMPTY for item in self.items]
+        if not sets:
+            return EMPTY
+        return frozenset.intersection(*sets) if len(sets) > 1 else sets[0]
+
+
+class GroupNode(KGraphNode):
+    __slots__ = ("expr",)
+    tag = "GROUP"
+    fields = (("expr", CHILD),)
+    shareable = True
+
+    def __init__(self, expr):
+        self.expr = expr
+        self._init_meta()
+
+    def _bound_vars(self):
+        return self.expr.bound_vars if isinstance(self.expr, KGraphNode) else EMPTY
+
+
+class NotNode(KGraphNode):
+    __slots__ = ("expr",)
+    tag = "not"
+    fields = (("expr", CHILD),)
+    shareable = True
+
+    def __init__(self, expr):
+        self.expr = expr
+        self._init_meta()
+
+
+class PredicateNode(KGraphNode):
+    __slots__ = ("name", "args")
+    tag = "predicate"
+    fields = (("name", RAW), ("args", LIST))
+    shareable = True
+
+    def __init__(self, name: str, args: list):
+        self.name = name
+        self.args = args
+        self._init_meta()
+
+    def _bound_vars(self):
+        return frozenset(arg for arg in self.args if is_variable(arg))
+
+
+class AnnotatedPredicateNode(KGraphNode):
+    __slots__ = ("annotations", "predicate")
+    tag = "annotated_predicate"
+    fields = (("annotations", LIST), ("predicate", CHILD))
+    shareable = True
+
+    def __init__(self, annotations: list, predicate):
+        self.annotations = annotations
+        self.predicate = predicate
+        self._init_meta()
+
+    def _bound_vars(self):
+        return self.predicate.bound_vars if isinstance(self.predicate, KGraphNode) else EMPTY
+
+
+class AnnotationNode(KGraphNode):
+    __slots__ = ("name", "args")
+    tag = "annotation"
+    fields = (("name", RAW), ("args", LIST))
+
+    def __init__(self, name: str, args: list):
+        self.name = name
+        self.args = args
+        self._init_meta()
+
+
+class CompareNode(KGraphNode):
+    __slots__ = ("left", "op", "right")
+    tag = "compare"
+    fields = (("left", CHILD), ("op", RAW), ("right", CHILD))
+
+    def __init__(self, left, op: str, right):
+        self.left = left
+        self.op = op
+        self.right = right
+        self._init_meta()
+
+
+class UnifyNode(KGraphNode):
+    __slots__ = ("left", "op", "right")
+    tag = "unify"
+    fields = (("left", CHILD), ("op", RAW), ("right", CHILD))
+
+    def __init__(self, left, op: str, right):
+        self.left = left
+        self.op = op
+        self.right = right
+        self._init_meta()
+
+    def _bound_vars(self):
+        return frozenset(side for side in (self.left, self.right) if is_variable(side))
+
+
+class EqualNode(KGraphNode):
+    __slots__ = ("left", "right")
+    tag = "equal"
+    fields = (("left", CHILD), ("right", CHILD))
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self._init_meta()
+
+
+class MathAssignNode(KGraphNode):
+    __slots__ = ("var", "expr")
+    tag = "math_assign"
+    fields = (("var", CHILD), ("expr", CHILD))
+
+    def __init__(self, var: str, expr):
+        self.var = var
+        self.expr = expr
+        self._init_meta()
+
+    def _bound_vars(self):
+        return frozenset((self.var,))
+
+
+class ArithNode(KGraphNode):
+    """
+    Base class of the binary arithmetic nodes.
+    """
+    __slots__ = ("left", "right")
+    fields = (("left", CHILD), ("right", CHILD))
+    valued = True
+    symbol = None
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self._init_meta()
+
+    def apply(self, left, right):
+        raise NotImplementedError
+
+
+class AddNode(ArithNode):
+    __slots__ = ()
+    tag = "add"
+    symbol = "+"
+
+    def apply(self, left, right):
+        return left + right
+
+
+class SubNode(ArithNode):
+    __slots__ = ()
+    tag = "sub"
+    symbol = "-"
+
+    def apply(self, left, right):
+        return left - right
+
+
+class MulNode(ArithNode):
+    __slots__ = ()
+    tag = "mul"
+    symbol = "*"
+
+    def apply(self, left, right):
+        return left * right
+
+
+class DivNode(ArithNode):
+    __slots__ = ()
+    tag = "div"
+    symbol = "/"
+
+    def apply(self, left, right):
+        return left / right
+
+
+def _pattern_vars(pattern):
+    # variables bound by matching a map literal used as a pattern
+    if isinstance(pattern, MapNode):
+        return frozenset(item for pair in pattern.items for item in pair if is_variable(item))
+    return frozenset((pattern,)) if is_variable(pattern) else EMPTY
+
+
+class InNode(KGraphNode):
+    __slots__ = ("left", "right")
+    tag = "in"
+    fields = (("left", CHILD), ("right", CHILD))
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self._init_meta()
+
+    def _bound_vars(self):
+        return _pattern_vars(self.left)
+
+
+class SubsetNode(KGraphNode):
+    __slots__ = ("left", "right")
+    tag = "subset"
+    fields = (("left", CHILD), ("right", CHILD))
+
+    def __init__(self, left, right):
+        self.left = left
+        self.right = right
+        self._init_meta()
+
+    def _bound_vars(self):
+        return _pattern_vars(self.left)
+
+
+class AggregateNode(KGraphNode):
+    __slots__ = ("op", "var", "body")
+    tag = "aggregate"
+    fields = (("op", RAW), ("var", CHILD), ("body", LIST))
+
+    def __init__(self, op: str, var: str, body: list):
+        self.op = op
+        self.var = var
+        self.body = body
+        self._init_meta()
+
+
+class ListNode(KGraphNode):
+    __slots__ = ("items",)
+    tag = "list"
+    fields = (("items", LIST),)
+    valued = True
+
+    def __init__(self, items: list):
+        self.items = items
+        self._init_meta()
+
+
+class MapNode(KGraphNode):
+    __slots__ = ("items",)
+    tag = "map"
+    fields = (("items", PAIRS),)
+    valued = True
+
+    def __init__(self, items: list):
+        self.items = items
+        self._init_meta()
+
+
+class AtomNode(KGraphNode):
+    __slots__ = ("name",)
+    tag = "atom"
+    fields = (("name", RAW),)
+    valued = True
+
+    def __init__(self, name: str):
+        self.name = name
+        self._init_meta()
+
+
+class ParamNode(KGraphNode):
+    __slots__ = ("name",)
+    tag = "param"
+    fields = (("name", RAW),)
+
+    def __init__(self, name: str):
+        self.name = name
+        self._init_meta()
+
+    def _compute_info(self):
+        return EMPTY, EMPTY, frozenset((self.name,)), False
+
+
+NODE_TYPES = {cls.tag: cls for cls in (
+    AndNode, OrNode, GroupNode, NotNode, PredicateNode, AnnotatedPredicateNode, AnnotationNode,
+    CompareNode, UnifyNode, EqualNode, MathAssignNode, AddNode, SubNode, MulNode, DivNode,
+    InNode, SubsetNode, AggregateNode, ListNode, MapNode, AtomNode, ParamNode)}
+
+
+def from_tuple(ast):
+    """
+    Convert a tagged tuple AST, as exported by to_tuple(), into nodes.
+    Nodes and values that are not AST tuples are returned unchanged.
+    """
+    if not isinstance(ast, tuple) or not ast or not isinstance(ast[0], str):
+        return ast
+    cls = NODE_TYPES.get(ast[0])
+    if cls is None or len(ast) != len(cls.fields) + 1:
+        return ast
+    values = []
+    for (_, kind), value in zip(cls.fields, ast[1:]):
+        if kind == CHILD:
+            value = from_tuple(value)
+        elif kind == LIST:
+            value = [_import(item) for item in value]
+        elif kind == PAIRS:
+            value = [(from_tuple(key), from_tuple(item)) for key, item in value]
+        values.append(value)
+    return cls(*values)
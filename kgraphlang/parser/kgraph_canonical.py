@@ -0,0 +1,177 @@
+import hashlib
+import heapq
+from kgraphlang.parser.kgraph_ast import (
+    KGraphNode, AndNode, OrNode, GroupNode, MapNode, AggregateNode, RAW, is_variable, from_tuple)
+
+# Canonical form of a query AST, so that queries that differ only in
+# variable names, whitespace, comments, grouping parentheses or the order of
+# commutative children get the same AST and the same fingerprint.
+#
+# Children are only reordered where that cannot change the answers:
+#   - the branches of an OR
+#   - the entries of a map literal
+#   - conjuncts of an AND (or an aggregate body) that share no variables;
+#     conjuncts that do share a variable keep their relative order, since
+#     bindings flow from left to right
+# Variables are then renamed ?V0, ?V1, ... in order of first appearance.
+
+CANONICAL_VARIABLE_PREFIX = "?V"
+
+
+def shape_key(value, cache: dict = None) -> str:
+    """
+    Return a sort key for a sub-AST that ignores variable names: the repr of
+    its tuple form with every variable replaced by "?". The keys of nodes
+    are memoized in the cache, if given, by node id.
+    """
+    if is_variable(value):
+        return "'?'"
+    if isinstance(value, list):
+        return "[" + ", ".join(shape_key(v, cache) for v in value) + "]"
+    if isinstance(value, tuple):
+        # a typed literal or a map entry
+        parts = [shape_key(v, cache) for v in value]
+        return "(" + ", ".join(parts) + ("," if len(parts) == 1 else "") + ")"
+    if not isinstance(value, KGraphNode):
+        return repr(value)
+    if cache is not None and id(value) in cache:
+        return cache[id(value)][1]
+    parts = [repr(value.tag)]
+    for name, kind in value.fields:
+        field = getattr(value, name)
+        parts.append(repr(field) if kind == RAW else shape_key(field, cache))
+    key = "(" + ", ".join(parts) + ")"
+    if cache is not None:
+        # the node is kept so that its id is not reused
+        cache[id(value)] = (value, key)
+    return key
+
+
+def _free_vars(value):
+    if isinstance(value, KGraphNode):
+        return value.free_vars
+    return (value,) if is_variable(value) else ()
+
+
+def _flatten(items: list, node_type) -> list:
+    # (a, b), c is a, b, c and (a; b); c is a; b; c
+    flat = []
+    for item in items:
+        if isinstance(item, GroupNode):
+            item = item.expr
+        if isinstance(item, node_type):
+            flat.extend(item.items)
+        else:
+            flat.append(item)
+    return flat
+
+
+def _order_conjuncts(items: list, cache: dict) -> list:
+    """
+    Sort conjuncts by shape, keeping the relative order of every two
+    conjuncts that mention the same variable.
+    """
+    # each conjunct must follow the previous conjunct mentioning each of its variables
+    waiting = [0] * len(items)
+    followers = [[] for _ in items]
+    last_mention = {}
+    for i, item in enumerate(items):
+        before = {last_mention[var] for var in _free_vars(item) if var in last_mention}
+        for j in before:
+            followers[j].append(i)
+        waiting[i] = len(before)
+        for var in _free_vars(item):
+            last_mention[var] = i
+
+    keys = [shape_key(item, cache) for item in items]
+    ready = [(keys[i], i) for i in range(len(items)) if not waiting[i]]
+    heapq.heapify(ready)
+    ordered = []
+    while ready:
+        _, i = heapq.heappop(ready)
+        ordered.append(items[i])
+        for j in followers[i]:
+            waiting[j] -= 1
+            if not waiting[j]:
+                heapq.heappush(ready, (keys[j], j))
+    return ordered
+
+
+def _conjunction(items: list, cache: dict) -> list:
+    # an OR within a conjunction needs its parentheses
+    items = _order_conjuncts(_flatten([_order(item, cache) for item in items], AndNode), cache)
+    return [GroupNode(item) if isinstance(item, OrNode) else item for item in items]
+
+
+def _order(value, cache: dict):
+    if not isinstance(value, KGraphNode):
+        return value
+    if isinstance(value, GroupNode):
+        # kept only where the parent needs it
+        return _order(value.expr, cache)
+    if isinstance(value, AndNode):
+        items = _conjunction(value.items, cache)
+        return items[0] if len(items) == 1 else AndNode(items)
+    if isinstance(value, OrNode):
+        items = _flatten([_order(item, cache) for item in value.items], OrNode)
+        items.sort(key=lambda item: shape_key(item, cache))
+        return OrNode(items)
+    if isinstance(value, AggregateNode):
+        return AggregateNode(value.op, value.var, _conjunction(value.body, cache))
+    if isinstance(value, MapNode):
+        items = [(_order(key, cache), _order(item, cache)) for key, item in value.items]
+        items.sort(key=lambda item: shape_key(item, cache))
+        return MapNode(items)
+    return value.map_children(lambda child: _order(child, cache))
+
+
+def _variables_in_order(value) -> list:
+    # a dict keeps the order of first appearance
+    found = {}
+    stack = [value]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, KGraphNode):
+            if item.free_vars:
+                stack.extend(reversed(list(item.iter_children())))
+        elif isinstance(item, (list, tuple)):
+            stack.extend(reversed(item))
+        elif is_variable(item):
+            found.setdefault(item)
+    return list(found)
+
+
+def _rename(value, names: dict):
+    if isinstance(value, KGraphNode):
+        if not value.free_vars:
+            return value
+        return value.map_children(lambda child: _rename(child, names))
+    if is_variable(value):
+        return names[value]
+    if isinstance(value, list):
+        return [_rename(item, names) for item in value]
+    return value
+
+
+def canonicalize(ast):
+    """
+    Return (canonical AST, variable map) for an AST, where the variable map
+    maps each variable of the query to its name in the canonical AST.
+    """
+    ordered = _order(from_tuple(ast), {})
+    names = {}
+    for var in _variables_in_order(ordered):
+        names[var] = f"{CANONICAL_VARIABLE_PREFIX}{len(names)}"
+    return _rename(ordered, names), names
+
+
+def fingerprint(ast) -> str:
+    """
+    Return a stable fingerprint (a sha256 hex digest) of the canonical form
+    of an AST. It does not depend on the Python process, so it can be used
+    as a key of persistent caches.
+    """
+    canonical, _ = canonicalize(ast)
+    if isinstance(canonical, KGraphNode):
+        canonical = canonical.to_tuple()
+    return hashlib.sha256(repr(canonical).encode("utf-8")).hexdigest()
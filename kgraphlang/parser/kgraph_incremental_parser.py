@@ -0,0 +1,189 @@
+import re
+from collections import deque
+from copy import copy
+from lark.lexer import LexerState, LineCounter, PatternStr
+from lark.utils import TextSlice
+from lark.exceptions import UnexpectedCharacters, UnexpectedToken
+from lark.parsers.lalr_parser_state import ParserState
+
+# Text at the end of the input that does not lex yet, but could once more
+# of the input arrives, e.g. an unterminated string or a typed literal
+# whose type has not been written yet. Each pattern has the character that
+# must arrive before it can lex, if there is one, so that long strings and
+# comments are not lexed again for every chunk.
+PARTIAL_TOKEN_PATTERNS = [(re.compile(p), closing) for p, closing in (
+    (r"'[^']*", "'"),                           # single quoted string or typed literal value
+    (r"'[^']*'\^[A-Za-z]*", None),              # typed literal type, '2023-02-18'^Da
+    (r"'[^']*'\^(Currency|Unit)\([^)]*", None),  # typed literal argument, '10.00'^Currency(US
+    (r'"[^"]*', '"'),                           # double quoted string
+    (r'""', None),
+    (r'"""[\s\S]*', '"'),                       # triple quoted string
+    (r"/\*[\s\S]*", "/"),                       # multi-line comment
+    (r"[?$]", None),                            # variable or parameter sigil
+    (r"!", None),                               # !=
+)]
+
+
+class KGraphIncrementalParser:
+    """
+    Parses a KGraphLang query from chunks of text as they are streamed,
+    e.g. from an LLM that is still generating the query.
+
+    Tokens are lexed and fed to the LALR parser as soon as they can no
+    longer change: the last token of a chunk, and the token before it when
+    the two are adjacent, are held back until more text arrives since they
+    may still grow ("pers" + "on", "5." + "5", "'x'" + "^Date").
+
+    Syntax errors are raised (as Lark's UnexpectedToken or
+    UnexpectedCharacters) as soon as no continuation of the text could
+    make it valid, so that generation can be aborted early.
+
+    feed() returns the top-level conjuncts that were completed by the chunk,
+    parsed into ASTs, so that planning and prefetching can start before the
+    query ends. Once a top-level ';' has been seen the query is a
+    disjunction, and no more conjuncts are returned: those returned so far
+    belong to its first branch.
+    """
+
+    def __init__(self, parser):
+        self.parser = parser
+        self._lexer = parser.parser.parser.lexer
+        self._interactive = parser.parser.parse_interactive("")
+        # tokens are first fed to a copy of the parser state without the
+        # callbacks that build the AST, which may reuse the lists on the stack
+        self._lookahead_conf = copy(self._interactive.parser_state.parse_conf)
+        self._lookahead_conf.callbacks = {}
+        self._text = ""
+        self._line_ctr = LineCounter("\n")
+        self._last_token = None
+        self._depth = 0
+        self._conjunct_start = 0
+        self._disjunction = False
+        self._closed = False
+        # the character needed before the pending text can lex, if any
+        self._waiting_for = None
+        self._string_terminals = [t.pattern.value for t in self._lexer.root_lexer.terminals
+                                  if isinstance(t.pattern, PatternStr)]
+
+    def feed(self, chunk: str) -> list:
+        """
+        Add a chunk of the query text.
+        Returns the ASTs of the top-level conjuncts completed by the chunk.
+        """
+        if self._closed:
+            raise ValueError("Incremental parse is already closed")
+        self._text += chunk
+        if self._waiting_for is not None and self._waiting_for not in chunk:
+            return []
+        return self._advance(final=False)
+
+    def close(self):
+        """
+        Mark the end of the query text and return the AST of the whole query.
+        """
+        if self._closed:
+            raise ValueError("Incremental parse is already closed")
+        self._advance(final=True)
+        self._closed = True
+        return self._interactive.feed_eof(self._last_token)
+
+    def get_text(self) -> str:
+        return self._text
+
+    def _partial_token(self, text: str):
+        """
+        Return (True, closing) if the text is the start of a token, where
+        closing is the character that must arrive before it can lex, or None.
+        Return (False, None) if no more input could make the text lex.
+        """
+        if any(value.startswith(text) for value in self._string_terminals):
+            return True, None
+        for pattern, closing in PARTIAL_TOKEN_PATTERNS:
+            if pattern.fullmatch(text):
+                return True, closing
+        return False, None
+
+    def _advance(self, final: bool) -> list:
+        text = self._text
+        committed = self._interactive.parser_state
+        parser_state = ParserState(self._lookahead_conf, committed.lexer,
+                                   copy(committed.state_stack), copy(committed.value_stack))
+        lexer_state = LexerState(TextSlice(text, 0, len(text)), copy(self._line_ctr), self._last_token)
+
+        tokens = []
+        # the lexer position before each of the last tokens, to hold them back
+        positions = deque(maxlen=3)
+        failure = None
+        error = None
+
+        while True:
+            position = (copy(lexer_state.line_ctr), lexer_state.last_token)
+            lexer = self._lexer.lexers[parser_state.position]
+            try:
+                token = lexer.next_token(lexer_state, parser_state)
+            except EOFError:
+                break
+            except UnexpectedCharacters as e:
+                failure = e
+                break
+            positions.append(position)
+            tokens.append(token)
+            try:
+                parser_state.feed_token(token)
+            except UnexpectedToken as e:
+                error = e
+                break
+
+        held = 0
+        self._waiting_for = None
+
+        if final:
+            if failure is not None:
+                raise failure
+            if error is not None:
+                raise error
+        else:
+            end = failure.pos_in_stream if failure is not None else len(text)
+            if tokens and tokens[-1].end_pos == end:
+                held = 1
+                if len(tokens) > 1 and tokens[-2].end_pos == tokens[-1].start_pos:
+                    held = 2
+
+            if failure is not None:
+                rest = text[failure.pos_in_stream:]
+                partial, self._waiting_for = self._partial_token(rest)
+                if not partial and held:
+                    partial, _ = self._partial_token(text[tokens[-1].start_pos:])
+                if not partial:
+                    raise failure
+
+            if error is not None and not held:
+                raise error
+
+        if held:
+            self._line_ctr, self._last_token = positions[-held]
+            tokens = tokens[:-held]
+        else:
+            # ignored text after the last token, such as a // comment, may still grow
+            self._line_ctr, self._last_token = position
+
+        for token in tokens:
+            committed.feed_token(token)
+
+        return self._complete_conjuncts(tokens)
+
+    def _complete_conjuncts(self, tokens: list) -> list:
+        conjuncts = []
+        for token in tokens:
+            if token.type in ("LPAR", "LSQB", "LBRACE"):
+                self._depth += 1
+            elif token.type in ("RPAR", "RSQB", "RBRACE"):
+                self._depth -= 1
+            elif self._depth == 0 and token.type in ("COMMA", "SEMICOLON", "DOT"):
+                if token.type == "SEMICOLON":
+                    self._disjunction = True
+                elif not self._disjunction:
+                    conjunct = self._text[self._conjunct_start:token.start_pos]
+                    conjuncts.append(self.parser.infer_parse(conjunct + "."))
+                self._conjunct_start = token.end_pos
+        return conjuncts
@@ -1,5 +1,13 @@
 from lark import Lark, Transformer
 import re
+import math
+from decimal import Decimal
+from kgraphlang.parser.kgraph_incremental_parser import KGraphIncrementalParser
+from kgraphlang.parser.kgraph_ast import (
+    KGraphNode, AndNode, OrNode, GroupNode, NotNode, PredicateNode, AnnotatedPredicateNode, AnnotationNode,
+    CompareNode, UnifyNode, EqualNode, MathAssignNode, AddNode, SubNode, MulNode, DivNode,
+    InNode, SubsetNode, AggregateNode, ListNode, MapNode, AtomNode, ParamNode, from_tuple)
+from kgraphlang.parser.kgraph_canonical import canonicalize, fingerprint
 
 # TODO add date, format like "2025-01-01"^Date
 # TODO add time, date-time with ^Time and ^DateTime
@@ -89,9 +97,10 @@ kgraph_grammar = r"""
 
     map_item: map_key "=" map_value
     
-    map_key: URI | SINGLE_QUOTED_STRING | DOUBLE_QUOTED_STRING | TRIPLE_DQ_STRING | VAR
+    map_key: URI | SINGLE_QUOTED_STRING | DOUBLE_QUOTED_STRING | TRIPLE_DQ_STRING | VAR | PARAM
     
     map_value: VAR 
+             | PARAM
              | SINGLE_QUOTED_STRING
              | DOUBLE_QUOTED_STRING
              | TRIPLE_DQ_STRING  
@@ -105,6 +114,7 @@ kgraph_grammar = r"""
     list_item: list_value
     
     list_value: VAR 
+        | PARAM
         | SINGLE_QUOTED_STRING
         | DOUBLE_QUOTED_STRING 
         | TRIPLE_DQ_STRING
@@ -138,6 +148,7 @@ kgraph_grammar = r"""
           | arith_factor
     arith_factor: NUMBER                      -> number
             | VAR                         -> var
+            | PARAM                       -> param
             | "(" arith_expr ")"          -> a_group
             
     value: arith_expr 
@@ -186,6 +197,9 @@ kgraph_grammar = r"""
 
     VAR: "?" /[a-zA-Z0-9_]+/
     
+    // query parameter placeholder, bound to a value when a prepared query is run
+    PARAM: "$" /[a-zA-Z0-9_]+/
+    
     IN: "in"
     SUBSET: "subset"
     
@@ -221,17 +235,17 @@ class KGraphTransformer(Transformer):
         # If there's only one item, return it; if multiple, return an OR node.
         if len(items) == 1:
             return items[0]
-        return ("OR", items)
+        return OrNode(items)
 
     def or_expression(self, items):
         if len(items) == 1:
             return items[0]
-        return ("OR", items)
+        return OrNode(items)
 
     def and_expression(self, items):
         if len(items) == 1:
             return items[0]
-        return ("AND", items)
+        return AndNode(items)
 
     def statement(self, items):
         return items[0]
@@ -242,27 +256,27 @@ class KGraphTransformer(Transformer):
     def unification(self, items):
         # Expect three items: left, EQUAL, right.
         left, _, right = items
-        return ("unify", left, "=", right)
+        return UnifyNode(left, "=", right)
 
     def equality(self, items):
         # [value, EQUAL, value]
-        return ("equal", items[0], items[2])
+        return EqualNode(items[0], items[2])
 
     def math_assign(self, items):
         # [VAR, IS, arith_expr]
-        return ("math_assign", items[0], items[2])
+        return MathAssignNode(items[0], items[2])
 
     def add(self, items):
-        return ("add", items[0], items[1])
+        return AddNode(items[0], items[1])
 
     def sub(self, items):
-        return ("sub", items[0], items[1])
+        return SubNode(items[0], items[1])
 
     def mul(self, items):
-        return ("mul", items[0], items[1])
+        return MulNode(items[0], items[1])
 
     def div(self, items):
-        return ("div", items[0], items[1])
+        return DivNode(items[0], items[1])
 
     def number(self, items):
         return items[0]
@@ -277,17 +291,20 @@ class KGraphTransformer(Transformer):
         return items[0]
 
     def group(self, items):
-        return ("GROUP", items[0])
+        return GroupNode(items[0])
 
     def term(self, items):
         return items[0]
 
     def not_expr(self, items):
-        return ("not", items[0])
+        return NotNode(items[0])
 
     def var(self, items):
         return items[0]
 
+    def param(self, items):
+        return items[0]
+
     def comparison(self, items):
         left, operator, right = items
 
@@ -300,7 +317,7 @@ class KGraphTransformer(Transformer):
                     f"Invalid comparison: {left} {operator} {right} (Cannot compare BOOLEAN or LIST values)"
                 )
 
-        return ("compare", left, str(operator), right)
+        return CompareNode(left, str(operator), right)
 
     def annotated_predicate(self, items):
         """
@@ -309,30 +326,30 @@ class KGraphTransformer(Transformer):
         """
         predicate = items[-1]
         annotations = items[:-1]
-        return ("annotated_predicate", annotations, predicate)
+        return AnnotatedPredicateNode(annotations, predicate)
 
     def annotation(self, items):
         """
         items: [NAME, (optional) annotation arguments]
         For example:
             @deprecated("use new_predicate")
-        becomes: ("annotation", "deprecated", [ "use new_predicate" ])
+        becomes: AnnotationNode("deprecated", [ "use new_predicate" ])
         """
         # items[0] is the annotation name.
         name = items[0]
         args = items[1] if len(items) > 1 else []
         # Flatten each argument if it is wrapped in a single-element list.
         flat_args = [arg[0] if isinstance(arg, list) and len(arg) == 1 else arg for arg in args]
-        return ("annotation", name, flat_args)
+        return AnnotationNode(name, flat_args)
 
     def predicate_call(self, items):
         name, *args = items
         for arg in args:
             # Check if an argument is already a predicate call node.
-            if isinstance(arg, tuple) and arg[0] == "predicate":
+            if isinstance(arg, PredicateNode):
                 raise ValueError(f"Nested predicate calls are disallowed: found nested call in {name}().")
 
-        return ("predicate", str(name), args)
+        return PredicateNode(str(name), args)
 
     def annotation_args(self, items):
         # Return the list of annotation arguments.
@@ -358,10 +375,10 @@ class KGraphTransformer(Transformer):
         return children[0]
 
     def atom(self, items):
-        return ("atom", items[0])
+        return AtomNode(items[0])
 
     def list_collection(self, items):
-        return ("list", items)
+        return ListNode(items)
 
     def list_item(self, items):
         # items is typically a single element list from Lark
@@ -382,16 +399,16 @@ class KGraphTransformer(Transformer):
         # items is either empty (if collection_body was not called),
         # or a single subnode from collection_body.
         if not items:
-            return ("list", [])  # empty => parse as empty list
-        return items[0]  # either ("list", [...]) or ("map", [...])
+            return ListNode([])  # empty => parse as empty list
+        return items[0]  # either a ListNode or a MapNode
 
     def collection_body(self, items):
         # This can match map_items, list_items, or be empty
         # If empty, the parser won't even call this method,
-        return items[0] if items else ("list", [])
+        return items[0] if items else ListNode([])
 
     def map_collection(self, items):
-        return ("map", items)
+        return MapNode(items)
 
     def map_item(self, pair):
         # pair = [map_key, map_value]
@@ -412,20 +429,20 @@ class KGraphTransformer(Transformer):
         # items: [value, IN, list_expr]
         left = items[0]
         right = items[2]
-        return ("in", left, right)
+        return InNode(left, right)
 
     def subset_comparison(self, items):
         # items: [list_expr, SUBSET, list_expr]
         left = items[0]
         right = items[2]
-        return ("subset", left, right)
+        return SubsetNode(left, right)
 
     def aggregation_expr(self, items):
         op_token = items[0]
         op = op_token.value if hasattr(op_token, "value") else str(op_token)
         var = items[2]
         body = items[4]
-        return ("aggregate", op, var, body)
+        return AggregateNode(op, var, body)
 
     def aggregate_operator(self, items):
         token = items[0]
@@ -437,6 +454,10 @@ class KGraphTransformer(Transformer):
     def VAR(self, token):
         return str(token)
 
+    def PARAM(self, token):
+        # "$name" => ParamNode("name")
+        return ParamNode(str(token)[1:])
+
     def SINGLE_QUOTED_STRING(self, token):
         text = token[1:-1]
         text = bytes(text, "utf-8").decode("unicode_escape")
@@ -554,21 +575,125 @@ class KGraphTransformer(Transformer):
         return token.value
 
 
+# DSL form of the typed literals, which stay tuples in the AST
+TYPED_LITERAL_FORMATS = {
+    "date": "'{0}'^Date",
+    "dateTime": "'{0}'^DateTime",
+    "time": "'{0}'^Time",
+    "duration": "'{0}'^Duration",
+    "uri": "'{0}'^URI",
+    "currency": "'{0}'^Currency({1})",
+    "unit": "'{0}'^Unit(\"{1}\")",
+    "geolocation": "'{0},{1}'^GeoLocation",
+}
+
+
+def quote_string(text: str) -> str:
+    """
+    Return the DSL string literal of a string, as read back by the parser:
+    quotes, backslashes, control and non-ASCII characters are written as
+    escapes, which the parser decodes. Strings with line breaks keep them
+    in a triple quoted string, the empty string is written as one too.
+    """
+    multi_line = not text or "\n" in text
+    quote = '"' if multi_line else "'"
+    escaped = []
+    for ch in text:
+        if ch == quote:
+            escaped.append(f"\\x{ord(ch):02x}")
+        elif ch == "\n" and multi_line:
+            escaped.append(ch)
+        elif ch == "\\" or not (" " <= ch <= "~"):
+            escaped.append(ch.encode("unicode_escape").decode("ascii"))
+        else:
+            escaped.append(ch)
+    if multi_line:
+        return '"""' + "".join(escaped) + '"""'
+    return "'" + "".join(escaped) + "'"
+
+
+def format_number(value) -> str:
+    """
+    Return the DSL number literal of an int or a float. Floats are written
+    without an exponent and always with a decimal point, so they are read
+    back as floats.
+    """
+    if isinstance(value, int) or not math.isfinite(value):
+        return str(value)
+    text = format(Decimal(repr(value)), "f")
+    return text if "." in text else text + ".0"
+
+
 class KGraphInferParser:
 
     def __init__(self):
-        self.parser = Lark(kgraph_grammar, parser="lalr")
         self.transformer = KGraphTransformer()
+        # the transformer is applied as each rule is reduced, so the AST is
+        # built in a single pass without an intermediate parse tree
+        # self.transformer can still be used on trees built by hand
+        self.parser = Lark(kgraph_grammar, parser="lalr", transformer=self.transformer)
+        self._dsl_writers = {
+            OrNode: self._dsl_or,
+            AndNode: self._dsl_and,
+            GroupNode: self._dsl_group,
+            NotNode: self._dsl_not,
+            PredicateNode: self._dsl_predicate,
+            AnnotatedPredicateNode: self._dsl_annotated_predicate,
+            AnnotationNode: self._dsl_annotation,
+            CompareNode: self._dsl_compare,
+            UnifyNode: self._dsl_unify,
+            EqualNode: self._dsl_unify,
+            MathAssignNode: self._dsl_math_assign,
+            AddNode: self._dsl_arith,
+            SubNode: self._dsl_arith,
+            MulNode: self._dsl_arith,
+            DivNode: self._dsl_arith,
+            InNode: self._dsl_in,
+            SubsetNode: self._dsl_subset,
+            AggregateNode: self._dsl_aggregate,
+            ListNode: self._dsl_list,
+            MapNode: self._dsl_map,
+            AtomNode: self._dsl_atom,
+            ParamNode: self._dsl_param,
+        }
 
     def infer_parse(self, kgraph_infer: str):
         try:
-            tree = self.parser.parse(kgraph_infer)
-            parsed_result = self.transformer.transform(tree)
+            parsed_result = self.parser.parse(kgraph_infer)
             return parsed_result
         except Exception as e:
             # Wrap or re-raise for a friendlier message if desired
             raise e
 
+    def incremental_parse(self) -> KGraphIncrementalParser:
+        """
+        Start parsing a query that arrives in chunks, e.g. while an LLM is
+        still generating it. Feed the chunks with feed(), which returns the
+        completed top-level conjuncts, and call close() for the final AST.
+        Syntax errors are raised by feed() as soon as they are certain.
+        """
+        return KGraphIncrementalParser(self)
+
+    def canonicalize(self, ast):
+        """
+        Return (canonical AST, variable map) for a query AST. Queries that
+        differ only in variable names, formatting, comments, grouping or the
+        order of commutative children have the same canonical AST.
+        The variable map maps the query's variables to the canonical ones,
+        so answers cached for the canonical query can be renamed back.
+        """
+        return canonicalize(ast)
+
+    def fingerprint(self, query) -> str:
+        """
+        Return a stable fingerprint of a query (text or AST) for use as the
+        key of plan, result and statistics caches. Queries with the same
+        canonical AST have the same fingerprint.
+        """
+        if isinstance(query, str):
+            query = self.infer_parse(query)
+        return fingerprint(query)
+
     def infer_unparse(self, node):
         """
         Convert the parse tree (AST) to a DSL string + final period.
@@ -581,127 +706,30 @@ class KGraphInferParser:
         Convert the AST node (the structure returned by KGraphTransformer)
         back into a DSL string. This won't reproduce original whitespace or comments,
         but yields a valid DSL expression.
+        Tagged tuple ASTs (see KGraphNode.to_tuple) are accepted as well.
         """
-        # 1) If it's a tuple, check its "tag" (the first element) to decide how to handle:
-        if isinstance(node, tuple):
-
-            tag = node[0]
-
-            if tag == "OR":
-                return "; ".join(self.ast_to_dsl(s) for s in node[1])
-            elif tag == "AND":
-                return ", ".join(self.ast_to_dsl(s) for s in node[1])
-            elif tag == "math_assign":
-                return f"{self.ast_to_dsl(node[1])} is {self.ast_to_dsl(node[2])}"
-            elif tag == "not":
-                # node = ("not", expr)
-                return f"not({self.ast_to_dsl(node[1])})"
-            elif tag == "unify":
-                # For unification (assignment), left-hand side is a variable.
-                return f"{self.ast_to_dsl(node[1])} = {self.ast_to_dsl(node[3])}"
-            elif tag == "equal":
-                # For equality tests between arbitrary values.
-                return f"{self.ast_to_dsl(node[1])} = {self.ast_to_dsl(node[2])}"
-
-            elif tag == "compare":
-                # node = ('compare', left, operator_string, right)
-                left_side = self.ast_to_dsl(node[1])
-                operator = node[2]
-                right_side = self.ast_to_dsl(node[3])
-                return f"{left_side} {operator} {right_side}"
-            elif tag == "predicate":
-                # node = ('predicate', name_string, [arg1, arg2, ...])
-                predicate_name = node[1]
-                args = node[2]
-                arg_str = ", ".join(self.ast_to_dsl(a) for a in args)
-                return f"{predicate_name}({arg_str})"
-
-            elif tag == "GROUP":
-                if top_level:
-                    return self.ast_to_dsl(node[1], top_level=True)
-                else:
-                    return f"({self.ast_to_dsl(node[1], top_level=False)})"
-
-            elif tag == "atom":
-                # node = ('atom', 'a')
-                return node[1]  # just return 'a'
-
-            elif tag == "annotated_predicate":
-                # node = ("annotated_predicate", annotations, predicate)
-                annotations = node[1]
-                predicate = node[2]
-                # Unparse each annotation and join them with a space before the predicate.
-                annotations_str = " ".join(self.ast_to_dsl(a) for a in annotations)
-                return f"{annotations_str} {self.ast_to_dsl(predicate)}".strip()
-
-            elif tag == "annotation":
-                # node = ("annotation", name, args)
-                name = node[1]
-                args = node[2]
-                if args:
-                    args_str = ", ".join(self.ast_to_dsl(arg) for arg in args)
-                    return f"@{name}({args_str})"
-                else:
-                    return f"@{name}"
-
-            elif tag == "list":
-                items = node[1]
-                rendered = ", ".join(self.ast_to_dsl(i) for i in items)
-                return f"[{rendered}]"
-            elif tag == "map":
-                pairs = node[1]
-                rendered = []
-                for (k, v) in pairs:
-                    k_str = self.ast_to_dsl(k)
-                    v_str = self.ast_to_dsl(v)
-                    rendered.append(f"{k_str} = {v_str}")
-                return f"[{', '.join(rendered)}]"
-
-            elif tag == "date":
-                return f"'{node[1]}'^Date"
-            elif tag == "dateTime":
-                return f"'{node[1]}'^DateTime"
-            elif tag == "time":
-                return f"'{node[1]}'^Time"
-            elif tag == "duration":
-                return f"'{node[1]}'^Duration"
-            elif tag == "uri":
-                return f"'{node[1]}'^URI"
-            elif tag == "currency":
-                return f"'{node[1]}'^Currency({node[2]})"
-            elif tag == "unit":
-                return f"'{node[1]}'^Unit(\"{node[2]}\")"
-            elif tag == "geolocation":
-                return f"'{node[1]},{node[2]}'^GeoLocation"
-            elif tag == "in":
-                return f"{self.ast_to_dsl(node[1])} in {self.ast_to_dsl(node[2])}"
-            elif tag == "subset":
-                return f"{self.ast_to_dsl(node[1])} subset {self.ast_to_dsl(node[2])}"
-            if tag == "aggregate":
-                op = node[1]
-                var = node[2]
-                body = ", ".join(self.ast_to_dsl(exp) for exp in node[3])
-                return f"{op}{{ {var} | {body} }}"
-            elif tag == "add":
-                return f"{self.ast_to_dsl(node[1])} + {self.ast_to_dsl(node[2])}"
-            elif tag == "sub":
-                return f"{self.ast_to_dsl(node[1])} - {self.ast_to_dsl(node[2])}"
-            elif tag == "mul":
-                return f"{self.ast_to_dsl(node[1])} * {self.ast_to_dsl(node[2])}"
-            elif tag == "div":
-                return f"{self.ast_to_dsl(node[1])} / {self.ast_to_dsl(node[2])}"
-            else:
-                # fallback
-                return str(node)
+        # 1) AST nodes are written by the writer for their type
+        if isinstance(node, KGraphNode):
+            return self._dsl_writers[type(node)](node, top_level)
+
+        # 2) a tuple is a typed literal, or an AST in tuple form
+        elif isinstance(node, tuple):
+            if node and node[0] in TYPED_LITERAL_FORMATS:
+                return TYPED_LITERAL_FORMATS[node[0]].format(*node[1:])
+            converted = from_tuple(node)
+            if isinstance(converted, KGraphNode):
+                return self.ast_to_dsl(converted, top_level)
+            # fallback
+            return str(node)
 
-        # 2) If it's a list, that likely represents a DSL [ ... ] structure
+        # 3) If it's a list, that likely represents a DSL [ ... ] structure
         elif isinstance(node, list):
-            # e.g. [ 'foo', True, 42, ('atom','a') ]
+            # e.g. [ 'foo', True, 42, AtomNode('a') ]
             # Convert each element, separated by ", "
             inner = ", ".join(self.ast_to_dsl(x) for x in node)
             return f"[ {inner} ]"
 
-        # 3) If it's a basic type: str, bool, int/float
+        # 4) If it's a basic type: str, bool, int/float
         elif isinstance(node, str):
             # We have to decide if it's a variable like "?x" or a raw string that needs quotes.
             # Usually, your AST might keep track of what is a 'STRING' vs a 'VAR' vs an 'atom'.
@@ -713,90 +741,181 @@ class KGraphInferParser:
             if node.startswith("?"):
                 return node  # it's a variable
             else:
-                # We treat it as a DSL string => quote it
-                # we don't remember if something was originally a multi-line string
-                # but we can check for newlines and make it one
-                if "\n" in node or "\r" in node:
-                    return f'"""{node}"""'
-                return f"'{node}'"
+                # We treat it as a DSL string => quote and escape it,
+                # a multi-line string is written as a triple quoted one
+                return quote_string(node)
 
         elif isinstance(node, bool):
             # DSL booleans are "true"/"false"
             return "true" if node else "false"
 
         elif isinstance(node, (int, float)):
-            return str(node)
+            return format_number(node)
 
-        # 4) Fallback
+        # 5) Fallback
         else:
             return str(node)
 
+    def _dsl_or(self, node, top_level):
+        return "; ".join(self.ast_to_dsl(s) for s in node.items)
+
+    def _dsl_and(self, node, top_level):
+        return ", ".join(self.ast_to_dsl(s) for s in node.items)
+
+    def _dsl_group(self, node, top_level):
+        if top_level:
+            return self.ast_to_dsl(node.expr, top_level=True)
+        return f"({self.ast_to_dsl(node.expr, top_level=False)})"
+
+    def _dsl_not(self, node, top_level):
+        return f"not({self.ast_to_dsl(node.expr)})"
+
+    def _dsl_predicate(self, node, top_level):
+        arg_str = ", ".join(self.ast_to_dsl(a) for a in node.args)
+        return f"{node.name}({arg_str})"
+
+    def _dsl_annotated_predicate(self, node, top_level):
+        # Unparse each annotation and join them with a space before the predicate.
+        annotations_str = " ".join(self.ast_to_dsl(a) for a in node.annotations)
+        return f"{annotations_str} {self.ast_to_dsl(node.predicate)}".strip()
+
+    def _dsl_annotation(self, node, top_level):
+        if node.args:
+            args_str = ", ".join(self.ast_to_dsl(arg) for arg in node.args)
+            return f"@{node.name}({args_str})"
+        return f"@{node.name}"
+
+    def _dsl_compare(self, node, top_level):
+        return f"{self.ast_to_dsl(node.left)} {node.op} {self.ast_to_dsl(node.right)}"
+
+    def _dsl_unify(self, node, top_level):
+        # For unification (assignment), left-hand side is a variable.
+        # EqualNode, an equality test between arbitrary values, is written the same way.
+        return f"{self.ast_to_dsl(node.left)} = {self.ast_to_dsl(node.right)}"
+
+    def _dsl_math_assign(self, node, top_level):
+        return f"{self.ast_to_dsl(node.var)} is {self.ast_to_dsl(node.expr)}"
+
+    def _dsl_arith(self, node, top_level):
+        return f"{self.ast_to_dsl(node.left)} {node.symbol} {self.ast_to_dsl(node.right)}"
+
+    def _dsl_in(self, node, top_level):
+        return f"{self.ast_to_dsl(node.left)} in {self.ast_to_dsl(node.right)}"
+
+    def _dsl_subset(self, node, top_level):
+        return f"{self.ast_to_dsl(node.left)} subset {self.ast_to_dsl(node.right)}"
+
+    def _dsl_aggregate(self, node, top_level):
+        body = ", ".join(self.ast_to_dsl(exp) for exp in node.body)
+        return f"{node.op}{{ {node.var} | {body} }}"
+
+    def _dsl_list(self, node, top_level):
+        rendered = ", ".join(self.ast_to_dsl(i) for i in node.items)
+        return f"[{rendered}]"
+
+    def _dsl_map(self, node, top_level):
+        rendered = [f"{self.ast_to_dsl(k)} = {self.ast_to_dsl(v)}" for k, v in node.items]
+        return f"[{', '.join(rendered)}]"
+
+    def _dsl_atom(self, node, top_level):
+        return node.name
+
+    def _dsl_param(self, node, top_level):
+        return f"${node.name}"
+
+    def value_to_ast(self, value):
+        """
+        Convert a Python value, such as a query result, into the AST form of
+        the equivalent literal: lists (and the tuples of set results) become
+        ListNode and dicts become MapNode. Strings, numbers, booleans, typed
+        literals and nodes are their own AST.
+
+        Raises ValueError for values that have no literal form, such as None,
+        NaN, a string starting with '?', which would be read as a variable,
+        or a map key that is not a string.
+        """
+        if isinstance(value, list):
+            return ListNode([self.value_to_ast(v) for v in value])
+        elif isinstance(value, dict):
+            for k in value:
+                if not isinstance(k, str):
+                    raise ValueError(f"Map key {k!r} has no KGraphLang literal form, keys must be strings")
+            return MapNode([(self.value_to_ast(k), self.value_to_ast(v)) for k, v in value.items()])
+        elif isinstance(value, str):
+            if value.startswith("?"):
+                raise ValueError(f"String {value!r} has no KGraphLang literal form, it would be read as a variable")
+        elif isinstance(value, float):
+            if not math.isfinite(value):
+                raise ValueError(f"Number {value!r} has no KGraphLang literal form")
+        elif isinstance(value, tuple):
+            if value and value[0] in TYPED_LITERAL_FORMATS:
+                return value
+            node = from_tuple(value)
+            if isinstance(node, KGraphNode):
+                return node
+            return ListNode([self.value_to_ast(v) for v in value])
+        elif not isinstance(value, (int, KGraphNode)):
+            raise ValueError(f"Value {value!r} of type {type(value).__name__} has no KGraphLang literal form")
+        return value
+
+    def find_params(self, ast):
+        """
+        Return the names of the $param placeholders in the AST, in order of
+        first appearance.
+        """
+        names = []
+        stack = [from_tuple(ast)]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, ParamNode):
+                if node.name not in names:
+                    names.append(node.name)
+            elif isinstance(node, KGraphNode) and node.params:
+                stack.extend(reversed(node.child_nodes()))
+        return names
+
+    def bind_params(self, ast, params: dict):
+        """
+        Return a copy of the AST with every ParamNode placeholder replaced
+        by the AST of params[name]. Sub-ASTs without placeholders are shared
+        with the original, not copied.
+        """
+        return self._bind_params(from_tuple(ast), params)
+
+    def _bind_params(self, node, params: dict):
+        if isinstance(node, ParamNode):
+            if node.name not in params:
+                raise ValueError(f"Missing value for query parameter: ${node.name}")
+            return self.value_to_ast(params[node.name])
+        if not isinstance(node, KGraphNode) or not node.params:
+            return node
+        return node.map_children(lambda child: self._bind_params(child, params))
+
     def transform_ast(self, ast, predicate_call_transform):
         """
         Recursively walk the already-transformed AST, applying 'predicate_call_transform'
         whenever we see a predicate call.
 
-        :param ast: The (tuple, list, or basic type) AST returned by query_parse().
-        :param predicate_call_transform: A function that takes a ("predicate", name, args) node
-                                   and returns a (possibly modified) node.
+        :param ast: The AST returned by infer_parse() (nodes, or the tagged tuple form).
+        :param predicate_call_transform: A function that takes a PredicateNode, which unpacks
+                                   like the ("predicate", name, args) tuple, and returns a
+                                   (possibly modified) node or tuple.
 
-        :return: A new (or mutated) AST node with child nodes transformed.
+        :return: A new AST with child nodes transformed, sharing the unchanged ones.
         """
+        ast = from_tuple(ast)
 
-        # 1) If 'ast' is a tuple, dispatch on the first element to see what node type it is.
-        if isinstance(ast, tuple):
-            tag = ast[0]
-
-            if tag == "predicate":
-                # ast = ("predicate", predicate_name, [arg1, arg2, ...])
-                predicate_name = ast[1]
-                args = ast[2]
-
-                # Recursively transform each argument in case they are sub-ASTs.
-                new_args = [self.transform_ast(a, predicate_call_transform) for a in args]
-                # Build a new predicate node with transformed arguments
-                new_predicate_node = ("predicate", predicate_name, new_args)
-
-                # Now let the user callback decide how/if to modify this call.
-                return predicate_call_transform(new_predicate_node)
-
-            elif tag in ("AND", "OR"):
-                # e.g. ("AND", [item1, item2, ...]) or ("OR", [item1, item2, ...])
-                items = ast[1]
-                new_items = [self.transform_ast(i, predicate_call_transform) for i in items]
-                return (tag, new_items)
-
-            elif tag == "unify":
-                var_name = ast[1]
-                eq = ast[2]
-                right_side = ast[3]
-                new_right_side = self.transform_ast(right_side, predicate_call_transform)
-                return ("unify", var_name, eq, new_right_side)
-
-            elif tag == "compare":
-                left = ast[1]
-                op = ast[2]
-                right = ast[3]
-                new_right = self.transform_ast(right, predicate_call_transform)
-                return ("compare", left, op, new_right)
-
-            elif tag == "GROUP":
-                subexpr = ast[1]
-                new_subexpr = self.transform_ast(subexpr, predicate_call_transform)
-                return ("GROUP", new_subexpr)
-
-            elif tag == "atom":
-                # e.g. ("atom", "a")
-                # Typically nothing special to transform, return as-is
-                return ast
-
-            elif tag == "not":
-                new_expr = self.transform_ast(ast[1], predicate_call_transform)
-                return ("not", new_expr)
+        if isinstance(ast, list):
+            return [self.transform_ast(item, predicate_call_transform) for item in ast]
 
+        if not isinstance(ast, KGraphNode):
             return ast
 
-        elif isinstance(ast, list):
-            return [self.transform_ast(item, predicate_call_transform) for item in ast]
+        # transform the children first, e.g. the predicate of an annotated_predicate
+        new_ast = ast.map_children(lambda child: self.transform_ast(child, predicate_call_transform))
+
+        if isinstance(new_ast, PredicateNode):
+            # let the user callback decide how/if to modify this call.
+            return from_tuple(predicate_call_transform(new_ast))
 
-        return ast
+        return new_ast
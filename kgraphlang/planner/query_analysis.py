@@ -0,0 +1,255 @@
+# Static analysis over the AST nodes produced by KGraphTransformer.
+# These helpers are used by the evaluator to find work that can be shared
+# within a query, such as repeated predicate calls in OR branches and
+# aggregate bodies. The per-node analysis itself (variables, structural
+# hash) is computed and cached by the nodes, see kgraph_ast.
+# The binding mode helpers order conjuncts so that each predicate call is
+# made in a binding mode (adornment, e.g. "bf") the predicate declares.
+
+from kgraphlang.parser.kgraph_ast import (
+    KGraphNode, AndNode, AggregateNode, AnnotatedPredicateNode, PredicateNode, CompareNode,
+    is_variable, freeze_value)
+
+# cost of a predicate call in a mode without a declared cost
+DEFAULT_MODE_COST = 1.0
+
+# comparisons that can be pushed into predicate calls, with the operator
+# for the same comparison written the other way around
+RANGE_OPERATORS = {"<": ">", "<=": ">=", ">": "<", ">=": "<="}
+
+def structural_key(node):
+    """
+    Return a hashable key for an AST node. Two nodes have the same key
+    exactly when they are structurally identical.
+    """
+    return freeze_value(node)
+
+
+def node_variables(node):
+    """
+    Return the set of variable names that appear anywhere in the node,
+    including inside aggregate bodies, lists and maps.
+    """
+    if isinstance(node, KGraphNode):
+        return node.free_vars
+    return frozenset((node,)) if is_variable(node) else frozenset()
+
+
+def iter_subnodes(node):
+    """
+    Yield every node in the AST, parents before children.
+    """
+    stack = [node]
+    while stack:
+        item = stack.pop()
+        if isinstance(item, KGraphNode):
+            yield item
+            stack.extend(reversed(item.child_nodes()))
+        elif isinstance(item, list):
+            stack.extend(reversed(item))
+
+
+def find_shared_subexpressions(ast, key=structural_key):
+    """
+    Find the structurally identical sub-ASTs that occur more than once in
+    the query, e.g. person(?Person) in both a collection{} and a set{}.
+    Returns the set of structural keys of those sub-ASTs; only binding
+    producing (shareable) nodes are considered, aggregates are cached separately.
+    The key function may be given to reuse structural keys already computed.
+    """
+    counts = {}
+    # the predicate inside an annotated_predicate is shared through its parent
+    wrapped = set()
+    for node in iter_subnodes(ast):
+        if isinstance(node, AnnotatedPredicateNode):
+            wrapped.add(id(node.predicate))
+        elif id(node) in wrapped:
+            continue
+        if node.shareable:
+            node_key = key(node)
+            counts[node_key] = counts.get(node_key, 0) + 1
+    return {node_key for node_key, count in counts.items() if count > 1}
+
+
+def aggregate_body(agg_node: AggregateNode):
+    """
+    Return the body of an aggregate node as a single AST.
+    """
+    body = agg_node.body
+    if len(body) == 1:
+        return body[0]
+    return AndNode(body)
+
+
+def _conjuncts(node):
+    if isinstance(node, AndNode):
+        result = []
+        for sub in node.items:
+            result.extend(_conjuncts(sub))
+        return result
+    return [node]
+
+
+def can_group_by(body, correlated):
+    """
+    Check whether an aggregate body can be evaluated once with the correlated
+    variables unbound and its results grouped by their values, instead of
+    being evaluated once per outer binding.
+
+    This holds when each correlated variable is first mentioned, in conjunct
+    order, as a direct argument of a predicate call: the call then generates
+    every value the variable could have been bound to, and filtering its
+    results gives the same answers as calling it with the variable bound.
+
+    It does not hold when a call in the body has annotations, such as
+    @limit('1'): a predicate honouring them would apply them to the results
+    of all the groups at once instead of to those of each.
+    """
+    for node in iter_subnodes(body):
+        if isinstance(node, AnnotatedPredicateNode) and node.annotations:
+            return False
+    pending = set(correlated)
+    for conjunct in _conjuncts(body):
+        mentioned = pending & node_variables(conjunct)
+        if not mentioned:
+            continue
+        predicate = conjunct.predicate if isinstance(conjunct, AnnotatedPredicateNode) else conjunct
+        if not isinstance(predicate, PredicateNode) or not mentioned.issubset(predicate.args):
+            return False
+        pending -= mentioned
+    return not pending
+
+
+def binding_mode(args, bound) -> str:
+    """
+    Return the binding mode of a predicate call, one character per argument:
+    'b' for a bound variable or a value, 'f' for a free variable. bound is
+    anything that supports "var in bound", such as a BindingStack or a set.
+    """
+    return "".join("f" if is_variable(arg) and arg not in bound else "b" for arg in args)
+
+
+def mode_satisfies(call_mode: str, mode: str) -> bool:
+    """
+    Check whether a call in call_mode can use a declared mode, i.e. every
+    argument the declared mode needs bound is bound in the call.
+    """
+    return all(c == "b" or m == "f" for c, m in zip(call_mode, mode))
+
+
+def _called_predicate(node, predicate_registry: dict):
+    # the predicate call of a conjunct, with the predicate if it declares binding modes
+    if isinstance(node, AnnotatedPredicateNode):
+        node = node.predicate
+    if not isinstance(node, PredicateNode):
+        return None, None
+    predicate = predicate_registry.get(node.name)
+    if predicate is None or not predicate.get_modes():
+        return node, None
+    return node, predicate
+
+
+def declares_modes(items, predicate_registry: dict) -> bool:
+    """
+    Check whether any of the conjuncts calls a predicate that declares
+    binding modes, otherwise their order does not need to change.
+    """
+    return any(_called_predicate(item, predicate_registry)[1] is not None for item in items)
+
+
+def order_conjuncts(items, bound, predicate_registry: dict) -> list:
+    """
+    Order the conjuncts of an AND, evaluated with the given variables bound,
+    so that each call of a predicate that declares binding modes is made in
+    one of them, and the cheapest of the calls that could be made next comes
+    first.
+
+    Conjuncts keep their order where possible: calls in an unsupported mode
+    wait until enough of their arguments are bound, and other conjuncts
+    (comparisons, assignments, negations, ...) wait for every earlier conjunct
+    that mentions one of their variables. Raises ValueError when no order
+    makes every call supported.
+    """
+    bound = set(bound)
+    remaining = list(items)
+    ordered = []
+    while remaining:
+        choice = None
+        choice_cost = None
+        # variables still to be bound by conjuncts that wait
+        pending = set()
+        # variables of non-predicate conjuncts that wait, every later conjunct keeps its place after them
+        held = set()
+        unsupported = None
+        for i, item in enumerate(remaining):
+            variables = node_variables(item)
+            node, predicate = _called_predicate(item, predicate_registry)
+            if node is None:
+                if variables & (pending | held):
+                    held |= variables
+                    continue
+                if choice is None:
+                    choice = i
+                break
+            if variables & held:
+                held |= variables
+                continue
+            cost = DEFAULT_MODE_COST
+            if predicate is not None:
+                call_mode = binding_mode(node.args, bound)
+                selected = predicate.select_mode(call_mode)
+                if selected is None:
+                    pending |= variables - bound
+                    if unsupported is None:
+                        unsupported = (node.name, call_mode, predicate)
+                    continue
+                cost = selected[1]
+            if choice is None or cost < choice_cost:
+                choice, choice_cost = i, cost
+        if choice is None:
+            name, call_mode, predicate = unsupported
+            raise ValueError(f"Predicate {name} can not be called in binding mode '{call_mode}', "
+                             f"declared modes: {', '.join(predicate.get_modes())}")
+        item = remaining.pop(choice)
+        ordered.append(item)
+        bound |= item.bound_vars
+    return ordered
+
+
+def range_constraints(items: list):
+    """
+    Find the comparisons of a variable of a predicate call to a number, or
+    to another variable, in the later conjuncts of an AND, such as ?V > 30
+    after get_property(?X, 'age', ?V). When the call binds the variable,
+    the comparison can be passed to the predicate to skip the values that
+    would fail it; the comparison is still evaluated afterwards.
+
+    Returns, for each conjunct in order, a tuple of (variable, operator,
+    number or variable) with the variable on the left, or None if no
+    conjunct has any.
+    """
+    compares = [(i, item) for i, item in enumerate(items)
+                if isinstance(item, CompareNode) and item.op in RANGE_OPERATORS]
+    if not compares:
+        return None
+    result = [()] * len(items)
+    found = False
+    for i, item in enumerate(items):
+        node = item.predicate if isinstance(item, AnnotatedPredicateNode) else item
+        if not isinstance(node, PredicateNode):
+            continue
+        variables = {arg for arg in node.args if is_variable(arg)}
+        constraints = []
+        for j, compare in compares:
+            if j <= i:
+                continue
+            for var, op, other in ((compare.left, compare.op, compare.right),
+                                   (compare.right, RANGE_OPERATORS[compare.op], compare.left)):
+                if not is_variable(var) or var not in variables or other == var:
+                    continue
+                if is_variable(other) or type(other) in (int, float):
+                    constraints.append((var, op, other))
+        if constraints:
+            result[i] = tuple(constraints)
+            found = True
+    return result if found else None
@@ -0,0 +1,282 @@
+from collections import OrderedDict
+from kgraphlang.parser.kgraph_ast import AggregateNode
+from kgraphlang.planner.query_analysis import (
+    freeze_value, iter_subnodes, find_shared_subexpressions, aggregate_body, can_group_by, order_conjuncts,
+    range_constraints)
+
+
+class QueryCancelledError(Exception):
+    """
+    Raised inside the evaluator when the query has been cancelled.
+    """
+    pass
+
+
+class QueryStats:
+    """
+    Counters describing how much work the evaluator did, and how much was
+    saved by sharing the results of common subexpressions.
+    """
+    def __init__(self):
+        self.shared_subexpressions = 0
+        self.shared_evaluations = 0
+        self.shared_reuses = 0
+        self.bindings_reused = 0
+        self.aggregate_evaluations = 0
+        self.aggregate_group_by_passes = 0
+        self.aggregate_reuses = 0
+        self.predicate_calls = 0
+        self.predicate_call_reuses = 0
+        self.range_constraints_pushed = 0
+        self.predicate_batches = 0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+    def __str__(self):
+        return ", ".join(f"{name}: {value}" for name, value in self.__dict__.items())
+
+    def __repr__(self):
+        return self.__str__()
+
+
+class QueryPlan:
+    """
+    Analysis of the nodes of a query AST that does not depend on bindings.
+    Structural keys and variables are cached by the nodes themselves, the
+    plan holds the aggregate plans, computed once per aggregate node.
+    A plan built ahead of time, e.g. by a prepared query, can be used as the
+    base of the plans of many later evaluations.
+    """
+    def __init__(self, base=None):
+        self.base = base
+        self._aggregate_plans = {}
+        self._conjunct_orders = {}
+        self._range_constraints = {}
+
+    def _lookup(self, table, node):
+        plan = self
+        while plan is not None:
+            entry = getattr(plan, table).get(id(node))
+            if entry is not None and entry[0] is node:
+                return entry
+            plan = plan.base
+        return None
+
+    def node_info(self, node):
+        """
+        Return (structural key, variables) for a node.
+        """
+        return node, node.free_vars
+
+    def aggregate_plan(self, agg_node):
+        """
+        Return (structural key, body variables, body AST) for an aggregate.
+        The body variables that are bound when the aggregate is reached are
+        its correlated variables; the others are local to the aggregate.
+        """
+        plan = self._lookup("_aggregate_plans", agg_node)
+        if plan is None:
+            body = aggregate_body(agg_node)
+            variables = agg_node.free_vars
+            plan = (agg_node, agg_node, tuple(sorted(variables)), body, {})
+            self._aggregate_plans[id(agg_node)] = plan
+        return plan[1], plan[2], plan[3]
+
+    def aggregate_group_by(self, agg_node, correlated, supported=None):
+        """
+        Return True if the aggregate can be decorrelated with a group-by pass
+        over the given correlated variables. supported(body), if given, must
+        also accept the body for it to be evaluated with no variables bound.
+        """
+        group_by_safe = self._lookup("_aggregate_plans", agg_node)[4]
+        if correlated not in group_by_safe:
+            body = aggregate_body(agg_node)
+            group_by_safe[correlated] = can_group_by(body, correlated) and (supported is None or supported(body))
+        return group_by_safe[correlated]
+
+    def conjunct_order(self, and_node, bound: frozenset, predicate_registry: dict) -> list:
+        """
+        Return the conjuncts of an AND node in the order to evaluate them
+        with the given variables bound, see order_conjuncts.
+        """
+        entry = self._lookup("_conjunct_orders", and_node)
+        if entry is None:
+            entry = (and_node, {})
+            self._conjunct_orders[id(and_node)] = entry
+        orders = entry[1]
+        if bound not in orders:
+            orders[bound] = order_conjuncts(and_node.items, bound, predicate_registry)
+        return orders[bound]
+
+    def range_constraints(self, and_node, items: list):
+        """
+        Return the range constraints of the conjuncts of an AND node, in the
+        order given by items, see range_constraints.
+        """
+        entry = self._lookup("_range_constraints", and_node)
+        if entry is None:
+            entry = (and_node, {})
+            self._range_constraints[id(and_node)] = entry
+        by_order = entry[1]
+        cached = by_order.get(id(items))
+        if cached is None or cached[0] is not items:
+            # the items are kept so that their id is not reused
+            cached = (items, range_constraints(items))
+            by_order[id(items)] = cached
+        return cached[1]
+
+    def analyze(self, ast, skip=None):
+        """
+        Compute the plan of every shareable node and aggregate in the AST,
+        except for the nodes for which skip(node) is true.
+        """
+        for node in iter_subnodes(ast):
+            if skip is not None and skip(node):
+                continue
+            if isinstance(node, AggregateNode):
+                self.aggregate_plan(node)
+            elif node.shareable:
+                # computes and caches the structural hash and variables
+                self.node_info(node)
+                hash(node)
+        return self
+
+
+class QueryContext:
+    """
+    Per-query evaluation state shared by every BindingStack of the query.
+    Holds the results of shared subexpressions, keyed by the structure of
+    the sub-AST and the values of the variables it sees bound, and of
+    predicate calls, keyed by the predicate and its inputs.
+
+    The ast may also be a list of query ASTs, in which case the context is
+    shared by a batch of queries and so is all of the cached work.
+
+    The outputs of at most predicate_call_cache_size predicate calls are
+    kept, the least recently used are dropped, so that the cache does not
+    grow with the number of answers of a long (e.g. streamed) query.
+    None keeps them all.
+    """
+    def __init__(self, ast=None, plan: QueryPlan = None, predicate_call_cache_size: int = None):
+        self.stats = QueryStats()
+        self.plan = QueryPlan(base=plan)
+        self.shared_keys = set()
+        if ast is not None:
+            self.shared_keys = find_shared_subexpressions(ast, key=lambda node: self.plan.node_info(node)[0])
+        self.stats.shared_subexpressions = len(self.shared_keys)
+        self._shared_results = {}
+        self._aggregate_values = {}
+        self._aggregate_groups = {}
+        self._aggregate_misses = {}
+        self._predicate_calls = OrderedDict()
+        self.predicate_call_cache_size = predicate_call_cache_size
+        # set to a threading.Event (or anything with is_set()) to cancel the query
+        self.cancel_event = None
+
+    def check_cancelled(self):
+        if self.cancel_event is not None and self.cancel_event.is_set():
+            raise QueryCancelledError("Query cancelled")
+
+    def shared_key(self, node, binding):
+        """
+        Return the cache key for evaluating a shared node against a binding,
+        or None if the node only occurs once in the query.
+        """
+        key, variables = self.plan.node_info(node)
+        if key not in self.shared_keys:
+            return None
+        bound = tuple(sorted((var, freeze_value(binding.get(var))) for var in variables if var in binding))
+        return key, bound, freeze_value(binding.get_annotations())
+
+    def get_shared(self, key):
+        return self._shared_results.get(key)
+
+    def put_shared(self, key, value):
+        self._shared_results[key] = value
+
+    def aggregate_plan(self, agg_node):
+        return self.plan.aggregate_plan(agg_node)
+
+    def aggregate_group_by(self, agg_node, correlated, supported=None):
+        return self.plan.aggregate_group_by(agg_node, correlated, supported)
+
+    def get_aggregate(self, key):
+        return self._aggregate_values.get(key)
+
+    def put_aggregate(self, key, value):
+        self._aggregate_values[key] = value
+
+    def count_aggregate_miss(self, key):
+        """
+        Count a cache miss for an aggregate and return the number of misses
+        so far, i.e. the number of distinct correlated tuples seen.
+        """
+        self._aggregate_misses[key] = self._aggregate_misses.get(key, 0) + 1
+        return self._aggregate_misses[key]
+
+    def get_aggregate_groups(self, key):
+        return self._aggregate_groups.get(key)
+
+    def put_aggregate_groups(self, key, groups):
+        self._aggregate_groups[key] = groups
+
+    def _predicate_call_key(self, predicate, input_dict: dict, annotations: list, constraints=None):
+        return (predicate, tuple(sorted((i, freeze_value(v)) for i, v in input_dict.items())),
+                freeze_value(annotations), tuple(constraints or ()))
+
+    def call_predicate(self, predicate, input_dict: dict, annotations: list, impl=None, constraints=None):
+        """
+        Call predicate.eval_impl, or impl, the implementation of the binding
+        mode of the call, or return the outputs of an earlier call with the
+        same inputs, annotations and range constraints.
+        """
+        key = self._predicate_call_key(predicate, input_dict, annotations, constraints)
+        outputs = self._predicate_calls.get(key)
+        if outputs is not None:
+            self._predicate_calls.move_to_end(key)
+            self.stats.predicate_call_reuses += 1
+            return outputs
+        impl = impl or predicate.eval_impl
+        if constraints:
+            outputs = impl(input_dict=input_dict, annotations=annotations, constraints=constraints)
+            self.stats.range_constraints_pushed += len(constraints)
+        else:
+            outputs = impl(input_dict=input_dict, annotations=annotations)
+        self.stats.predicate_calls += 1
+        self._put_predicate_call(key, outputs)
+        return outputs
+
+    def call_predicate_batch(self, predicate, input_dicts: list, annotations: list) -> list:
+        """
+        Return the outputs of each of the calls, in order, answering those
+        not made earlier in the query with one call to
+        predicate.eval_batch_impl.
+        """
+        keys = [self._predicate_call_key(predicate, input_dict, annotations) for input_dict in input_dicts]
+        # the outputs of the calls of the batch, each distinct new call made once
+        found = {}
+        missing = {}
+        for key, input_dict in zip(keys, input_dicts):
+            if key in found or key in missing:
+                self.stats.predicate_call_reuses += 1
+            elif key in self._predicate_calls:
+                self._predicate_calls.move_to_end(key)
+                found[key] = self._predicate_calls[key]
+                self.stats.predicate_call_reuses += 1
+            else:
+                missing[key] = input_dict
+        if missing:
+            outputs = predicate.eval_batch_impl(input_dicts=list(missing.values()), annotations=annotations)
+            for key, call_outputs in zip(missing, outputs):
+                found[key] = call_outputs
+                self._put_predicate_call(key, call_outputs)
+            self.stats.predicate_calls += len(missing)
+            self.stats.predicate_batches += 1
+        return [found[key] for key in keys]
+
+    def _put_predicate_call(self, key, outputs):
+        self._predicate_calls[key] = outputs
+        if self.predicate_call_cache_size is not None:
+            while len(self._predicate_calls) > self.predicate_call_cache_size:
+                self._predicate_calls.popitem(last=False)
@@ -1,9 +1,12 @@
 from abc import ABC, abstractmethod
 from kgraphlang.kgraph_infer import UNBOUND, BindingStack
+from kgraphlang.parser.kgraph_ast import KGraphNode
+from kgraphlang.planner.query_analysis import DEFAULT_MODE_COST, binding_mode, mode_satisfies, freeze_value
 
 class KGraphPredicate(ABC):
     def __init__(self):
-        pass
+        # declared binding modes: mode -> (relative cost, implementation or None for eval_impl)
+        self._modes = {}
 
     @abstractmethod
     def eval_impl(self, *, input_dict: dict, annotations: list = None) -> list:
@@ -20,14 +23,114 @@ class KGraphPredicate(ABC):
     def get_annotation_ids(self) -> list:
         return []
 
+    def accepts_constraints(self) -> bool:
+        """
+        Return True if eval_impl accepts a constraints keyword argument: a
+        list of (argument index, operator, number) range constraints on free
+        arguments, such as (2, ">", 30), that the engine found in comparisons
+        later in the query.
+        Outputs failing a constraint may be skipped, but need not be since
+        the engine still evaluates the comparisons. Calls in a binding mode
+        with its own implementation (see register_mode) get no constraints.
+        """
+        return False
+
+    def supports_group_by(self) -> bool:
+        """
+        Return False if filtering the results of a call with an argument
+        free to one of its values can give other answers than the call with
+        the argument bound to that value, e.g. when the predicate returns
+        only the best few results of a call. An aggregate whose body calls
+        the predicate is then evaluated once per binding of its correlated
+        variables, instead of with a single group-by pass.
+        """
+        return True
+
+    def accepts_batches(self) -> bool:
+        """
+        Return True if eval_batch_impl answers many calls at once more
+        cheaply than eval_impl answers them one by one, e.g. with one call
+        to a model or an index for all of them. The engine then passes the
+        bindings reaching a call of the predicate in a join to
+        evaluate_batch in batches.
+        """
+        return False
+
+    def eval_batch_impl(self, *, input_dicts: list, annotations: list = None) -> list:
+        """
+        Given a list of input dictionaries, as for eval_impl, return the
+        list of the outputs of each, in order.
+        """
+        return [self.eval_impl(input_dict=input_dict, annotations=annotations) for input_dict in input_dicts]
+
+    def register_mode(self, mode: str, *, cost: float = DEFAULT_MODE_COST, impl=None):
+        """
+        Declare a binding mode the predicate supports, with one character per
+        argument: 'b' if the argument must be bound, 'f' if it may be free.
+        For example get_email(?X, ?M) may declare "bf" as cheap and "fb" as
+        expensive. Costs are relative to the other modes and predicates.
+
+        impl, if given, is called instead of eval_impl for calls in this mode,
+        with the same keyword arguments.
+
+        A predicate that declares no modes supports every mode with eval_impl.
+        Once modes are declared, calls that match none of them are rejected.
+        """
+        if len(mode) != self.get_arity() or set(mode) - {"b", "f"}:
+            raise ValueError(f"Invalid binding mode '{mode}' for arity {self.get_arity()}")
+        self._modes[mode] = (cost, impl)
+
+    def get_modes(self) -> dict:
+        """
+        Return the declared binding modes as a dictionary of mode -> cost.
+        """
+        return {mode: cost for mode, (cost, _) in getattr(self, "_modes", {}).items()}
+
+    def select_mode(self, call_mode: str):
+        """
+        Return (mode, cost, impl) for the cheapest declared mode a call in
+        call_mode satisfies, i.e. every argument the mode needs bound is bound.
+        Returns None if no declared mode is satisfied. Without declared
+        modes every call is supported by eval_impl.
+        """
+        modes = getattr(self, "_modes", {})
+        if not modes:
+            return call_mode, DEFAULT_MODE_COST, None
+        selected = None
+        for mode, (cost, impl) in modes.items():
+            if mode_satisfies(call_mode, mode) and (selected is None or cost < selected[1]):
+                selected = (mode, cost, impl)
+        return selected
+
     def is_variable(self, arg):
         return isinstance(arg, str) and arg.startswith("?")
 
-    def evaluate(self, args, binding: BindingStack):
-        # Build an input dictionary: index -> value (or UNBOUND)
+    def _resolve_constraints(self, args, constraints, binding: BindingStack) -> list:
+        # the constraints on arguments left free, compared to numbers
+        resolved = []
+        for var, op, other in constraints:
+            if var in binding:
+                continue
+            if self.is_variable(other):
+                if other not in binding:
+                    continue
+                other = binding.get(other)
+            # NaN fails every comparison
+            if type(other) not in (int, float) or other != other:
+                continue
+            resolved.append((args.index(var), op, other))
+        return resolved
 
-        annotations = binding.get_annotations()
+    def _select_impl(self, args, binding: BindingStack):
+        call_mode = binding_mode(args, binding)
+        selected = self.select_mode(call_mode)
+        if selected is None:
+            raise ValueError(f"{type(self).__name__} does not support binding mode '{call_mode}', "
+                             f"declared modes: {', '.join(self.get_modes())}")
+        return selected[2]
 
+    def _input_dict(self, args, binding: BindingStack) -> dict:
+        # Build an input dictionary: index -> value (or UNBOUND)
         input_dict = {}
         for i, arg in enumerate(args):
             if self.is_variable(arg):
@@ -35,10 +138,14 @@ class KGraphPredicate(ABC):
                     input_dict[i] = binding.get(arg)
                 else:
                     input_dict[i] = UNBOUND
+            elif isinstance(arg, KGraphNode):
+                # e.g. a list literal, passed in its tuple form
+                input_dict[i] = arg.to_tuple()
             else:
                 input_dict[i] = arg
-        # Delegate to the implementing function.
-        outputs = self.eval_impl(input_dict=input_dict, annotations=annotations)
+        return input_dict
+
+    def _bind_outputs(self, args, binding: BindingStack, outputs: list) -> list:
         new_bindings = []
         for output in outputs:
             new_binding = binding.copy()
@@ -55,3 +162,54 @@ class KGraphPredicate(ABC):
             if not conflict:
                 new_bindings.append(new_binding)
         return new_bindings
+
+    def evaluate(self, args, binding: BindingStack, constraints=None):
+
+        annotations = binding.get_annotations()
+        mode_impl = self._select_impl(args, binding)
+        impl = mode_impl or self.eval_impl
+        input_dict = self._input_dict(args, binding)
+
+        # Delegate to the implementing function, through the query context
+        # so identical calls within a query (or batch) are made only once.
+        # Only eval_impl is passed constraints, see accepts_constraints.
+        if constraints and mode_impl is None and self.accepts_constraints():
+            constraints = self._resolve_constraints(args, constraints, binding)
+        else:
+            constraints = None
+        if binding.context is not None:
+            outputs = binding.context.call_predicate(self, input_dict, annotations, impl, constraints)
+        elif constraints:
+            outputs = impl(input_dict=input_dict, annotations=annotations, constraints=constraints)
+        else:
+            outputs = impl(input_dict=input_dict, annotations=annotations)
+        return self._bind_outputs(args, binding, outputs)
+
+    def evaluate_batch(self, args, bindings: list) -> list:
+        """
+        Evaluate the predicate against each of the bindings, returning the
+        list of the new bindings of each, in order. The calls of bindings
+        with the same annotations are answered by one call to
+        eval_batch_impl, calls in a binding mode with its own implementation
+        are made one at a time.
+        """
+        results = [None] * len(bindings)
+        # frozen annotations -> [(binding number, input dictionary)]
+        pending = {}
+        for n, binding in enumerate(bindings):
+            if self._select_impl(args, binding) is not None:
+                results[n] = self.evaluate(args, binding)
+                continue
+            key = freeze_value(binding.get_annotations())
+            pending.setdefault(key, []).append((n, self._input_dict(args, binding)))
+
+        for calls in pending.values():
+            first = bindings[calls[0][0]]
+            input_dicts = [input_dict for _, input_dict in calls]
+            if first.context is not None:
+                outputs = first.context.call_predicate_batch(self, input_dicts, first.get_annotations())
+            else:
+                outputs = self.eval_batch_impl(input_dicts=input_dicts, annotations=first.get_annotations())
+            for (n, _), call_outputs in zip(calls, outputs):
+                results[n] = self._bind_outputs(args, bindings[n], call_outputs)
+        return results
@@ -0,0 +1,176 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+import contextlib
+from kgraphlang.kgraph_infer import KGraphInfer
+from synthetic_kgraph import SyntheticKGraph
+
+# Benchmark of KGraphInfer.execute over a synthetic knowledge graph.
+# Runs a fixed catalog of query shapes and reports throughput, latency
+# percentiles and peak memory per query, optionally written as JSON
+# for tracking regressions between versions.
+#
+# python bench_kgraph_infer.py --entities 1000 --repeat 20 --output bench.json
+
+
+def query_catalog(graph: SyntheticKGraph) -> list:
+    """
+    Return the (name, shape, query) catalog for the graph, with constants
+    taken from the graph so every query has answers.
+    """
+    hub = graph.most_connected()
+    knower = graph.most_connected("knows")
+
+    return [
+        ("chain_2", "chain",
+         f"edge('{hub}', ?T1, ?A), edge(?A, ?T2, ?B)."),
+        ("chain_3", "chain",
+         f"edge('{knower}', 'knows', ?A), edge(?A, ?T2, ?B), edge(?B, ?T3, ?C)."),
+        ("star_properties", "star",
+         "entity(?E, 'Person'), get_property(?E, 'age', ?Age), get_property(?E, 'name', ?Name), ?Age > 40."),
+        ("star_edges", "star",
+         f"edge('{hub}', ?T1, ?A), edge('{hub}', ?T2, ?B), ?A != ?B, entity(?A, ?AType)."),
+        ("negation", "negation",
+         "entity(?E, 'Person'), not(edge(?E, 'knows', ?F))."),
+        ("aggregate_count", "aggregate",
+         "entity(?E, 'Organization'), ?N = count { ?S | edge(?S, 'works_for', ?E) }."),
+        ("aggregate_collection", "aggregate",
+         "entity(?E, 'City'), ?People = collection { ?S | edge(?S, 'located_in', ?E), entity(?S, 'Person') }."),
+        ("map_subset", "map_subset",
+         "entity(?E, 'Person'), get_property_map(?E, ?Map), ['age' = ?Age] subset ?Map, ?Age < 30."),
+        ("typed_date", "typed_comparison",
+         "get_property(?E, 'birth_date', ?D), ?D > '2010-01-01'^Date."),
+        ("typed_number", "typed_comparison",
+         "get_property(?E, 'score', ?S), ?S >= 95.0, entity(?E, ?Type)."),
+        ("range_age", "range",
+         "get_property(?E, 'age', ?Age), ?Age > 30, ?Age < 35."),
+    ]
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    """
+    Nearest-rank percentile of an already sorted list.
+    """
+    if not sorted_values:
+        return 0.0
+    rank = max(1, int(round(p / 100.0 * len(sorted_values) + 0.5)))
+    return sorted_values[min(rank, len(sorted_values)) - 1]
+
+
+def run_query(infer: KGraphInfer, query: str, *, repeat: int, warmup: int) -> dict:
+
+    # execute() prints its progress, which is not part of what is measured
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+
+        for _ in range(warmup):
+            infer.execute(query)
+
+        latencies = []
+        answers = 0
+        for _ in range(repeat):
+            start = time.perf_counter()
+            answer_set = infer.execute(query)
+            latencies.append(time.perf_counter() - start)
+            answers = len(answer_set)
+
+        # measured separately, tracing slows down allocation heavy code
+        tracemalloc.start()
+        infer.execute(query)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    latencies.sort()
+    total = sum(latencies)
+
+    return {
+        "answers": answers,
+        "runs": repeat,
+        "throughput_qps": repeat / total if total > 0 else 0.0,
+        "latency_ms": {
+            "mean": total / repeat * 1000.0,
+            "min": latencies[0] * 1000.0,
+            "p50": percentile(latencies, 50) * 1000.0,
+            "p95": percentile(latencies, 95) * 1000.0,
+            "p99": percentile(latencies, 99) * 1000.0,
+            "max": latencies[-1] * 1000.0,
+        },
+        "peak_memory_kb": peak / 1024.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark KGraphInfer over a synthetic knowledge graph")
+    parser.add_argument("--entities", type=int, default=500)
+    parser.add_argument("--edges-per-entity", type=int, default=4)
+    parser.add_argument("--skew", type=float, default=1.0)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--warmup", type=int, default=1)
+    parser.add_argument("--query", action="append", help="run only the named queries")
+    parser.add_argument("--columnar", action="store_true", help="store the predicate data in NumPy columns")
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    graph = SyntheticKGraph(num_entities=args.entities, edges_per_entity=args.edges_per_entity,
+                            skew=args.skew, seed=args.seed)
+    infer = KGraphInfer(graph.build_predicate_registry(columnar=args.columnar))
+    build_seconds = time.perf_counter() - start
+
+    print(f"Graph: {graph.get_config()} built in {build_seconds:.3f}s")
+
+    results = []
+
+    for name, shape, query in query_catalog(graph):
+        if args.query and name not in args.query:
+            continue
+
+        result = run_query(infer, query, repeat=args.repeat, warmup=args.warmup)
+        results.append({"name": name, "shape": shape, "query": query, **result})
+
+        latency = result["latency_ms"]
+        print(f"{name:<22} answers: {result['answers']:>6}  "
+              f"p50: {latency['p50']:9.2f}ms  p95: {latency['p95']:9.2f}ms  p99: {latency['p99']:9.2f}ms  "
+              f"qps: {result['throughput_qps']:8.1f}  peak: {result['peak_memory_kb']:9.1f}KB")
+
+    # indexes built lazily by the filter predicates during the queries
+    index_stats = {}
+    for predicate_name, predicate in infer.predicate_registry.items():
+        if args.columnar:
+            print(f"columns {predicate_name:<22} rows: {predicate.num_rows:>6}  "
+                  f"memory: {predicate.memory_bytes() / 1024.0:9.1f}KB")
+            continue
+        for positions, stats in predicate.get_index_stats().items():
+            label = f"{predicate_name}{list(positions)}"
+            index_stats[label] = stats
+            print(f"index {label:<24} keys: {stats['keys']:>6}  "
+                  f"build: {stats['build_ms']:8.2f}ms  memory: {stats['bytes'] / 1024.0:9.1f}KB  "
+                  f"lookups: {stats['lookups']:>8}")
+
+    report = {
+        "benchmark": "kgraph_infer",
+        "environment": {
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+        },
+        "graph": graph.get_config(),
+        "build_seconds": build_seconds,
+        "columnar": args.columnar,
+        "repeat": args.repeat,
+        "queries": results,
+        "indexes": index_stats,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
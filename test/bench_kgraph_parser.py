@@ -0,0 +1,219 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tracemalloc
+from lark import Lark
+from kgraphlang.parser.kgraph_infer_parser import KGraphInferParser, kgraph_grammar
+from kgraph_parser_corpus import parser_corpus
+
+# Benchmark of KGraphInferParser over a corpus of realistic and adversarial
+# inputs. Parse (lexer + LALR parser building the AST) and unparse are timed
+# separately, and the memory allocated for the AST is traced.
+# For comparison the same inputs are parsed to a Lark parse tree which is
+# then transformed, as infer_parse did before building the AST inline.
+#
+# Results are compared against the checked-in baseline, timings are machine
+# dependent so the baseline should be updated on the machine that checks it:
+#
+# python bench_kgraph_parser.py --update-baseline
+# python bench_kgraph_parser.py --check
+
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "bench_baselines", "parser_baseline.json")
+
+
+def median(values: list) -> float:
+    values = sorted(values)
+    mid = len(values) // 2
+    if len(values) % 2:
+        return values[mid]
+    return (values[mid - 1] + values[mid]) / 2.0
+
+
+def timed(func, *args):
+    start = time.perf_counter()
+    result = func(*args)
+    return result, time.perf_counter() - start
+
+
+def traced(func, *args):
+    tracemalloc.start()
+    result = func(*args)
+    retained, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, retained, peak
+
+
+def two_pass_parse(tree_parser: Lark, transformer, query: str):
+    return transformer.transform(tree_parser.parse(query))
+
+
+def bench_query(parser: KGraphInferParser, tree_parser: Lark, query: str, repeat: int) -> dict:
+    result = {"size_bytes": len(query.encode("utf-8"))}
+
+    parse_times = []
+    unparse_times = []
+
+    try:
+        for _ in range(repeat):
+            ast, parse_time = timed(parser.infer_parse, query)
+            parse_times.append(parse_time)
+    except RecursionError:
+        result["error"] = "RecursionError"
+        return result
+
+    # memory allocated for the AST, retained after the parse
+    ast, ast_bytes, peak_bytes = traced(parser.infer_parse, query)
+
+    result["parse_ms"] = median(parse_times) * 1000.0
+    result["total_ms"] = result["parse_ms"]
+    result["throughput_mb_s"] = result["size_bytes"] / (result["total_ms"] / 1000.0) / 1e6
+    result["ast_kb"] = ast_bytes / 1024.0
+    result["parse_peak_kb"] = peak_bytes / 1024.0
+
+    try:
+        for _ in range(repeat):
+            dsl, unparse_time = timed(parser.infer_unparse, ast)
+            unparse_times.append(unparse_time)
+        result["unparse_ms"] = median(unparse_times) * 1000.0
+        # unparsed output parses back to an AST that unparses the same way
+        result["roundtrip"] = parser.infer_unparse(parser.infer_parse(dsl)) == dsl
+    except RecursionError:
+        result["unparse_error"] = "RecursionError"
+
+    # for comparison, a parse tree built by Lark and transformed afterwards
+    tree_times = []
+    transform_times = []
+
+    try:
+        for _ in range(repeat):
+            tree, tree_time = timed(tree_parser.parse, query)
+            _, transform_time = timed(parser.transformer.transform, tree)
+            tree_times.append(tree_time)
+            transform_times.append(transform_time)
+        _, _, two_pass_peak = traced(two_pass_parse, tree_parser, parser.transformer, query)
+        result["two_pass_parse_ms"] = median(tree_times) * 1000.0
+        result["two_pass_transform_ms"] = median(transform_times) * 1000.0
+        result["two_pass_total_ms"] = result["two_pass_parse_ms"] + result["two_pass_transform_ms"]
+        result["two_pass_peak_kb"] = two_pass_peak / 1024.0
+    except RecursionError:
+        result["two_pass_error"] = "RecursionError"
+
+    return result
+
+
+def compare_to_baseline(results: dict, baseline: dict, tolerance: float, min_delta_ms: float) -> list:
+    """
+    Return a list of regression messages, an input regresses when it now
+    fails, or when its parse + transform time or AST memory exceeds the
+    baseline by more than the tolerance. Timings of small inputs are noisy,
+    so a slowdown must also be at least min_delta_ms.
+    """
+    regressions = []
+    for name, base in baseline.get("queries", {}).items():
+        current = results.get(name)
+        if current is None:
+            continue
+        if "error" in current:
+            if "error" not in base:
+                regressions.append(f"{name}: now fails with {current['error']}")
+            continue
+        if "error" in base:
+            continue
+        for metric in ("total_ms", "ast_kb"):
+            limit = base[metric] * (1.0 + tolerance)
+            if metric == "total_ms":
+                limit = max(limit, base[metric] + min_delta_ms)
+            if current[metric] > limit:
+                regressions.append(f"{name}: {metric} {current[metric]:.3f} > baseline {base[metric]:.3f}")
+        if base.get("roundtrip") and not current.get("roundtrip"):
+            regressions.append(f"{name}: unparse no longer round-trips")
+    return regressions
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark KGraphInferParser over a query corpus")
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--baseline", default=BASELINE_PATH)
+    arg_parser.add_argument("--update-baseline", action="store_true", help="write the results as the new baseline")
+    arg_parser.add_argument("--check", action="store_true", help="exit with status 1 on regressions")
+    arg_parser.add_argument("--tolerance", type=float, default=0.5,
+                            help="allowed slowdown or growth relative to the baseline, 0.5 = 50%%")
+    arg_parser.add_argument("--min-delta-ms", type=float, default=0.5,
+                            help="ignore slowdowns smaller than this many milliseconds")
+    arg_parser.add_argument("--output", help="write the results as JSON to this file")
+    args = arg_parser.parse_args()
+
+    parser = KGraphInferParser()
+    tree_parser = Lark(kgraph_grammar, parser="lalr")
+
+    results = {}
+
+    for name, category, query in parser_corpus():
+        result = bench_query(parser, tree_parser, query, args.repeat)
+        result["category"] = category
+        results[name] = result
+
+        if "error" in result:
+            print(f"{name:<22} {result['size_bytes']:>8}B  error: {result['error']}")
+            continue
+
+        line = (f"{name:<22} {result['size_bytes']:>8}B  parse: {result['parse_ms']:8.3f}ms  "
+                f"peak: {result['parse_peak_kb']:8.1f}KB  ast: {result['ast_kb']:8.1f}KB")
+        if "unparse_error" in result:
+            line += f"  unparse: {result['unparse_error']}"
+        else:
+            line += f"  unparse: {result['unparse_ms']:8.3f}ms  roundtrip: {result['roundtrip']}"
+        if "two_pass_error" in result:
+            line += f"  two pass: {result['two_pass_error']}"
+        else:
+            line += (f"  two pass: {result['two_pass_total_ms']:8.3f}ms  "
+                     f"peak: {result['two_pass_peak_kb']:8.1f}KB")
+        print(line)
+
+    report = {
+        "benchmark": "kgraph_parser",
+        "environment": {
+            "python": sys.version.split()[0],
+            "implementation": platform.python_implementation(),
+            "platform": platform.platform(),
+        },
+        "repeat": args.repeat,
+        "queries": results,
+    }
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+    if args.update_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Baseline written to {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"No baseline at {args.baseline}")
+        return
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+
+    regressions = compare_to_baseline(results, baseline, args.tolerance, args.min_delta_ms)
+
+    for regression in regressions:
+        print(f"Regression: {regression}")
+
+    if not regressions:
+        print("No regressions against baseline")
+    elif args.check:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import contextlib
+from kgraphlang.filter_infer.filter_string_hash_predicate import (
+    FilterStringHashPredicate, find_closest_strings, rescore_candidates, get_minhash)
+from kgraphlang.filter_infer.filter_ngram_predicate import FilterNGramPredicate
+from test_string_hash import synthetic_names
+
+# Recall and latency of the string match backends: the MinHash LSH index
+# of FilterStringHashPredicate and the character n-gram inverted index of
+# FilterNGramPredicate. Both rescore their candidates the same way, so
+# recall is measured against rescoring every name.
+#
+# Uses the entity labels of the FB15k JSONL written by extract_data.py
+# when it is present, and synthetic names otherwise:
+#
+# python bench_string_backends.py --labels ../test_data/FB15k/output.jsonl --limit 20000
+
+DEFAULT_LABELS = "../test_data/FB15k/output.jsonl"
+
+DEFAULT_QUERIES = ["Fred", "Denton", "Princeton University", "New York", "Grace", "Middletown"]
+
+
+def load_labels(path: str, limit: int) -> list:
+    data = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            label = record.get("properties", {}).get("label") if record.get("kind") == "entity" else None
+            if label:
+                data.append((record["id"], label))
+                if len(data) >= limit:
+                    break
+    return data
+
+
+def recall(found: list, truth: list) -> float:
+    """
+    The fraction of the top_k of truth that was found, where every name
+    scoring at least the lowest score of truth counts as relevant.
+    """
+    if not truth:
+        return 1.0
+    lowest = truth[-1][2]
+    found_scores = [score for _, _, score in found]
+    return min(sum(1 for score in found_scores if score >= lowest) / len(truth), 1.0)
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000.0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compare the LSH and n-gram string match backends")
+    arg_parser.add_argument("--labels", default=DEFAULT_LABELS)
+    arg_parser.add_argument("--limit", type=int, default=20000)
+    arg_parser.add_argument("--queries", nargs="+", default=DEFAULT_QUERIES)
+    arg_parser.add_argument("--top-k", type=int, default=10)
+    arg_parser.add_argument("--min-overlap", type=float, default=0.5)
+    arg_parser.add_argument("--output", help="write the results as JSON to this file")
+    args = arg_parser.parse_args()
+
+    if os.path.exists(args.labels):
+        data = load_labels(args.labels, args.limit)
+        source = args.labels
+    else:
+        data = synthetic_names(args.limit)
+        source = "synthetic"
+
+    print(f"{len(data)} labels from {source}")
+
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        lsh, lsh_build_ms = timed(lambda: FilterStringHashPredicate(data=data))
+        ngram, ngram_build_ms = timed(lambda: FilterNGramPredicate(data=data, min_overlap=args.min_overlap))
+
+    print(f"build  lsh: {lsh_build_ms:9.1f}ms  ngram: {ngram_build_ms:9.1f}ms")
+
+    all_ids = list(lsh.ids_to_names)
+    results = []
+
+    for query in args.queries:
+        truth = rescore_candidates(query, all_ids, lsh.ids_to_names, top_k=args.top_k)
+        lsh_found, lsh_ms = timed(lambda: find_closest_strings(query, lsh.lsh_index, lsh.ids_to_names,
+                                                               top_k=args.top_k))
+        ngram_found, ngram_ms = timed(lambda: ngram.find_closest_strings(query, top_k=args.top_k))
+        lsh_candidates = len(lsh.lsh_index.query(get_minhash(query)))
+        ngram_candidates = len(ngram.index.candidates(query, ngram.min_overlap, args.top_k, ngram.max_candidates))
+        result = {
+            "query": query,
+            "lsh": {"ms": lsh_ms, "candidates": lsh_candidates, "recall": recall(lsh_found, truth)},
+            "ngram": {"ms": ngram_ms, "candidates": ngram_candidates, "recall": recall(ngram_found, truth)},
+        }
+        results.append(result)
+        print(f"'{query}':  lsh: {lsh_ms:8.2f}ms {lsh_candidates:>7} candidates recall {result['lsh']['recall']:.2f}"
+              f"  ngram: {ngram_ms:8.2f}ms {ngram_candidates:>7} candidates recall {result['ngram']['recall']:.2f}")
+
+    if args.output:
+        report = {
+            "benchmark": "string_backends",
+            "environment": {
+                "python": sys.version.split()[0],
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+            },
+            "labels": source,
+            "size": len(data),
+            "top_k": args.top_k,
+            "build_ms": {"lsh": lsh_build_ms, "ngram": ngram_build_ms},
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+import sys
+import json
+import time
+import argparse
+import platform
+from rapidfuzz import fuzz
+from kgraphlang.filter_infer.filter_string_hash_predicate import rescore_candidates
+from test_string_hash import synthetic_names
+
+# Benchmark of the rescoring of string match candidates, over candidate
+# sets of increasing size, as returned by broad LSH queries. The batched
+# rescoring is compared with scoring one pair at a time and sorting all
+# the candidates, as find_closest_strings did before.
+#
+# python bench_string_match.py --sizes 100 1000 10000 100000 --output bench.json
+
+
+def loop_rescore(query_string, candidate_ids, ids_to_names, top_k=10, min_score=0):
+    scored_results = []
+    for rid in candidate_ids:
+        name = ids_to_names[str(rid)]
+        scored_results.append((rid, name, fuzz.partial_ratio(name, query_string)))
+    scored_results.sort(key=lambda x: x[2], reverse=True)
+    if min_score:
+        scored_results = [r for r in scored_results if r[2] >= min_score]
+    return scored_results[:top_k]
+
+
+def median_ms(func, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    times.sort()
+    return times[len(times) // 2] * 1000.0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Benchmark string match candidate rescoring")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1000, 10000, 100000])
+    arg_parser.add_argument("--queries", nargs="+", default=["Alice Denton", "Fred", "Grace Princeton 12"])
+    arg_parser.add_argument("--top-k", type=int, default=10)
+    arg_parser.add_argument("--min-score", type=float, default=0)
+    arg_parser.add_argument("--repeat", type=int, default=5)
+    arg_parser.add_argument("--output", help="write the results as JSON to this file")
+    args = arg_parser.parse_args()
+
+    data = synthetic_names(max(args.sizes))
+    ids_to_names = {str(id): name for id, name in data}
+    ids = list(ids_to_names)
+
+    results = []
+
+    for size in args.sizes:
+        candidate_ids = ids[:size]
+        for query in args.queries:
+            expected = loop_rescore(query, candidate_ids, ids_to_names, args.top_k, args.min_score)
+            found = rescore_candidates(query, candidate_ids, ids_to_names, args.top_k, args.min_score)
+            loop_ms = median_ms(lambda: loop_rescore(query, candidate_ids, ids_to_names,
+                                                     args.top_k, args.min_score), args.repeat)
+            batch_ms = median_ms(lambda: rescore_candidates(query, candidate_ids, ids_to_names,
+                                                            args.top_k, args.min_score), args.repeat)
+            results.append({"candidates": size, "query": query, "loop_ms": loop_ms, "batch_ms": batch_ms,
+                            "same_results": found == expected})
+            print(f"{size:>8} candidates  '{query}':  loop: {loop_ms:9.3f}ms  batch: {batch_ms:9.3f}ms  "
+                  f"speedup: {loop_ms / batch_ms:6.1f}x  same: {found == expected}")
+
+    if args.output:
+        report = {
+            "benchmark": "string_match",
+            "environment": {
+                "python": sys.version.split()[0],
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+            },
+            "top_k": args.top_k,
+            "min_score": args.min_score,
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import numpy as np
+from kgraphlang.filter_infer.vector_index import (
+    HNSW_BACKEND, EXACT_BACKEND, INT8_BACKEND, build_vector_index)
+
+# Recall and latency of the vector index backends of FilterVectorPredicate:
+# HNSW, the exact scan and the int8 scan with exact re-ranking. Recall is
+# measured against the exact scan.
+#
+# Uses synthetic clustered vectors, like sentence embeddings of related
+# descriptions, so no embedding model is needed:
+#
+# python bench_vector_backends.py --sizes 1000 20000 100000 --dimension 384
+
+BACKENDS = [HNSW_BACKEND, EXACT_BACKEND, INT8_BACKEND]
+
+
+def synthetic_vectors(count: int, dimension: int, clusters: int = 100, seed: int = 42) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dimension)).astype(np.float32)
+    assignment = rng.integers(0, clusters, count)
+    return centers[assignment] + 0.5 * rng.standard_normal((count, dimension)).astype(np.float32)
+
+
+def index_bytes(index, vectors: np.ndarray) -> int:
+    """
+    The memory the backend needs besides the vectors, estimated from
+    what it saves, or the norms of the exact scan.
+    """
+    if index.name == EXACT_BACKEND:
+        return index.norms.nbytes
+    with tempfile.TemporaryDirectory() as temp_dir:
+        index.save(temp_dir)
+        return sum(os.path.getsize(os.path.join(temp_dir, name)) for name in os.listdir(temp_dir))
+
+
+def timed(func):
+    start = time.perf_counter()
+    result = func()
+    return result, (time.perf_counter() - start) * 1000.0
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description="Compare the vector index backends")
+    arg_parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 20000])
+    arg_parser.add_argument("--dimension", type=int, default=384)
+    arg_parser.add_argument("--queries", type=int, default=64)
+    arg_parser.add_argument("--top-k", type=int, default=10)
+    arg_parser.add_argument("--output", help="write the results as JSON to this file")
+    args = arg_parser.parse_args()
+
+    results = []
+
+    for size in args.sizes:
+        vectors = synthetic_vectors(size, args.dimension)
+        rng = np.random.default_rng(7)
+        queries = vectors[rng.integers(0, size, args.queries)] + \
+            0.3 * rng.standard_normal((args.queries, args.dimension)).astype(np.float32)
+
+        print(f"{size} vectors of dimension {args.dimension}, {args.queries} queries, top {args.top_k}")
+        truth = None
+        for backend in [EXACT_BACKEND] + [b for b in BACKENDS if b != EXACT_BACKEND]:
+            index, build_ms = timed(lambda: build_vector_index(backend, vectors))
+            (labels, _), batch_ms = timed(lambda: index.search(queries, args.top_k, vectors))
+            _, single_ms = timed(lambda: [index.search(query[None], args.top_k, vectors) for query in queries[:8]])
+            if truth is None:
+                truth = labels
+            recall = float(np.mean([len(set(found.tolist()) & set(expected.tolist())) / args.top_k
+                                    for found, expected in zip(labels, truth)]))
+            result = {
+                "size": size,
+                "backend": backend,
+                "build_ms": build_ms,
+                "batch_ms_per_query": batch_ms / args.queries,
+                "single_ms_per_query": single_ms / 8,
+                "recall": recall,
+                "index_bytes": index_bytes(index, vectors),
+                "vector_bytes": vectors.nbytes,
+            }
+            results.append(result)
+            print(f"  {backend:>5}: build {build_ms:9.1f}ms  per query {result['single_ms_per_query']:7.3f}ms, "
+                  f"batched {result['batch_ms_per_query']:7.3f}ms  recall {recall:.3f}  "
+                  f"index {result['index_bytes'] / 1e6:7.1f}MB (vectors {vectors.nbytes / 1e6:.1f}MB)")
+
+    if args.output:
+        report = {
+            "benchmark": "vector_backends",
+            "environment": {
+                "python": sys.version.split()[0],
+                "implementation": platform.python_implementation(),
+                "platform": platform.platform(),
+                "cpus": os.cpu_count(),
+            },
+            "dimension": args.dimension,
+            "top_k": args.top_k,
+            "results": results,
+        }
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
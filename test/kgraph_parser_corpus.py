@@ -0,0 +1,105 @@
+# Corpus of KGraphLang inputs for parser benchmarks.
+# Realistic queries of the kind an LLM sends, and adversarial ones with
+# very large literals and deep nesting that stress the lexer, the LALR
+# parser and the transformer.
+
+
+def realistic_queries() -> list:
+    return [
+        ("simple_and", "?x = ?y, person(?x, 'john', 3), ?age > 18."),
+        ("or_groups", "person(?X), not( ( enemy(?X); frenemy(?X) ) ), get_email(?X, ?M)."),
+        ("annotated", "@limit(5) person(?x, ?y), @limit(\"hello\") friend(?x, ?z); @hello(5, 6) enemy(?y, ?z)."),
+        ("typed_literals",
+         "?d = '2023-02-18'^Date, ?t = '2023-02-18T14:00:00'^DateTime, ?p = '10.00'^Currency(USD), "
+         "?w = 'https://example.com'^URI, ?g = '40.7128,-74.0060'^GeoLocation, ?dur = 'PT5H'^Duration."),
+        ("aggregates",
+         "?friend_list = collection { ?friend_tuple | person(?p), not(enemy_of(?p, ?friend)), "
+         "friend_of(?p, ?friend), ?friend_tuple = [?p, ?friend] }, "
+         "?total = sum{ ?value | get_property(?x, 'hasScore', ?value) }, ?total > 10."),
+        ("map_subset",
+         "get_property_map(?E, ?Map), ['name' = ?Name, 'age' = ?Age] subset ?Map, ?Age >= 21, ?Age < 65."),
+        ("llm_turn",
+         """
+         // find people who work for a company in the same city they live in
+         @limit(10) person(?P),
+         works_for(?P, ?C), located_in(?C, ?City), lives_in(?P, ?City),
+         get_property(?P, 'name', ?Name),
+         get_property(?P, 'birth_date', ?Born), ?Born < '1990-01-01'^Date,
+         ?Projects = count { ?Proj | member_of(?P, ?Proj), ?Proj in ['alpha', 'beta', 'gamma'] },
+         ?Projects > 1,
+         not(on_leave(?P));
+         /* or anyone managing such a person */
+         manages(?M, ?P), ?Score is ?Projects * 2 + 1.
+         """),
+    ]
+
+
+def number_list(n: int) -> str:
+    return "?x in [" + ", ".join(str(i) for i in range(n)) + "]."
+
+
+def string_list(n: int) -> str:
+    return "?x in [" + ", ".join(f"'item_{i}'" for i in range(n)) + "]."
+
+
+def map_literal(n: int) -> str:
+    return "?m = [" + ", ".join(f"'key_{i}' = {i}" for i in range(n)) + "]."
+
+
+def triple_quoted(size: int) -> str:
+    line = "The quick brown fox jumps over the lazy dog. \"quoted\" 'single'\n"
+    text = (line * (size // len(line) + 1))[:size]
+    return f'?doc = """{text}""", search(?doc, ?hit).'
+
+
+def nested_groups(depth: int) -> str:
+    # alternating OR and AND groups: (a(0), (a(1); (a(2), ...)))
+    query = "leaf(?x)"
+    for i in reversed(range(depth)):
+        op = ", " if i % 2 == 0 else "; "
+        query = f"(p{i}(?x){op}{query})"
+    return query + "."
+
+
+def wide_conjunction(n: int) -> str:
+    return ", ".join(f"edge(?n{i}, 'knows', ?n{i + 1})" for i in range(n)) + "."
+
+
+def wide_disjunction(n: int) -> str:
+    return "; ".join(f"?x = 'value_{i}'" for i in range(n)) + "."
+
+
+def nested_lists(depth: int) -> str:
+    return "?x = " + "[" * depth + "1" + "]" * depth + "."
+
+
+def commented(n: int) -> str:
+    parts = []
+    for i in range(n):
+        parts.append(f"// step {i}\n/* block {i}\n spanning lines */ p{i}(?x)")
+    return ",\n".join(parts) + "."
+
+
+def adversarial_queries() -> list:
+    return [
+        ("number_list_1000", number_list(1000)),
+        ("string_list_1000", string_list(1000)),
+        ("map_literal_500", map_literal(500)),
+        ("triple_quoted_64k", triple_quoted(64 * 1024)),
+        ("nested_groups_50", nested_groups(50)),
+        ("nested_groups_100", nested_groups(100)),
+        ("nested_lists_50", nested_lists(50)),
+        ("nested_lists_200", nested_lists(200)),
+        ("wide_conjunction_500", wide_conjunction(500)),
+        ("wide_disjunction_500", wide_disjunction(500)),
+        ("comments_200", commented(200)),
+    ]
+
+
+def parser_corpus() -> list:
+    """
+    Return the corpus as a list of (name, category, query).
+    """
+    corpus = [(name, "realistic", query) for name, query in realistic_queries()]
+    corpus.extend((name, "adversarial", query) for name, query in adversarial_queries())
+    return corpus
@@ -0,0 +1,122 @@
+import random
+import datetime
+from kgraphlang.filter_infer.filter_predicate import FilterPredicate
+from kgraphlang.filter_infer.filter_columnar_predicate import FilterColumnarPredicate
+
+# synthetic knowledge graphs for benchmarks
+# entities with types, typed edges between them and property maps,
+# with a configurable size and skew of edge destinations and types
+
+ENTITY_TYPES = ["Person", "Organization", "City", "Event", "Product"]
+
+EDGE_TYPES = ["knows", "works_for", "located_in", "attended", "likes", "owns", "member_of", "related_to"]
+
+FIRST_NAMES = ["Alice", "Bob", "Charlie", "Dana", "Eve", "Frank", "Grace", "Heidi", "Ivan", "Judy"]
+
+
+class EntityPredicate(FilterPredicate):
+    # entity(?Entity, ?Type)
+    pass
+
+
+class EdgePredicate(FilterPredicate):
+    # edge(?Source, ?EdgeType, ?Destination)
+    pass
+
+
+class PropertyPredicate(FilterPredicate):
+    # get_property(?Entity, ?Property, ?Value)
+    pass
+
+
+class PropertyMapPredicate(FilterPredicate):
+    # get_property_map(?Entity, ?Map)
+    pass
+
+
+def skewed_weights(n, skew):
+    """
+    Zipf-like weights for n items, item i has weight 1 / (i + 1) ** skew.
+    A skew of 0 is uniform, larger values concentrate on the first items.
+    """
+    return [1.0 / (i + 1) ** skew for i in range(n)]
+
+
+class SyntheticKGraph:
+    """
+    A randomly generated knowledge graph, deterministic for a given seed.
+    """
+
+    def __init__(self, *, num_entities=1000, edges_per_entity=5, skew=1.0, seed=42):
+        self.num_entities = num_entities
+        self.edges_per_entity = edges_per_entity
+        self.skew = skew
+        self.seed = seed
+
+        rng = random.Random(seed)
+
+        self.entity_ids = [f"e{i}" for i in range(num_entities)]
+
+        type_weights = skewed_weights(len(ENTITY_TYPES), skew)
+        self.entities = [(entity_id, rng.choices(ENTITY_TYPES, type_weights)[0])
+                         for entity_id in self.entity_ids]
+
+        # popular destinations and edge types get most of the edges
+        destination_weights = skewed_weights(num_entities, skew)
+        edge_type_weights = skewed_weights(len(EDGE_TYPES), skew)
+        self.edges = []
+        for entity_id in self.entity_ids:
+            destinations = rng.choices(self.entity_ids, destination_weights, k=edges_per_entity)
+            edge_types = rng.choices(EDGE_TYPES, edge_type_weights, k=edges_per_entity)
+            for edge_type, destination in zip(edge_types, destinations):
+                if destination != entity_id:
+                    self.edges.append((entity_id, edge_type, destination))
+
+        start = datetime.date(1950, 1, 1)
+        self.properties = []
+        self.property_maps = []
+        for entity_id, entity_type in self.entities:
+            props = {
+                "name": f"{rng.choice(FIRST_NAMES)} {entity_id}",
+                "age": rng.randint(1, 100),
+                "score": round(rng.random() * 100.0, 2),
+                "birth_date": ("date", (start + datetime.timedelta(days=rng.randint(0, 25000))).isoformat()),
+            }
+            for prop, value in props.items():
+                self.properties.append((entity_id, prop, value))
+            self.property_maps.append((entity_id, {k: v for k, v in props.items() if k != "birth_date"}))
+
+    def get_config(self) -> dict:
+        return {
+            "num_entities": self.num_entities,
+            "edges_per_entity": self.edges_per_entity,
+            "skew": self.skew,
+            "seed": self.seed,
+            "num_edges": len(self.edges),
+            "num_properties": len(self.properties),
+        }
+
+    def most_connected(self, edge_type=None):
+        """
+        Return the entity with the most outgoing edges (of the given type).
+        """
+        counts = {}
+        for source, etype, _ in self.edges:
+            if edge_type is None or etype == edge_type:
+                counts[source] = counts.get(source, 0) + 1
+        return max(counts, key=counts.get)
+
+    def build_predicate_registry(self, columnar: bool = False) -> dict:
+        if columnar:
+            return {
+                "entity": FilterColumnarPredicate(data=self.entities),
+                "edge": FilterColumnarPredicate(data=self.edges),
+                "get_property": FilterColumnarPredicate(data=self.properties),
+                "get_property_map": FilterColumnarPredicate(data=self.property_maps),
+            }
+        return {
+            "entity": EntityPredicate(data=self.entities),
+            "edge": EdgePredicate(data=self.edges),
+            "get_property": PropertyPredicate(data=self.properties),
+            "get_property_map": PropertyMapPredicate(data=self.property_maps),
+        }
@@ -0,0 +1,99 @@
+from kgraphlang.kgraph_infer import KGraphInfer, UNBOUND
+from kgraphlang.filter_infer.filter_predicate import FilterPredicate
+from kgraphlang.filter_infer.filter_columnar_predicate import FilterColumnarPredicate
+
+
+class PersonList(FilterPredicate):
+    pass
+
+
+class PersonColumns(FilterColumnarPredicate):
+    pass
+
+
+# name (dictionary), age (int), score (float), id (ints, one too large for
+# int64), born (typed literals and strings, dictionary) and tags (maps, object)
+PERSON_DATA = [
+    ("Alice", 25, 0.5, 1, ("date", "1999-01-02"), {"team": "red"}),
+    ("Bob", 35, 1.25, 2 ** 70, ("date", "1989-03-04"), {"team": "blue"}),
+    ("Charlie", 40, 0.5, 3, "unknown", {"team": "red"}),
+    ("Alice", 31, 2.0, 4, ("date", "1993-05-06"), {"team": "green"}),
+    ("Dana", 25, 1.25, 5, "unknown", {}),
+]
+
+FLAG_DATA = [
+    (1, "one"),
+    (True, "true"),
+    (0, "zero"),
+    (False, "false"),
+]
+
+
+def answers(predicate, input_dict: dict) -> list:
+    arity = predicate.get_arity()
+    full = {i: input_dict.get(i, UNBOUND) for i in range(arity)}
+    return predicate.eval_impl(input_dict=full)
+
+
+def main():
+    print("Test Columnar Predicate")
+
+    list_predicate = PersonList(data=PERSON_DATA)
+    columnar_predicate = PersonColumns(data=PERSON_DATA)
+
+    print(f"Column encodings: {[column.encoding for column in columnar_predicate.columns]}")
+
+    calls = [
+        {},
+        {0: "Alice"},
+        {1: 25},
+        {1: 25.0},
+        {2: 1.25},
+        {2: 0.5, 1: 40},
+        {3: 2 ** 70},
+        {3: 4},
+        # ints that do not fit int64, bound against numeric columns
+        {1: 2 ** 70},
+        {1: -2 ** 70},
+        {2: 2 ** 70},
+        {4: ("date", "1989-03-04")},
+        {4: "unknown"},
+        {5: {"team": "red"}},
+        # unhashable bound values
+        {0: ["Alice"]},
+        {4: {"year": 1999}},
+        # strings bound against numeric columns
+        {1: "25"},
+        {2: "0.5"},
+        {3: "1"},
+        {0: "Nobody"},
+    ]
+
+    for input_dict in calls:
+        expected = answers(list_predicate, input_dict)
+        found = answers(columnar_predicate, input_dict)
+        print(f"{input_dict}: {len(found)} answers, same as FilterPredicate: {found == expected}")
+
+    # 1 and True are kept apart, but each matches both, as in a scan
+    list_flags = PersonList(data=FLAG_DATA)
+    columnar_flags = PersonColumns(data=FLAG_DATA)
+    for value in (1, True, 0, 1.0):
+        expected = answers(list_flags, {0: value})
+        found = answers(columnar_flags, {0: value})
+        print(f"{value!r}: {found}, same as FilterPredicate: {found == expected}")
+
+    queries = [
+        "person(?N, ?A, ?S, ?I, ?B, ?T), ?A > 30.",
+        "person('Alice', ?A, ?S, ?I, ?B, ?T), person(?N, ?A, ?S2, ?I2, ?B2, ?T2).",
+        "person(?N, ?A, ?S, ?I, ?B, ?T), person(?N2, ?A2, ?S, ?I2, ?B2, ?T), ?N != ?N2.",
+        "?X in ['Bob', 'Dana'], person(?X, ?A, ?S, ?I, ?B, ?T).",
+    ]
+
+    for kg_query in queries:
+        expected = [dict(a) for a in KGraphInfer({"person": list_predicate}).execute(kg_query).get_results()]
+        found = [dict(a) for a in KGraphInfer({"person": columnar_predicate}).execute(kg_query).get_results()]
+        print(f"{kg_query} answers: {len(found)} same as FilterPredicate: {found == expected}")
+
+
+if __name__ == "__main__":
+    main()
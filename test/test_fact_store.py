@@ -0,0 +1,96 @@
+import os
+import csv
+import json
+import time
+import pickle
+import tempfile
+from kgraphlang.filter_infer.fact_store import FactStore, write_fact_file, convert_csv, convert_extract_jsonl
+from kgraphlang.filter_infer.filter_fact_store_predicate import FilterFactStorePredicate
+from kgraphlang.kgraph_infer import KGraphInfer
+from synthetic_kgraph import SyntheticKGraph
+
+
+def main():
+    print("Test Fact Store")
+
+    graph = SyntheticKGraph(num_entities=500, edges_per_entity=4)
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+
+        edge_path = os.path.join(temp_dir, "edges.facts")
+        entity_path = os.path.join(temp_dir, "entities.facts")
+
+        write_fact_file(edge_path, graph.edges, names=["source", "type", "destination"])
+        write_fact_file(entity_path, graph.entities, names=["entity", "type"])
+
+        start = time.perf_counter()
+        edge_store = FactStore(edge_path)
+        print(f"Opened {edge_store.num_rows} edges, {edge_store.num_strings()} strings "
+              f"in {(time.perf_counter() - start) * 1000.0:.3f}ms")
+
+        fact_registry = {
+            "edge": FilterFactStorePredicate(store=edge_store),
+            "entity": FilterFactStorePredicate(path=entity_path),
+        }
+        list_registry = graph.build_predicate_registry()
+
+        hub = graph.most_connected()
+
+        queries = [
+            f"edge('{hub}', ?Type, ?D).",
+            f"edge('{hub}', 'knows', ?D), entity(?D, ?T).",
+            "entity(?X, 'City'), edge(?X, 'located_in', ?Y).",
+            "edge(?X, 'no_such_type', ?Y).",
+        ]
+
+        for kg_query in queries:
+            answers = [dict(a) for a in KGraphInfer(fact_registry).execute(kg_query).get_results()]
+            expected = [dict(a) for a in KGraphInfer(list_registry).execute(kg_query).get_results()]
+            print(f"{kg_query} answers: {len(answers)} same as list data: {answers == expected}")
+
+        # worker processes receive the path and map the same file
+        copy = pickle.loads(pickle.dumps(edge_store))
+        print(f"Unpickled store: {copy.path == edge_path} rows: {copy.num_rows}")
+        copy.close()
+
+        csv_path = os.path.join(temp_dir, "types.csv")
+        with open(csv_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["type", "description", "count"])
+            writer.writerow(["/sports/sports_team", "Sports team", "12"])
+            writer.writerow(["/award/award_ceremony", "Award ceremony", "7"])
+
+        types_path = os.path.join(temp_dir, "types.facts")
+        convert_csv(csv_path, types_path, ["type", "description", "count"], types={"count": int})
+        with FactStore(types_path) as store:
+            print(f"Converted CSV: {store.names} {store.encodings} rows: {store.num_rows}")
+
+        jsonl_path = os.path.join(temp_dir, "output.jsonl")
+        with open(jsonl_path, "w", encoding="utf-8") as f:
+            for record in [
+                {"kind": "entity", "id": "/m/010016", "properties": {
+                    "label": "Denton", "alternatives": ["Denton, Texas"], "wikidata_id": "Q128306"}},
+                {"kind": "entity", "id": "/m/0b76d_m", "properties": {}},
+                {"kind": "relationship", "source": "/m/010016", "destination": "/m/0b76d_m",
+                 "type": "/location/location/contains"},
+            ]:
+                f.write(json.dumps(record) + "\n")
+
+        relation_path = os.path.join(temp_dir, "relations.facts")
+        property_path = os.path.join(temp_dir, "properties.facts")
+        convert_extract_jsonl(jsonl_path, relation_path, property_path)
+
+        registry = {
+            "entity_relation": FilterFactStorePredicate(path=relation_path),
+            "entity_property": FilterFactStorePredicate(path=property_path),
+        }
+        answer_set = KGraphInfer(registry).execute(
+            "entity_property(?E, 'label', 'Denton'), entity_relation(?E, ?Type, ?D).")
+        print(answer_set)
+
+        for predicate in list(registry.values()) + list(fact_registry.values()):
+            predicate.store.close()
+
+
+if __name__ == "__main__":
+    main()
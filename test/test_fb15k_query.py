@@ -1,7 +1,10 @@
+import os
 import csv
 import logging
 from kgraphlang.filter_infer.filter_string_hash_predicate import FilterStringHashPredicate
 from kgraphlang.filter_infer.filter_vector_predicate import FilterVectorPredicate
+from kgraphlang.filter_infer.filter_fact_store_predicate import FilterFactStorePredicate
+from kgraphlang.filter_infer.fact_store import convert_extract_jsonl
 from kgraphlang.kgraph_infer import KGraphInfer
 
 
@@ -53,7 +56,9 @@ def main():
             type_data.append( (type_name, type_description) )
 
 
-    relation_type_vector_predicate = TypePredicate(data=type_data)
+    # the embeddings and index are saved, and only built again when the types change
+    relation_type_vector_predicate = TypePredicate.load_or_build('../test_data/FB15k/fb15k_types.vectors',
+                                                                 data=type_data)
 
     relation_type_string_hash_predicate = TypeStringHash(data=type_data)
 
@@ -81,9 +86,22 @@ def main():
     # currently no other properties in the relations (edges) besides
     # source, destination, and type
 
-    entity_property_predicate = EntityPropertyPredicate(data=[])
+    # the jsonl from extract_data.py is converted once to fact files,
+    # which are memory-mapped at startup instead of being read again
 
-    entity_relation_predicate = EntityRelationPredicate(data=[])
+    jsonl_file = '../test_data/FB15k/output.jsonl'
+    relation_fact_file = '../test_data/FB15k/fb15k_relations.facts'
+    property_fact_file = '../test_data/FB15k/fb15k_properties.facts'
+
+    if os.path.exists(jsonl_file) and not os.path.exists(relation_fact_file):
+        convert_extract_jsonl(jsonl_file, relation_fact_file, property_fact_file)
+
+    if os.path.exists(relation_fact_file):
+        entity_property_predicate = FilterFactStorePredicate(path=property_fact_file)
+        entity_relation_predicate = FilterFactStorePredicate(path=relation_fact_file)
+    else:
+        entity_property_predicate = EntityPropertyPredicate(data=[])
+        entity_relation_predicate = EntityRelationPredicate(data=[])
 
     predicate_registry = {
         "relation_type_vector": relation_type_vector_predicate,
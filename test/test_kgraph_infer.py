@@ -54,6 +54,50 @@ class GetPropertyPredicate(FilterPredicate):
     def __init__(self):
         super().__init__(data=GetPropertyPredicate.data)
 
+class EmailLookupPredicate(FilterPredicate):
+    """
+    get_email with declared binding modes: looking up the email of a bound
+    name ("bf") is cheap, finding the name of a bound email ("fb") scans the
+    data. Calls with neither bound are not supported.
+    """
+
+    def __init__(self):
+        super().__init__(data=GetEmailPredicate.data)
+        self.emails = dict(GetEmailPredicate.data)
+        self.register_mode("bf", cost=1.0, impl=self.lookup_email)
+        self.register_mode("fb", cost=10.0)
+
+    def lookup_email(self, *, input_dict: dict, annotations: list = None) -> list:
+        name = input_dict[0]
+        if name not in self.emails:
+            return []
+        return [{0: name, 1: self.emails[name]}]
+
+class ScorePredicate(FilterPredicate):
+    """
+    A predicate returning the scores of a person, honouring a limit
+    annotation on the number of results of each call.
+    """
+
+    data = [
+            ("Alice", 1), ("Alice", 2),
+            ("Bob", 3), ("Bob", 4),
+            ("Charlie", 5), ("Charlie", 6)
+        ]
+
+    def __init__(self):
+        super().__init__(data=ScorePredicate.data)
+
+    def get_annotation_ids(self) -> list:
+        return ["limit"]
+
+    def eval_impl(self, *, input_dict: dict, annotations: list = None, constraints: list = None) -> list:
+        results = super().eval_impl(input_dict=input_dict, annotations=annotations, constraints=constraints)
+        for name, args in annotations or []:
+            if name == "limit" and args:
+                results = results[:int(args[0])]
+        return results
+
 
 # Registry mapping predicate names (as in the AST) to predicate objects.
 predicate_registry = {
@@ -61,7 +105,9 @@ predicate_registry = {
     "enemy": EnemyPredicate(),
     "frenemy": FrenemyPredicate(),
     "get_email": GetEmailPredicate(),
-    "get_property": GetPropertyPredicate()
+    "get_property": GetPropertyPredicate(),
+    "lookup_email": EmailLookupPredicate(),
+    "score": ScorePredicate()
 
 }
 
@@ -169,5 +215,95 @@ person(?Person),
     for answer in answer_set.get_results():
         print(answer)
 
+    # person(?Person) and get_email(?Person, ?E) are repeated in the aggregates
+    # and the OR branches, each is evaluated once per distinct bound input.
+    # ?People does not depend on ?X and is computed once, ?Age is computed
+    # with a single group-by pass over get_property for all values of ?X
+
+    kg_query = """
+    person(?X),
+    ?People = collection { ?Person | person(?Person) },
+    ?Age = sum { ?V | get_property(?X, 'age', ?V) },
+    ?Emails = set { ?E | person(?Person), get_email(?Person, ?E) },
+    (
+        ( get_email(?X, ?E), ?E != 'bob@example.com' );
+        ( get_email(?X, ?E), ?X = 'Bob' )
+    ).
+"""
+
+    answer_set = infer.execute(kg_query)
+
+    print(answer_set)
+
+    print(f"Stats: {answer_set.get_stats()}")
+
+    # the limit applies to each call of score(?X, ?V), so the body of the
+    # aggregate is evaluated once per ?X instead of with a group-by pass:
+    # ?S is 1, 3 and 5
+
+    kg_query = """
+    person(?X),
+    ?S = sum { ?V | @limit('1') score(?X, ?V) }.
+"""
+
+    answer_set = infer.execute(kg_query)
+
+    print(answer_set)
+
+    print(f"Stats: {answer_set.get_stats()}")
+
+    # ?V > 30 and ?V < 50 are passed to get_property as range constraints
+    # on ?V, and still checked by the comparisons
+
+    kg_query = """
+    get_property(?X, 'age', ?V),
+    ?V > 30,
+    ?V < 50.
+"""
+
+    answer_set = infer.execute(kg_query)
+
+    print(answer_set)
+
+    print(f"Stats: {answer_set.get_stats()}")
+
+    # lookup_email(?X, ?M) can not be called with ?X and ?M free, so it is
+    # evaluated after person(?X) binds ?X, in its cheap "bf" mode
+
+    kg_query = """
+    lookup_email(?X, ?M),
+    ?M != 'bob@example.com',
+    person(?X).
+"""
+
+    answer_set = infer.execute(kg_query)
+
+    print(answer_set)
+
+    # ?M > 3 is not passed to lookup_email, whose "bf" mode has its own
+    # implementation; comparing an email to a number is an error
+
+    kg_query = """
+    lookup_email('Alice', ?M),
+    ?M > 3.
+"""
+
+    try:
+        infer.execute(kg_query)
+    except ValueError as e:
+        print(f"Error: {e}")
+
+    # no order of the conjuncts binds either argument
+
+    kg_query = """
+    lookup_email(?X, ?M),
+    ?X != 'Bob'.
+"""
+
+    try:
+        infer.execute(kg_query)
+    except ValueError as e:
+        print(f"Error: {e}")
+
 if __name__ == "__main__":
     main()
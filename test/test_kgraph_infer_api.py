@@ -0,0 +1,115 @@
+import threading
+from kgraphlang.kgraph_infer import KGraphInfer
+from test_kgraph_infer import predicate_registry
+
+
+def main():
+    print("Test KGraph Infer API")
+
+    infer = KGraphInfer(predicate_registry)
+
+    # a burst of related queries, as sent for one LLM turn
+    # the person() scan and get_email() lookups are made once for the batch
+
+    kg_queries = [
+        "person(?X), get_email(?X, ?M).",
+        "person(?X), not(enemy(?X)), get_email(?X, ?M).",
+        "person(?X), get_property(?X, 'age', ?Age), ?Age > 30, get_email(?X, ?M).",
+        "?People = collection { ?Person | person(?Person) }.",
+    ]
+
+    answer_sets = infer.execute_many(kg_queries)
+
+    for kg_query, answer_set in zip(kg_queries, answer_sets):
+        print(f"Query: {kg_query}")
+        print(answer_set)
+
+    print(f"Batch stats: {answer_sets[0].get_stats()}")
+
+    # a query template parsed and planned once, run with different constants
+
+    prepared = infer.prepare("""
+    ?X in $names,
+    person(?X),
+    get_property(?X, $property, ?Value),
+    ?Value > $min_value,
+    get_email(?X, ?M).
+    """)
+
+    print(f"Prepared: {prepared}")
+    print(f"Parameters: {prepared.get_param_names()}")
+
+    for params in [
+        {"property": "age", "min_value": 30, "names": ["Alice", "Bob", "Charlie"]},
+        {"property": "age", "min_value": 20, "names": ["Alice"]},
+        {"property": "height", "min_value": 0, "names": []},
+    ]:
+        answer_set = prepared.run(params)
+        print(f"Params: {params}")
+        print(answer_set)
+
+    try:
+        prepared.run({"property": "age"})
+    except ValueError as e:
+        print("Error:", e)
+
+    # placeholders are only bound by a prepared query
+
+    for run in (lambda: infer.execute("?X = $name."), lambda: list(infer.iter_answers("?X = $name."))):
+        try:
+            run()
+        except ValueError as e:
+            print("Error:", e)
+
+    # compact answer set exports
+
+    answer_set = infer.execute("person(?X), get_email(?X, ?M), get_property(?X, 'age', ?Age).")
+
+    print(f"Variables: {answer_set.get_variables()}")
+    print(f"First answer: {answer_set.get_results()[0]}")
+    print(f"Columnar JSON: {answer_set.to_columnar_json()}")
+    print(f"NDJSON:\n{answer_set.to_ndjson()}")
+    print(f"KGraphLang: {answer_set.to_kgraph_literal(infer.parser)}")
+
+    # the literal is parsed again into the same answers, quotes and all
+
+    answer_set = infer.execute("""
+    ( ?X = "O'Brien", ?Note = 'said "hi"', ?Score = 0.00001 );
+    ( ?X = 'Bob', ?Note = \"\"\"two
+    lines\"\"\", ?Score = 2 ).
+    """)
+
+    literal = answer_set.to_kgraph_literal(infer.parser)
+    print(f"KGraphLang: {literal}")
+    print(f"Same answers: {list(infer.execute(literal).get_results()) == list(answer_set.get_results())}")
+
+    try:
+        infer.parser.value_to_ast(None)
+    except ValueError as e:
+        print("Error:", e)
+
+    # answers are yielded as they are found
+
+    kg_query = "person(?X), person(?Y), ?X != ?Y, get_email(?X, ?M)."
+
+    for answer in infer.iter_answers(kg_query):
+        print(f"Streamed: {answer}")
+
+    # the same answers when only the outputs of the last two predicate calls are kept
+
+    infer.predicate_call_cache_size = 2
+    print(f"Same answers with a small call cache: "
+          f"{list(infer.iter_answers(kg_query)) == list(KGraphInfer(predicate_registry).iter_answers(kg_query))}")
+    infer.predicate_call_cache_size = KGraphInfer.predicate_call_cache_size
+
+    # stop after the first answer, as when the consumer has seen enough
+
+    cancel_event = threading.Event()
+
+    for answer in infer.iter_answers(kg_query, cancel_event=cancel_event):
+        print(f"Streamed before cancel: {answer}")
+        cancel_event.set()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from kgraphlang.parser.kgraph_infer_parser import KGraphInferParser, KGraphTransformer
+from kgraphlang.parser.kgraph_ast import from_tuple
 from lark import Tree, Token
 
 def main():
@@ -185,6 +186,9 @@ you?
         
             }.""",
 
+        # query parameters, bound when a prepared query is run
+        "get_property(?X, $property, ?Value), ?Value > $min_value, ?X in $names, ?m = [ $key = $value ].",
+
 
     ]
 
@@ -400,6 +404,68 @@ you?
     print("Unparsed DSL:")
     print(dsl_str)
 
+    # incremental parsing of a query as it is streamed by the LLM
+    # completed top-level conjuncts are available before the query ends
+
+    streamed_query = """
+    person(?X), // everyone
+    get_property(?X, 'birth_date', ?Born), ?Born < '1990-01-01'^Date,
+    ?Friends = count{ ?F | friend(?X, ?F) }, ?Friends > 2.
+    """
+
+    incremental = parser.incremental_parse()
+
+    for i in range(0, len(streamed_query), 6):
+        chunk = streamed_query[i:i + 6]
+        for conjunct in incremental.feed(chunk):
+            print(f"Completed conjunct after {i + len(chunk)} chars: {parser.infer_unparse(conjunct)}")
+
+    ast = incremental.close()
+    print("Streamed AST:", ast)
+    print("Same as infer_parse:", ast == parser.infer_parse(streamed_query))
+
+    # a syntax error is raised as soon as no continuation could be valid
+
+    bad_query = "person(?X)) , get_email(?X, ?M), get_property(?X, 'age', ?Age)."
+
+    incremental = parser.incremental_parse()
+
+    try:
+        for i in range(0, len(bad_query), 6):
+            incremental.feed(bad_query[i:i + 6])
+        incremental.close()
+    except Exception as e:
+        print(f"Error after {i + 6} of {len(bad_query)} chars:", e)
+
+    # AST nodes carry their analysis, and export the tagged tuple form
+
+    ast = parser.infer_parse("person(?X), ?Total = sum{ ?V | get_property(?X, 'score', ?V) }, ?Total > $min.")
+
+    print("Free variables:", sorted(ast.free_vars))
+    print("Bound variables:", sorted(ast.bound_vars))
+    print("Parameters:", sorted(ast.params))
+    print("Tuple form:", ast.to_tuple())
+    print("Same as parsed from tuple form:", from_tuple(ast.to_tuple()) == ast)
+    print("Constant list:", parser.infer_parse("?L = [1, 2, [3, 4]].").right.constant)
+
+    # queries that differ only in variable names, comments, grouping and the
+    # order of independent conjuncts have the same canonical form and fingerprint
+
+    variants = [
+        "person(?X), get_email(?X, ?M), friend(?Y, ?Z).",
+        """
+        // friends first
+        friend(?A, ?B), (person(?P), get_email(?P, ?Email)).
+        """,
+        # get_email before person binds ?X in a different order, this is a different query
+        "get_email(?X, ?M), person(?X), friend(?Y, ?Z).",
+    ]
+
+    for variant in variants:
+        canonical, var_map = parser.canonicalize(parser.infer_parse(variant))
+        print("Canonical:", parser.infer_unparse(canonical), var_map)
+        print("Fingerprint:", parser.fingerprint(variant))
+
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,102 @@
+import os
+import time
+import random
+import tempfile
+from datasketch import MinHashLSH
+from kgraphlang.filter_infer.filter_string_hash_predicate import (
+    FilterStringHashPredicate, find_closest_strings, get_minhash, MINHASH_NUM_PERM, LSH_THRESHOLD)
+from kgraphlang.filter_infer.filter_ngram_predicate import FilterNGramPredicate
+from kgraphlang.kgraph_infer import KGraphInfer
+from synthetic_kgraph import FIRST_NAMES
+
+
+class NameStringHash(FilterStringHashPredicate):
+    pass
+
+
+def synthetic_names(count: int, seed: int = 42) -> list:
+    rng = random.Random(seed)
+    places = ["Springfield", "Middletown", "Princeton", "Denton", "Riverside", "Fairview"]
+    return [(f"n{i}", f"{rng.choice(FIRST_NAMES)} {rng.choice(places)} {rng.randint(1, 999)}")
+            for i in range(count)]
+
+
+def main():
+    print("Test String Hash")
+
+    data = synthetic_names(20000)
+
+    start = time.perf_counter()
+    predicate = NameStringHash(data=data)
+    print(f"Built index of {len(data)} names in {time.perf_counter() - start:.2f}s")
+
+    start = time.perf_counter()
+    parallel_predicate = NameStringHash(data=data, workers=2)
+    print(f"Built index with 2 workers in {time.perf_counter() - start:.2f}s")
+
+    # the index inserted one MinHash at a time, as before
+    reference_index = MinHashLSH(threshold=LSH_THRESHOLD, num_perm=MINHASH_NUM_PERM)
+    for id, name in data[:2000]:
+        reference_index.insert(str(id), get_minhash(name))
+    small_predicate = NameStringHash(data=data[:2000])
+
+    queries = ["Alice Denton", "Fred Princeton 12", "Grace"]
+
+    for query in queries:
+        expected = find_closest_strings(query, reference_index, small_predicate.ids_to_names)
+        found = find_closest_strings(query, small_predicate.lsh_index, small_predicate.ids_to_names)
+        print(f"'{query}' same as one at a time: {found == expected}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "names.lsh")
+        predicate.save(path)
+
+        start = time.perf_counter()
+        loaded = NameStringHash.load(path)
+        print(f"Loaded index of {len(loaded.ids_to_names)} names in {time.perf_counter() - start:.2f}s")
+
+        for query in queries:
+            results = [find_closest_strings(query, p.lsh_index, p.ids_to_names)
+                       for p in (predicate, parallel_predicate, loaded)]
+            print(f"'{query}' parallel and loaded same: {results[0] == results[1] == results[2]}")
+
+        # a save that fails partway leaves the previous file, a truncated one is rejected
+        loaded.ids_to_names["n0"] = lambda: None
+        try:
+            loaded.save(path)
+        except Exception as e:
+            print(f"Save failed: {type(e).__name__}, files: {os.listdir(temp_dir)}")
+        loaded = NameStringHash.load(path)
+        print(f"Previous file loaded: {len(loaded.ids_to_names)} names")
+        truncated_path = os.path.join(temp_dir, "truncated.lsh")
+        with open(path, "rb") as f, open(truncated_path, "wb") as t:
+            t.write(f.read(1000))
+        try:
+            NameStringHash.load(truncated_path)
+        except ValueError as e:
+            print(f"Truncated file: {type(e).__name__}")
+
+        infer = KGraphInfer({"name_match": loaded})
+        answer_set = infer.execute("@top_k('3') name_match('Alice Denton', ?Id, ?Score).")
+        print(answer_set)
+
+    # strings are added, replaced and deleted in place
+    predicate.upsert([("n0", "Zebulon Quartz"), ("z1", "Zebulon Quarry")])
+    print(find_closest_strings("Zebulon Quartz", predicate.lsh_index, predicate.ids_to_names, top_k=3))
+    print(predicate.delete(["n0", "unknown"]))
+    print(find_closest_strings("Zebulon Quartz", predicate.lsh_index, predicate.ids_to_names, top_k=3))
+
+    # the n-gram backend has the same interface
+    infer = KGraphInfer({"name_match": FilterNGramPredicate(data=data)})
+    answer_set = infer.execute("@top_k('3') @min_score('90') name_match('Alice Denton', ?Id, ?Score).")
+    print(answer_set)
+
+    # a bound id is scored without a search, the same as when it is found
+    best = answer_set.get_results()[0]
+    answer_set = infer.execute(f"name_match('Alice Denton', '{best['?Id']}', ?Score).")
+    print(f"Same score: {answer_set.get_results()[0]['?Score'] == best['?Score']}")
+    print(infer.execute("name_match('Alice Denton', 'unknown', ?Score)."))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,191 @@
+import os
+import time
+import threading
+import tempfile
+import numpy as np
+from kgraphlang.filter_infer.filter_vector_predicate import FilterVectorPredicate
+from kgraphlang.filter_infer.filter_predicate import FilterPredicate
+from kgraphlang.kgraph_infer import KGraphInfer
+
+
+class TypeVector(FilterVectorPredicate):
+    pass
+
+
+class TopicPredicate(FilterPredicate):
+    pass
+
+
+TYPE_DATA = [
+    ("urn:sports_team", "A sports team that competes in a league"),
+    ("urn:athlete", "A person who competes in sports"),
+    ("urn:film", "A motion picture or movie"),
+    ("urn:actor", "A person who acts in films or plays"),
+    ("urn:city", "A large town where people live and work"),
+    ("urn:river", "A natural stream of water flowing to the sea"),
+    ("urn:musician", "A person who plays or composes music"),
+    ("urn:album", "A collection of recorded music tracks"),
+]
+
+TOPIC_DATA = [
+    ("t1", "Sports"),
+    ("t2", "Movies"),
+    ("t3", "  Sports "),
+    ("t4", "Music"),
+    ("t5", "Geography"),
+    ("t6", "Movies"),
+]
+
+
+def main():
+    print("Test Vector Predicate")
+
+    predicate = TypeVector(data=TYPE_DATA, embedding_cache_size=3)
+    infer = KGraphInfer({"type_vector": predicate, "topic": TopicPredicate(data=TOPIC_DATA)})
+
+    query = "topic(?T, ?Text), type_vector(?Text, ?Type, ?Score)."
+
+    start = time.perf_counter()
+    batched = infer.execute(query)
+    print(f"Batched in {(time.perf_counter() - start) * 1000.0:.1f}ms: {batched.get_stats()}")
+    # 'Sports' and '  Sports ' are embedded once, after normalizing
+    print(f"Embedding cache: {predicate.get_embedding_cache_stats()}")
+
+    # the same answers one call at a time
+    predicate.clear_embedding_cache()
+    predicate.accepts_batches = lambda: False
+    start = time.perf_counter()
+    single = infer.execute(query)
+    print(f"One at a time in {(time.perf_counter() - start) * 1000.0:.1f}ms: {single.get_stats()}")
+    print(f"Same answers: {sorted(map(str, batched.get_results())) == sorted(map(str, single.get_results()))}")
+    print(f"Embedding cache: {predicate.get_embedding_cache_stats()}")
+
+    # queries share the cache from several threads
+    errors = []
+
+    def embed_topics(offset: int):
+        try:
+            for i in range(200):
+                predicate.embed_queries([TOPIC_DATA[(offset + i) % len(TOPIC_DATA)][1], f"topic {i % 7}"])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=embed_topics, args=(offset,)) for offset in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print(f"Concurrent embedding errors: {errors}, cache: {predicate.get_embedding_cache_stats()['size']}")
+
+    infer = KGraphInfer({"type_vector": predicate})
+
+    # top_k sets how many are searched for, max_score drops the farther ones
+    print(infer.execute("@top_k('3') type_vector('A hockey team', ?Type, ?Score)."))
+    print(infer.execute("@top_k('8') @max_score('0.5') type_vector('A hockey team', ?Type, ?Score)."))
+
+    # a bound match id is scored without a search
+    print(infer.execute("type_vector('A hockey team', 'urn:athlete', ?Score)."))
+
+    # the candidates annotation restricts the search to a list of match ids
+    print(infer.execute("@top_k('1') @candidates(['urn:film', 'urn:city', 'urn:athlete']) "
+                        "type_vector('A hockey team', ?Type, ?Score)."))
+    print(infer.execute("?Type in ['urn:film', 'urn:city', 'urn:athlete'], type_vector('A hockey team', ?Type, ?Score)."))
+
+    # the answers could not tell which id of a bound list matched
+    try:
+        infer.execute("type_vector('A hockey team', ['urn:film', 'urn:athlete'], ?Score).")
+    except ValueError as e:
+        print(f"Error: {e}")
+
+    # the same answers from each backend, over the same vectors, up to the order of ties
+    for backend in ("hnsw", "exact", "int8"):
+        other = TypeVector(data=TYPE_DATA, vectors=predicate.vectors, backend=backend)
+        answers = KGraphInfer({"type_vector": other}).execute("@top_k('3') type_vector('A hockey team', ?Type, ?Score).")
+        print(f"{backend}: {answers}")
+
+    # vectors are added, replaced and deleted in place
+    updated = TypeVector(data=TYPE_DATA)
+    updated.upsert([("urn:hockey_team", "A team that plays ice hockey"),
+                    ("urn:film", "A river delta")])
+    print(updated.delete(["urn:sports_team", "urn:unknown"]))
+    infer = KGraphInfer({"type_vector": updated})
+    print(infer.execute("@top_k('3') type_vector('A hockey team', ?Type, ?Score)."))
+    updated.compact(wait=True)
+    print(f"Compacted to {len(updated.ids)} vectors")
+    print(infer.execute("@top_k('3') type_vector('A hockey team', ?Type, ?Score)."))
+
+    # an id repeated in the data has a vector for each row, all replaced or deleted
+    for backend in ("hnsw", "exact", "int8"):
+        repeated = TypeVector(data=[("a", "x"), ("a", "z"), ("b", "y")], backend=backend)
+        infer = KGraphInfer({"type_vector": repeated})
+        before = len(list(infer.execute("type_vector('x', 'a', ?Score).").get_results()))
+        repeated.upsert([("a", "w")])
+        replaced = [dict(a) for a in infer.execute("@top_k('5') type_vector('x', ?Id, ?Score).").get_results()]
+        print(f"{backend}: 'a' scored {before} times, replaced: {repeated.data}, "
+              f"searched ids: {sorted(a['?Id'] for a in replaced)}")
+        deleted = repeated.delete(["a"])
+        found = [dict(a)["?Id"] for a in infer.execute("@top_k('5') type_vector('x', ?Id, ?Score).").get_results()]
+        print(f"{backend}: deleted {deleted}, data: {repeated.data}, searched ids: {found}")
+
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = os.path.join(temp_dir, "types")
+        predicate.save(path)
+
+        start = time.perf_counter()
+        loaded = TypeVector.load_or_build(path, data=TYPE_DATA)
+        print(f"Loaded index of {len(loaded.ids)} vectors in {(time.perf_counter() - start) * 1000.0:.1f}ms, "
+              f"memory-mapped: {isinstance(loaded.vectors.base, np.memmap)}")
+
+        # built from the saved vectors, without embedding the descriptions
+        rebuilt = TypeVector(data=TYPE_DATA, vectors=loaded.vectors)
+
+        for p in (loaded, rebuilt):
+            infer = KGraphInfer({"type_vector": p, "topic": TopicPredicate(data=TOPIC_DATA)})
+            answers = infer.execute(query)
+            print(f"Same answers: {sorted(map(str, batched.get_results())) == sorted(map(str, answers.get_results()))}")
+
+        # a loaded predicate is saved back to the directory it maps
+        loaded.delete(["urn:album"])
+        loaded.save(path)
+        reloaded = TypeVector.load(path)
+        print(f"Saved over its own directory: {len(reloaded.data)} vectors, "
+              f"same embeddings: {np.array_equal(reloaded.vectors, predicate.vectors)}")
+
+        # upserted vectors are kept apart, the loaded ones stay memory-mapped, also when compacted
+        loaded = TypeVector.load(path)
+        loaded.upsert([("urn:hockey_team", "A team that plays ice hockey")])
+        print(f"Upserted: memory-mapped: {isinstance(loaded.vectors.base, np.memmap)}, "
+              f"appended: {len(loaded.vectors.tail)}")
+        loaded.delete(["urn:sports_team", "urn:athlete"])
+        loaded.compact(wait=True)
+        print(f"Compacted to {len(loaded.vectors)} vectors, memory-mapped: {isinstance(loaded.vectors.base, np.memmap)}, "
+              f"same embeddings: {np.array_equal(loaded.vectors[:5], predicate.vectors[2:7])}")
+        print(KGraphInfer({"type_vector": loaded}).execute("@top_k('3') type_vector('A hockey team', ?Type, ?Score)."))
+
+        # the int8 codes are memory-mapped too
+        int8_path = os.path.join(temp_dir, "types_int8")
+        TypeVector(data=TYPE_DATA, vectors=predicate.vectors, backend="int8").save(int8_path)
+        loaded = TypeVector.load(int8_path)
+        loaded.delete(["urn:album"])
+        loaded.save(int8_path)
+        reloaded = TypeVector.load(int8_path)
+        print(f"Saved int8 index over its own directory: {len(reloaded.data)} vectors, "
+              f"same codes: {np.array_equal(reloaded.index.codes, loaded.index.codes)}")
+
+        # loaded with "auto", the index is compacted with the backend it was saved with
+        reloaded.delete(["urn:sports_team", "urn:athlete"])
+        reloaded.compact(wait=True)
+        print(f"Compacted loaded int8 index to {len(reloaded.data)} vectors, backend: {reloaded.index.name}")
+
+        # changed data is not loaded, the index is built again
+        changed_data = TYPE_DATA[:-1] + [("urn:album", "A record album")]
+        try:
+            TypeVector.load(path, data=changed_data)
+        except ValueError as e:
+            print(f"Changed data: {e}")
+        changed = TypeVector.load_or_build(path, data=changed_data)
+        print(f"Rebuilt for changed data: {changed.corpus_hash == TypeVector.load(path).corpus_hash}")
+
+
+if __name__ == "__main__":
+    main()